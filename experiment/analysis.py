@@ -16,7 +16,6 @@ from __future__ import division, print_function
 
 import sys
 import collections
-import itertools as it
 import os
 import numpy as np
 import yaml
@@ -71,26 +70,107 @@ def frequencies_in_file(filename, skiprows=3, updates=[1000, 10000, 100000]):
     ...     f.write('000\n010\n000\n100')
     >>> frequencies_in_file('testfile.tmp', 0, [1,3,5])
     {1: {'000': 1}, 3: {'010': 1, '000': 1}, 4: {'100': 1}}
+    >>> with open('testfile.tmp', 'w') as f:
+    ...     f.write(('01' * 40 + '\n') * 3)
+    >>> frequencies_in_file('testfile.tmp', 0, [5])[3] == {'01' * 40: 3}
+    True
     """
-    output = []
-    dupdates = [updates[0]] + [u1 - u2 for u1, u2
-                                    in zip(updates[1:], updates[:-1])]
+    n_neurons, nupdates, counted = count_states_in_file(filename, skiprows,
+                                                        updates)
+    if n_neurons > 64:
+        key = str
+    else:
+        key = lambda state: misc.statestring_from_int(int(state), n_neurons)
+    return {n: {key(state): int(count)
+                for state, count in zip(states, counts)}
+            for n, (states, counts) in zip(nupdates, counted)}
+
+
+def count_states_in_file(filename, skiprows=3,
+                         updates=[1000, 10000, 100000], cumulative=False,
+                         chunksize=2**24):
+    r"""Return the number of neurons, the update numbers and for each of
+            them the distinct states (codes of misc.pack_states) and their
+            counts in the BinaryState output filename.
+
+    Input:
+        filename    string  filename of the file to analyse
+        skiprows    int     number of rows at the begining of the file to skip
+        updates     list    list of ints of update numbers (lines) after which
+                                the counts should be produced
+        cumulative  bool    if True count from the first line, otherwise
+                                since the previous update number
+        chunksize   int     number of bytes read at once
+    Output:
+        n_neurons   int     length of the states
+        nupdates    list    the update numbers, those beyond the end of the
+                                file are merged into the number of lines
+        counted     list    list of (states, counts) arrays
+
+    Other lines (e.g. summaries) count as updates but not as states. States
+    of more than 64 neurons are byte strings instead of codes.
 
-    with open(filename, 'r') as f:
+    >>> with open('testfile.tmp', 'w') as f:
+    ...     f.write('000\n010\n000\nTimestep: 3\n100\n')
+    >>> n, nupdates, counted = count_states_in_file('testfile.tmp', 0,
+    ...                                             [2, 4, 8], True, 6)
+    >>> n, nupdates
+    (3, [2, 4, 5])
+    >>> counted[-1]
+    (array([0, 2, 4], dtype=uint64), array([2, 1, 1]))
+    """
+    counted = [None] * len(updates)
+    n_neurons = None
+    nlines = 0
+    rest = b''
+    with open(filename, 'rb') as f:
         for _ in xrange(skiprows):
             f.readline()
-        for nu in dupdates:
-            lines_gen = it.islice(f, nu)
-            output.append(collections.Counter(l.strip() for l in lines_gen))
-
-    used_line_number = sum(sum(o.values()) for o in output)
-    for i, o in enumerate(output):
-        if len(o) == 0:
-            updates[i - 1]  = used_line_number
-            output[i]       = output[i - 1]
-    updates[-1] = used_line_number
-    out = {n: dict(o) for n, o in zip(updates, output)}
-    return out
+        while nlines < updates[-1]:
+            chunk = f.read(chunksize)
+            data = rest + chunk
+            if not chunk:
+                if not data:
+                    break
+                data, rest = data.rstrip(b'\n') + b'\n', b''
+            else:
+                # complete lines only, the rest is read with the next chunk
+                cut = data.rfind(b'\n') + 1
+                data, rest = data[:cut], data[cut:]
+                if not data:
+                    continue
+            if n_neurons is None:
+                n_neurons = len(data[:data.index(b'\n')].strip())
+                states_from_bytes = (misc.states_from_bytes
+                                     if n_neurons <= 64
+                                     else misc.state_lines_from_bytes)
+            codes, isstate = states_from_bytes(data, n_neurons)
+            codes = codes[:updates[-1] - nlines]
+            isstate = isstate[:updates[-1] - nlines]
+            # the lines of this chunk up to each of the updates
+            ends = np.clip(np.asarray(updates) - nlines, 0, len(codes))
+            for i, (begin, end) in enumerate(zip(np.r_[0, ends[:-1]], ends)):
+                if begin < end:
+                    counted[i] = misc.count_states(
+                                    codes[begin:end][isstate[begin:end]],
+                                    n_neurons, counted[i])
+            nlines += len(codes)
+            if not chunk:
+                break
+
+    empty = (np.zeros(0, dtype=np.uint64 if (n_neurons or 0) <= 64
+                      else 'S{}'.format(n_neurons)),
+             np.zeros(0, dtype=np.intp))
+    counted = [c or empty for c in counted]
+    if cumulative:
+        for i in range(1, len(counted)):
+            counted[i] = misc.merge_counts(counted[i - 1], counted[i])
+    # updates beyond the end of the file end with its last line
+    nsegments = max(1, sum(1 for lower in [0] + list(updates[:-1])
+                           if lower < nlines))
+    nupdates = list(updates[:nsegments])
+    nupdates[-1] = min(nupdates[-1], nlines)
+    return n_neurons or 0, nupdates, counted[:nsegments]
 
 
 def write_timeaverage(folder, outputtype='mean', skip_header=3,
@@ -170,10 +250,12 @@ def timeaverage_activity(filename, outputtype='mean', skip_header=3,
 
 
 def write_dkl_development(folder, skiprows=3,
-                            updates=[int(n) for n in np.logspace(3, 8, 11)]):
+                            updates=[int(n) for n in np.logspace(3, 8, 11)],
+                            nprocesses=1):
     try:
         outfilename = os.path.join(folder, 'output')
-        dkl_dict = dkl_development(outfilename, skiprows, updates)
+        dkl_dict = dkl_development(outfilename, skiprows, updates,
+                                   nprocesses)
 
         with open(os.path.join(folder, 'analysis_output'), 'w') as f:
             yaml.dump(dkl_dict, f)
@@ -185,21 +267,16 @@ def write_dkl_development(folder, skiprows=3,
 
 
 def dkl_development(filename, skiprows=3,
-                            updates=[int(n) for n in np.logspace(3, 8, 11)]):
-    freq_dicts = frequencies_in_file(filename,
-                            skiprows=skiprows, updates=updates)
+                            updates=[int(n) for n in np.logspace(3, 8, 11)],
+                            nprocesses=1):
+    """Return the DKL of the sampled distribution in filename from the
+            Boltzmann distribution of the network after each of updates.
 
-    frequencies = []
-    nupdates = []
-    for k in sorted(freq_dicts.keys()):
-        frequencies.append(collections.Counter(freq_dicts[k]))
-        nupdates.append(k)
-    for i in range(len(frequencies) - 1):
-        frequencies[i + 1] += frequencies[i]
-
-    n = len(frequencies[0].keys()[0])
-    keys = [misc.get_statestring(z, n) for z in it.product([0, 1], repeat=n)]
-    frequencies = [[f[k] for k in keys] for f in frequencies]
+    The partition function is computed in nprocesses processes, only the
+    sampled states are evaluated with it.
+    """
+    n, nupdates, counted = count_states_in_file(filename, skiprows, updates,
+                                                cumulative=True)
     folder = os.path.dirname(filename)
     runfilename = os.path.join(folder, 'run.yaml')
     try:
@@ -213,9 +290,14 @@ def dkl_development(filename, skiprows=3,
             raise e
 
     W, b = config.get_weights_biases_from_configfile(runfilename)
-    ptheo = misc.probabilities_from_energies(misc.energies_for_network(W, b))
-
-    dkls = [float(misc.calculate_dkl(ptheo, fsamp)) for fsamp in frequencies]
+    log_z = misc.log_partition_function(W, b, nprocesses)
+    # the last cumulative counts hold all sampled states, sorted
+    sampled = counted[-1][0]
+    log_psampled = misc.log_probabilities_of_states(W, b, sampled, log_z)
+
+    dkls = [float(misc.dkl_from_counts(
+                    log_psampled, (np.searchsorted(sampled, states), counts)))
+            for states, counts in counted]
     return {'nupdates': nupdates, 'dkls': dkls}
 
 
@@ -0,0 +1,135 @@
+"""This module provides the binary network files read by the neuralsampler.
+
+Instead of listing weights, biases and the initial state in run.yaml, expand
+writes them as binary array files, which the binary memory maps (see
+weightFile, biasFile and initialstateFile in src/main.cpp). Each file starts
+with a 24 byte header: the magic string NSBIN001, the array type and the
+number of entries (both int64), followed by the raw little endian entries
+    type 0  float64                     biases
+    type 1  int64                       initial states
+    type 2  (int64, int64, float64)     weight triples (i, j, w)
+"""
+from __future__ import division, print_function
+
+import os
+import numpy as np
+
+MAGIC = b'NSBIN001'
+FLOAT64, INT64, WEIGHTS = 0, 1, 2
+dtypes = {
+    FLOAT64: np.dtype('<f8'),
+    INT64: np.dtype('<i8'),
+    WEIGHTS: np.dtype([('i', '<i8'), ('j', '<i8'), ('w', '<f8')]),
+}
+HEADERSIZE = 24
+
+
+def write_array(filename, array, arraytype):
+    """Write array of arraytype to filename in the binary array format."""
+    array = np.ascontiguousarray(array, dtype=dtypes[arraytype])
+    with open(filename, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.array([arraytype, len(array)], dtype='<i8').tobytes())
+        array.tofile(f)
+
+
+def read_array(filename):
+    """Return a read only memory map of the array stored in filename.
+
+    >>> write_array('testfile.tmp', [1., 2.5], FLOAT64)
+    >>> read_array('testfile.tmp').tolist()
+    [1.0, 2.5]
+    """
+    with open(filename, 'rb') as f:
+        header = f.read(HEADERSIZE)
+    if len(header) != HEADERSIZE or header[:8] != MAGIC:
+        raise ValueError("{} is not a binary array file".format(filename))
+    arraytype, nentries = np.frombuffer(header[8:], dtype='<i8')
+    if nentries == 0:
+        return np.zeros(0, dtype=dtypes[arraytype])
+    return np.memmap(filename, dtype=dtypes[int(arraytype)], mode='r',
+                     offset=HEADERSIZE, shape=(int(nentries),))
+
+
+def is_sparse(weights):
+    """Return True if weights is a list or array (see weight_triples) of
+            [i, j, w] triples, False for a dense weight matrix.
+
+    >>> is_sparse([[np.int64(0), 1, .5]]), is_sparse([[0., .5], [.5, 0.]])
+    (True, False)
+    >>> is_sparse(weight_triples([[0, 1, .5]]))
+    True
+    """
+    if isinstance(weights, np.ndarray) and weights.dtype.names:
+        return True
+    return (len(weights) > 0 and len(weights[0]) == 3 and
+            all(isinstance(x, (int, long, np.integer))
+                for x in weights[0][:2]))
+
+
+def weight_triples(weights):
+    """Return the weights as array of (i, j, w) triples.
+
+    Input:
+        weights     list    list of [i, j, w] triples or dense weight matrix
+
+    >>> weight_triples([[0, 1, .5], [1, 0, .5]]).tolist()
+    [(0, 1, 0.5), (1, 0, 0.5)]
+    >>> weight_triples([[0., .5], [.5, 0.]]).tolist()
+    [(0, 1, 0.5), (1, 0, 0.5)]
+    """
+    if isinstance(weights, np.ndarray) and weights.dtype.names:
+        return weights.astype(dtypes[WEIGHTS])
+    if is_sparse(weights):
+        ids = np.array([w[:2] for w in weights], dtype=np.int64)
+        values = np.array([w[2] for w in weights], dtype=float)
+    else:
+        dense = np.asarray(weights, dtype=float)
+        ids = np.transpose(np.nonzero(dense))
+        values = dense[dense != 0.]
+    triples = np.empty(len(values), dtype=dtypes[WEIGHTS])
+    if len(values):
+        triples['i'] = ids[:, 0]
+        triples['j'] = ids[:, 1]
+        triples['w'] = values
+    return triples
+
+
+def weight_lists(weights):
+    """Return the weights as plain lists, [i, j, w] triples or the rows of the
+            dense matrix, as listed in run.yaml.
+
+    >>> weight_lists(weight_triples([[0, 1, .5]]))
+    [[0, 1, 0.5]]
+    >>> weight_lists(np.eye(2))
+    [[1.0, 0.0], [0.0, 1.0]]
+    """
+    if is_sparse(weights):
+        return [list(w) for w in weight_triples(weights).tolist()]
+    return np.asarray(weights, dtype=float).tolist()
+
+
+def write_network(folder, weights, bias, initialstate):
+    """Write the network files into folder and return the run.yaml entries
+            pointing to them.
+
+    >>> files = write_network('.', [[0, 1, .5]], [1., 2.], [0, 3])
+    >>> sorted(files)
+    ['biasFile', 'initialstateFile', 'weightFile']
+    >>> read_array(files['initialstateFile']).tolist()
+    [0, 3]
+    >>> for f in files.values():
+    ...     os.remove(f)
+    """
+    files = {'weightFile': os.path.join(folder, 'weight.bin'),
+             'biasFile': os.path.join(folder, 'bias.bin'),
+             'initialstateFile': os.path.join(folder, 'initialstate.bin')}
+    write_array(files['weightFile'], weight_triples(weights), WEIGHTS)
+    write_array(files['biasFile'], bias, FLOAT64)
+    write_array(files['initialstateFile'], initialstate, INT64)
+    return files
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
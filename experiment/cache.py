@@ -0,0 +1,233 @@
+"""This module provides a content-addressed on-disk cache of created networks.
+
+Networks are identified by a hash of the create function identifier, its
+parameters, the source of its module and the content of the files the
+parameters name, such that editing either creates the network anew.
+Weights, biases and initial states are stored as binary arrays in one file
+per network, such that all jobs on a node sharing the cache folder reuse
+them instead of regenerating them. The cache is bounded in size, the
+least recently used networks are evicted first.
+
+The cache folder defaults to ~/.networkcache and can be set with the
+environment variable NETWORK_CACHE, its maximal size in bytes with
+NETWORK_CACHE_SIZE (0 disables the cache). Hits and misses are counted per
+experiment in stats.sqlite in the cache folder.
+"""
+from __future__ import division, print_function
+
+import os
+import hashlib
+import sqlite3
+import tempfile
+
+import numpy as np
+import yaml
+
+import utils
+import plugins
+import binaryio
+
+cachefolder = os.getenv('NETWORK_CACHE', os.path.expanduser('~/.networkcache'))
+cachesize = int(float(os.getenv('NETWORK_CACHE_SIZE', 2**30)))
+timeout = 600.
+_sourcehashes = {}
+
+
+def _file_hash(filename):
+    """Return the sha1 of the content of filename."""
+    with open(filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _source_hash(function_identifier):
+    """Return the hash of the module source of function_identifier (read
+            once per process), None for directly registered functions."""
+    filename = plugins.source_file(function_identifier)
+    if filename not in _sourcehashes:
+        try:
+            _sourcehashes[filename] = _file_hash(filename)
+        except IOError:
+            _sourcehashes[filename] = None  # see plugins.register
+    return _sourcehashes[filename]
+
+
+def _input_files(parameters):
+    """Return the existing files named by the (nested) parameters."""
+    if isinstance(parameters, dict):
+        return [f for v in parameters.values() for f in _input_files(v)]
+    if isinstance(parameters, (list, tuple)):
+        return [f for v in parameters for f in _input_files(v)]
+    if isinstance(parameters, basestring) and os.path.isfile(parameters):
+        return [parameters]
+    return []
+
+
+def network_key(function_identifier, parameters):
+    """Return the hash identifying the network created by function_identifier
+            with parameters.
+
+    >>> network_key('ising.create', {'a': 1, 'b': 2.}) == network_key('ising.create', {'b': 2., 'a': 1})  # noqa
+    True
+    >>> network_key('ising.create', {'a': 1}) == network_key('ising.create', {'a': 2})  # noqa
+    False
+    >>> with open('testfile.tmp', 'w') as f:
+    ...     f.write('0 1\\n1 0\\n')
+    >>> key = network_key('ising.create', {'tspfile': 'testfile.tmp'})
+    >>> with open('testfile.tmp', 'w') as f:
+    ...     f.write('0 2\\n2 0\\n')
+    >>> key == network_key('ising.create', {'tspfile': 'testfile.tmp'})
+    False
+    >>> os.remove('testfile.tmp')
+    """
+    content = yaml.dump({'function': function_identifier,
+                         'parameters': parameters,
+                         'source': _source_hash(function_identifier),
+                         'files': {f: _file_hash(f)
+                                   for f in _input_files(parameters)}},
+                        default_flow_style=True)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def save_network(filename, weights, bias, initialstate):
+    """Write the network (as returned by a create function) to filename.
+
+    Sparse weights are stored as index and value arrays, dense weights as
+    matrix.
+    """
+    arrays = {'bias': np.asarray(bias, dtype=float),
+              'initialstate': np.asarray(initialstate, dtype=np.int64)}
+    if binaryio.is_sparse(weights):
+        triples = binaryio.weight_triples(weights)
+        arrays['weight_ids'] = np.column_stack([triples['i'],
+                                                triples['j']]).reshape(-1, 2)
+        arrays['weight_values'] = triples['w']
+    else:
+        arrays['weights'] = np.asarray(weights, dtype=float)
+    with open(filename, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def load_network(filename):
+    """Return weights, bias and initialstate stored in filename as arrays,
+            sparse weights as weight triples (see binaryio.weight_triples).
+
+    >>> save_network('testfile.tmp', [[0, 1, .5], [1, 0, .5]], [1., 2.], [0, 3])  # noqa
+    >>> weights, bias, initialstate = load_network('testfile.tmp')
+    >>> weights.tolist(), bias, initialstate
+    ([(0, 1, 0.5), (1, 0, 0.5)], array([1., 2.]), array([0, 3]))
+    """
+    with np.load(filename) as network:
+        if 'weights' in network:
+            weights = network['weights']
+        else:
+            ids = network['weight_ids']
+            weights = np.empty(len(ids),
+                               dtype=binaryio.dtypes[binaryio.WEIGHTS])
+            weights['i'] = ids[:, 0]
+            weights['j'] = ids[:, 1]
+            weights['w'] = network['weight_values']
+        bias = network['bias']
+        initialstate = network['initialstate']
+    return weights, bias, initialstate
+
+
+def _evict(maxsize):
+    """Remove least recently used networks until the cache fits maxsize."""
+    entries = []
+    for fname in os.listdir(cachefolder):
+        if not fname.endswith('.npz'):
+            continue
+        try:
+            stat = os.stat(os.path.join(cachefolder, fname))
+        except OSError:
+            continue    # evicted by a different job
+        entries.append((stat.st_mtime, stat.st_size, fname))
+    totalsize = sum(e[1] for e in entries)
+    for mtime, size, fname in sorted(entries):
+        if totalsize <= maxsize:
+            break
+        try:
+            os.remove(os.path.join(cachefolder, fname))
+        except OSError:
+            pass
+        totalsize -= size
+
+
+def _connect_stats():
+    connection = sqlite3.connect(os.path.join(cachefolder, 'stats.sqlite'),
+                                 timeout=timeout)
+    with connection:
+        connection.execute("CREATE TABLE IF NOT EXISTS stats ("
+                           "experiment TEXT PRIMARY KEY, "
+                           "hits INTEGER NOT NULL DEFAULT 0, "
+                           "misses INTEGER NOT NULL DEFAULT 0)")
+    return connection
+
+
+def _record(experimentname, hit):
+    """Count a hit or miss of experimentname."""
+    column = 'hits' if hit else 'misses'
+    connection = _connect_stats()
+    with connection:
+        connection.execute("INSERT OR IGNORE INTO stats (experiment) "
+                           "VALUES (?)", (experimentname or 'default', ))
+        connection.execute("UPDATE stats SET {0} = {0} + 1 "
+                           "WHERE experiment = ?".format(column),
+                           (experimentname or 'default', ))
+    connection.close()
+
+
+def statistics(experimentname):
+    """Return dictionary with the number of cache hits and misses of
+            experimentname."""
+    stats = {'hits': 0, 'misses': 0}
+    if not os.path.exists(os.path.join(cachefolder, 'stats.sqlite')):
+        return stats
+    connection = _connect_stats()
+    row = connection.execute("SELECT hits, misses FROM stats "
+                             "WHERE experiment = ?",
+                             (experimentname or 'default', )).fetchone()
+    connection.close()
+    if row is not None:
+        stats['hits'], stats['misses'] = row
+    return stats
+
+
+def get_network(function_identifier, parameters, experimentname=''):
+    """Return weights, bias and initialstate of the network created by
+            function_identifier(**parameters), from the cache if possible.
+    """
+    if cachesize <= 0:
+        create_function = utils.get_function_from_name(function_identifier)
+        return create_function(**parameters)
+
+    utils.ensure_exist(cachefolder)
+    filename = os.path.join(cachefolder,
+                    network_key(function_identifier, parameters) + '.npz')
+    try:
+        network = load_network(filename)
+        # mark as recently used
+        os.utime(filename, None)
+        _record(experimentname, hit=True)
+        return network
+    except (IOError, OSError, ValueError, KeyError):
+        # not cached or evicted/corrupted in the meantime
+        pass
+
+    create_function = utils.get_function_from_name(function_identifier)
+    weights, bias, initialstate = create_function(**parameters)
+    # write to a temporary file first, concurrent jobs must never see
+    # partially written networks
+    fd, tmpname = tempfile.mkstemp(dir=cachefolder, suffix='.tmp')
+    os.close(fd)
+    save_network(tmpname, weights, bias, initialstate)
+    os.rename(tmpname, filename)
+    _record(experimentname, hit=False)
+    _evict(cachesize)
+
+    return weights, bias, initialstate
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
@@ -7,15 +7,24 @@ from __future__ import print_function, division
 
 import yaml
 import os
+import numpy as np
 import inspect
 import subprocess
 import datetime
 import time
 import shutil
-import multiprocessing as mp
-import sys
+import signal
+import threading
+import tempfile
+import json
 
 import utils
+import cache
+import binaryio
+import status
+import results
+import plugins
+import runtime
 
 currentdir = os.path.dirname(os.path.abspath(
                                 inspect.getfile(inspect.currentframe())))
@@ -24,66 +33,220 @@ os.environ['JOBCONTROLEXE'] = os.path.join(
                         parentdir,
                         "jobcontrol",
                         "jobcontrol.py")
-
-
-def _get_folders(ex_dicts, sim_folder_template):
-    """Helper function providing the simulation folder from the template."""
-    folders = [sim_folder_template.format(**d)
-                    for d in map(utils.flatten_dictionary, ex_dicts)]
-    return folders
-
-
-def _write_configs(ex_dicts, folders):
-    """Helper function writing the sim.yaml config files."""
-    for ed, folder in zip(ex_dicts, folders):
-        utils.ensure_exist(folder)
-        ed['path'] = folder
-        with open(os.path.join(folder, 'sim.yaml'), 'w') as f:
-            yaml.dump(ed, f)
-
-
-def _generate_job(folder, envfile, binary_location, files_to_remove):
+# fraction of the time of a chunked job left after the binary stops at its
+# checkpoint (see _generate_job_template and _chunk_eta)
+checkpoint_margin = .1
+
+
+def _get_manifest(sim_folder_template):
+    """Helper function providing the manifest file of an experiment."""
+    return os.path.join(os.path.dirname(sim_folder_template), 'manifest.npz')
+
+
+@utils.memorize
+def _load_manifest(manifest):
+    return utils.ParameterGrid.load(manifest)
+
+
+def _load_simdict(path, row=None):
+    """Return the simulation dictionary for folder path or manifest row."""
+    if row is None:
+        with open(os.path.join(path, 'sim.yaml'), 'r') as f:
+            return yaml.load(f)
+    grid = _load_manifest(path)
+    simdict = grid.simdict(row)
+    # the folder template is relative to the directory of the experiment,
+    # which is not necessarily the current one
+    foldertemplate = simdict['folderTemplate']
+    folder = foldertemplate.format(**utils.flatten_dictionary(simdict))
+    simdict['path'] = os.path.join(
+        os.path.dirname(os.path.abspath(path)),
+        os.path.relpath(folder, os.path.dirname(foldertemplate)))
+    return simdict
+
+
+def _get_job_template(sim_folder_template):
+    """Helper function providing the job template file of an experiment."""
+    return os.path.join(os.path.dirname(sim_folder_template), 'job.template')
+
+
+def _generate_job_template(envfile, binary_location, files_to_remove,
+        statusfile, stream=False, chunk_seconds=None):
+    """Return the job script of the experiment, parametrized by the
+            simulation folder and the simulation argument of control.py.
+
+    With stream the output is piped into the analysis instead of being
+    written to disk (see stream). With chunk_seconds a job runs that many
+    seconds at most: the binary stops at a checkpoint checkpoint_margin of
+    them before, leaving time for the startup, writing the checkpoint and
+    the analysis, and the job exits with EX_TEMPFAIL. jobcontrol runs it
+    again to continue until the simulation is done.
+    Otherwise the job exits with the status of the first step that failed,
+    after cleaning up."""
     stub = """
 set -x
-cd "{folder}" &&
+mkdir -p "{{folder}}" &&
+cd "{{folder}}" &&
 set +x
 source {envscript} &&
 set -x
-python {cwd}/control.py -m expand "{folder}" &&
-{binaryLocation} "{folder}/run.yaml" &&
-python {cwd}/control.py -m analysis "{folder}" &&
-/usr/bin/touch "{folder}/success"
+python {cwd}/status.py "{statusfile}" "{{folder}}" started &&
+python {cwd}/control.py -m expand {{simulation}}{expandoptions} &&
+{run} &&
+/usr/bin/touch "{{folder}}/success" &&
+python {cwd}/status.py "{statusfile}" "{{folder}}" success
+rc=$?
+test $rc -eq 0 || python {cwd}/status.py "{statusfile}" "{{folder}}" failed
 
 /usr/bin/rm -f {files_to_remove}
+exit $rc
     """
-    content = stub.format(envscript=envfile,
-                cwd=os.path.split(os.path.realpath(__file__))[0],
-                binaryLocation=binary_location, folder=os.path.abspath(folder),
+    expandoptions = ''
+    if stream:
+        run = ('python {cwd}/control.py -m stream {{simulation}} '
+               '--binary "{binaryLocation}"')
+    elif chunk_seconds:
+        expandoptions = ' --chunk-seconds {}'.format(
+                                    (1. - checkpoint_margin) * chunk_seconds)
+        run = ('if {binaryLocation} "{{folder}}/run.yaml"; then\n'
+               '    python {cwd}/control.py -m analysis {{simulation}}\n'
+               'else\n'
+               '    test $? -ne {tempfail} || exit {tempfail}; false\n'
+               'fi')
+    else:
+        run = ('{binaryLocation} "{{folder}}/run.yaml" &&\n'
+               'python {cwd}/control.py -m analysis {{simulation}}')
+    cwd = os.path.split(os.path.realpath(__file__))[0]
+    return stub.format(envscript=envfile,
+                cwd=cwd,
+                expandoptions=expandoptions,
+                run=run.format(cwd=cwd, binaryLocation=binary_location,
+                               tempfail=os.EX_TEMPFAIL),
+                statusfile=os.path.abspath(statusfile),
                 files_to_remove=" ".join(files_to_remove))
-    with open(folder + os.sep + 'job', 'w') as f:
-        f.write(content)
 
 
-def _submit_jobs(folders, eta, submit_jobs):
-    p = mp.Pool(submit_jobs)
-    p.map(_submit_job, [{'folder': f, 'eta': eta} for f in folders])
-    p.close()
-    p.join()
+def _generate_worker_template(envfile, binary_location, files_to_remove,
+        statusfile, stream=False):
+    """Return the job template of the experiment for persistent workers, all
+            jobs of a task using it are run by one worker per core."""
+    stub = """#worker
+source {envscript} &&
+python {cwd}/worker.py "$1" --binary "{binaryLocation}" \\
+    --statusfile "{statusfile}" {stream}--remove {files_to_remove}
+"""
+    return stub.format(envscript=envfile,
+                cwd=os.path.split(os.path.realpath(__file__))[0],
+                binaryLocation=binary_location,
+                statusfile=os.path.abspath(statusfile),
+                stream='--stream ' if stream else '',
+                files_to_remove=" ".join(files_to_remove))
 
 
-def _submit_job(argdict):
-    folder = argdict['folder']
-    eta    = argdict['eta']
-    if eta is 'None':
-        sim_config = yaml.load(open(os.path.join(folder, 'sim.yaml'), 'r'))
-        eta_function = utils.get_function_from_name(
-                                sim_config['network']['etaFunction'])
-        eta = eta_function(sim_config)
-    eta = str(eta)
-    exe = os.environ['JOBCONTROLEXE']
-    jobfile = os.path.join(folder, 'job')
-    subprocess.call([exe, 'a', jobfile, folder, eta])
-    # ensure that jobfiles are named differently
+def _job_arguments(folder, manifest=None, row=None):
+    """Return the arguments of the job template for a simulation."""
+    if manifest is None:
+        path = os.path.abspath(folder)
+        simulation = '"{}"'.format(path)
+    else:
+        path = os.path.abspath(manifest)
+        simulation = '"{}" -r {}'.format(path, row)
+    return {'folder': os.path.abspath(folder), 'simulation': simulation,
+            'path': path, 'row': row}
+
+
+def _get_eta(eta, sim_config, model=None):
+    """Return the eta of a simulation in seconds: the given one, else the
+            prediction of the runtime model, else the network's eta
+            function."""
+    if eta == 'None':
+        if model is not None:
+            return runtime.predict(model, runtime.features(sim_config))
+        eta = runtime.static_eta(sim_config)
+    return float(eta)
+
+
+def _load_runtime_model():
+    model = runtime.load_model(_load_simdict)
+    if model is None:
+        print("{}: Too few recorded jobs for a runtime model, using the eta "
+              "functions".format(datetime.datetime.now()))
+    else:
+        print("{}: Runtime model of cluster {} fitted on {} jobs".format(
+                datetime.datetime.now(), model['cluster'], model['nsamples']))
+    return model
+
+
+def _chunk_eta(chunk_seconds):
+    """Return the eta of a job of a chunked simulation: the binary runs
+            (1 - checkpoint_margin) of chunk_seconds, half of the rest is
+            added for its startup. The job then fits into a task of
+            jobcontrol whose jobs may run chunk_seconds.
+
+    A chunked job stopping at its checkpoint once finishes in two static
+    tasks, or in a single task pulling its jobs:
+
+    >>> import sqlite3, sys, tempfile
+    >>> env = dict(os.environ, JOB_FOLDER=tempfile.mkdtemp())
+    >>> def execute(packing, ntasks):
+    ...     with open(os.path.join(env['JOB_FOLDER'], 'config.yaml'),
+    ...               'w') as f:
+    ...         yaml.dump({'maxcpuhours': .1, 'ncpus': 1, 'packing': packing,
+    ...                    'slurmmode': 'local'}, f)
+    ...     script = os.path.join(env['JOB_FOLDER'], packing)
+    ...     with open(script, 'w') as f:
+    ...         f.write('test -e {0}.done && exit 0\\n'
+    ...                 'touch {0}.done\\n'
+    ...                 'exit {1}\\n'.format(script, os.EX_TEMPFAIL))
+    ...     eta = _chunk_eta(runtime.get_job_walltime(env['JOB_FOLDER']))
+    ...     commands = [['a', script, env['JOB_FOLDER'], str(eta)]]
+    ...     for command in commands + [['e']] * ntasks:
+    ...         subprocess.check_call([sys.executable,
+    ...                                os.environ['JOBCONTROLEXE']] + command,
+    ...                               env=env, stdout=open(os.devnull, 'w'))
+    ...     return os.path.exists(script + '.done'), eta
+    >>> execute('longest_first', 2), execute('pull', 1)
+    ((True, 228.0), (True, 228.0))
+    >>> sqlite3.connect(os.path.join(env['JOB_FOLDER'], 'queue.sqlite')
+    ...                 ).execute("SELECT state FROM jobs").fetchall()
+    [(u'success',), (u'success',)]
+    >>> shutil.rmtree(env['JOB_FOLDER'])
+    """
+    return (1. - checkpoint_margin / 2.) * chunk_seconds
+
+
+def _submit_jobs(folders, eta, jobtemplate, manifest=None, rows=None,
+        model=None, chunk_seconds=None):
+    """Stage the jobs of all folders with a single jobcontrol call, jobs of
+            chunked simulations run chunk_seconds at most (see
+            _chunk_eta)."""
+    if rows is None:
+        rows = [None] * len(folders)
+    experimentfolder = os.path.dirname(os.path.abspath(jobtemplate))
+    fd, jobsfile = tempfile.mkstemp(dir=experimentfolder, suffix='.jobs')
+    with os.fdopen(fd, 'w') as f:
+        for folder, row in zip(folders, rows):
+            if manifest is None:
+                sim_config = _load_simdict(folder)
+            else:
+                sim_config = _load_simdict(manifest, row)
+            arguments = _job_arguments(folder, manifest, row)
+            # for the resource report of jobcontrol.py stats
+            arguments['parameters'] = runtime.parameters(sim_config)
+            simeta = _get_eta(eta, sim_config, model)
+            if chunk_seconds:
+                simeta = min(simeta, _chunk_eta(chunk_seconds))
+                # the runtime of a chunk says nothing about the simulation
+                arguments['chunked'] = True
+            f.write(json.dumps({
+                'cwd': experimentfolder,
+                'eta': simeta,
+                'arguments': arguments}) + '\n')
+    try:
+        subprocess.check_call([os.environ['JOBCONTROLEXE'], 'b',
+                               jobtemplate, jobsfile])
+    finally:
+        os.remove(jobsfile)
 
 
 def _execute_jobs():
@@ -114,6 +277,30 @@ def run_experiment(experimentfile, write_configs, generate_jobs, submit_jobs,
     binary_location = experiment_config.get('binaryLocation', '')
     files_to_remove = experiment_config.get('filesToRemove', '')
     eta = experiment_config.get('eta', 'None')
+    use_worker = experiment_config.get('worker', False)
+    stream_output = experiment_config.get('streamOutput', False)
+    # long simulations run in chained jobs that fit the walltime of the
+    # tasks of jobcontrol, or chunkHours if that is shorter
+    chunk_seconds = None
+    if experiment_config.get('chunked') or experiment_config.get('chunkHours'):
+        chunk_seconds = runtime.get_job_walltime(runtime.get_jobfolder())
+        if experiment_config.get('chunkHours'):
+            chunkhours = float(experiment_config['chunkHours'])
+            if (chunk_seconds is not None and
+                    chunkhours * 3600. > chunk_seconds):
+                raise ValueError("chunkHours {} exceed the {:.0f}s a job may "
+                                 "run (maxcpuhours less graceperiod of "
+                                 "jobcontrol)".format(chunkhours,
+                                                      chunk_seconds))
+            chunk_seconds = chunkhours * 3600.
+        if chunk_seconds is None:
+            raise ValueError("Chunked simulations need maxcpuhours in the "
+                             "config of jobcontrol")
+        if use_worker or stream_output:
+            print("{}: Chunking needs the output on disk and is ignored "
+                  "with worker or streamOutput".format(
+                                                    datetime.datetime.now()))
+            chunk_seconds = None
 
     # save experimentfile if we are submitting jobs
     if generate_jobs or write_configs:
@@ -144,67 +331,96 @@ def run_experiment(experimentfile, write_configs, generate_jobs, submit_jobs,
 
     # _sanity_check(experiment_config)
 
-    # expand dictionaries
-    ex_dicts = [ex_dict
-                    for ex_dict in utils.expanddict(dictionary, replacements)
-                    if utils.apply_rules(ex_dict, rules)]
+    get_simparameters_from_template = utils.get_function_from_name(
+                                    'utils.get_simparameters_from_template')
+    simparameterkeys = get_simparameters_from_template(sim_folder_template)
 
-    # generate skeletons
+    # filter the parameter grid as a whole and write it as a single
+    # manifest, simulation folders are only created by the jobs themselves
     t0 = time.time()
-    folders = _get_folders(ex_dicts, sim_folder_template)
-
-    print("{}: Generating {} simulations".format(
-                                        datetime.datetime.now(), len(folders)))
-    missing_folders = []
+    manifest = _get_manifest(sim_folder_template)
+    if write_configs or not os.path.exists(manifest):
+        grid = utils.ParameterGrid(dictionary, replacements, rules)
+        ngridpoints = int(np.prod([len(v) for v in replacements.values()]))
+        print("{}: Generating {} simulations, {} eliminated by rules".format(
+                datetime.datetime.now(), len(grid), ngridpoints - len(grid)))
+        if write_configs:
+            utils.ensure_exist(os.path.dirname(manifest))
+            grid.save(manifest)
+        else:
+            # experiment with one sim.yaml per folder
+            manifest = None
+    else:
+        grid = _load_manifest(manifest)
+
+    # expand dictionaries one at a time, only the folders and the swept
+    # parameters are kept for the later stages
+    folders = []
+    simparameters = []
+    for ex_dict in grid:
+        flatsimdict = utils.flatten_dictionary(ex_dict)
+        folders.append(sim_folder_template.format(**flatsimdict))
+        simparameters.append({spkey: flatsimdict[spkey]
+                                            for spkey in simparameterkeys})
+    rows = range(len(folders))
+
+    # the jobs record their state in the status index, only experiments
+    # started before it existed are probed for success files (once)
+    statusfile = status.get_statusfile(sim_folder_template)
+    utils.ensure_exist(os.path.dirname(statusfile))
+    missing_rows = []
     if write_configs:
-        _write_configs(ex_dicts, folders)
+        status.register(statusfile, folders, rows)
     else:
-        for i, folder in enumerate(folders):
-            print("Generating {: 3.1f}% complete".format(100.*i/len(folders)),
-                end='\r')
-            if not os.path.exists(os.path.join(folder, 'success')):
-                missing_folders.append(folder)
+        if not os.path.exists(statusfile):
+            print("{}: Building status index from success files".format(
+                datetime.datetime.now()))
+            status.import_success_files(statusfile, folders)
+        missing_rows = status.missing(statusfile, folders)
+    missing_folders = [folders[i] for i in missing_rows]
     elapsed_time = time.time() - t0
     print("{}: Generated {} simulations in {} "
         "seconds.".format(datetime.datetime.now(), len(folders), elapsed_time))
 
-    if generate_jobs:
-        print("{}: Generating {} jobfiles".format(
-            datetime.datetime.now(), len(folders)))
-        for i, folder in enumerate(folders):
-            print("Generating {: 3.1f}% complete".format(100.*i/len(folders)),
-                end='\r')
-            sys.stdout.flush()
-            _generate_job(folder, envfile, binary_location, files_to_remove)
-        print("{}: Generated {} jobfiles".format(
-            datetime.datetime.now(), len(folders)))
-    elif missing_folders:
-        print("{}: Generating {} jobfiles for failed jobs".format(
-            datetime.datetime.now(), len(missing_folders)))
-        for i, folder in enumerate(missing_folders):
-            print("Generating {: 3.1f}% complete"
-                  "".format(100.*i/len(missing_folders)), end='\r')
-            sys.stdout.flush()
-            _generate_job(folder, envfile, binary_location, files_to_remove)
-        print("{}: Generated {} jobfiles".format(
-            datetime.datetime.now(), len(missing_folders)))
-
-        time.sleep(1.)
+    # all jobs share one template, they only differ in their arguments
+    jobtemplate = _get_job_template(sim_folder_template)
+    if generate_jobs or submit_jobs or (submit_failed_jobs and
+                                        missing_folders):
+        utils.ensure_exist(os.path.dirname(jobtemplate))
+        with open(jobtemplate, 'w') as f:
+            if use_worker:
+                f.write(_generate_worker_template(envfile, binary_location,
+                                                  files_to_remove, statusfile,
+                                                  stream=stream_output))
+            else:
+                f.write(_generate_job_template(envfile, binary_location,
+                                               files_to_remove, statusfile,
+                                               stream=stream_output,
+                                               chunk_seconds=chunk_seconds))
+        print("{}: Generated job template {}".format(
+            datetime.datetime.now(), jobtemplate))
+
+    model = None
+    if eta == 'None' and (submit_jobs or (submit_failed_jobs and
+                                          missing_folders)):
+        model = _load_runtime_model()
 
     if submit_jobs:
-        print("{}: Submitting {} jobfiles".format(
+        print("{}: Submitting {} jobs".format(
             datetime.datetime.now(), len(folders)))
-        _submit_jobs(folders, eta, submit_jobs)
-        print("{}: Submitted {} jobfiles".format(
+        _submit_jobs(folders, eta, jobtemplate, manifest, rows, model,
+                     chunk_seconds)
+        print("{}: Submitted {} jobs".format(
             datetime.datetime.now(), len(folders)))
 
         time.sleep(1.)
 
     if submit_failed_jobs and missing_folders:
-        print("{}: Submitting {} jobfiles".format(
+        print("{}: Submitting {} jobs".format(
             datetime.datetime.now(), len(missing_folders)))
-        _submit_jobs(missing_folders, eta, submit_failed_jobs)
-        print("{}: Submitted {} jobfiles".format(
+        _submit_jobs(missing_folders, eta, jobtemplate, manifest,
+                     missing_rows, model, chunk_seconds)
+        print("{}: Submitted {} jobs".format(
             datetime.datetime.now(), len(missing_folders)))
 
         time.sleep(1.)
@@ -218,67 +434,194 @@ def run_experiment(experimentfile, write_configs, generate_jobs, submit_jobs,
 
     if collect_jobs is not False:
         print("{}: Collecting results".format(datetime.datetime.now()))
-        get_simparameters_from_template = utils.get_function_from_name(
-                                    'utils.get_simparameters_from_template')
-        collect = []
-        n_nones = 0
-        for i, (simdict, folder) in enumerate(zip(ex_dicts, folders)):
-            print("Collecting {: 3.1f}% complete".format(100*i/len(folders)),
-                    end='\r')
-            sys.stdout.flush()
-            collectdict = {}
-            foldertemplate = simdict['folderTemplate']
-            simparameterkeys = get_simparameters_from_template(foldertemplate)
-            flatsimdict = utils.flatten_dictionary(simdict)
-            for spkey in simparameterkeys:
-                collectdict[spkey] = flatsimdict[spkey]
-
-            try:
-                with open(os.path.join(folder, 'analysis'), 'r') as f:
-                    analysisdict = yaml.load(f)
-
-                collectdict['analysis'] = analysisdict
-            except:
-                collectdict['analysis'] = None
-                n_nones += 1
-
-            collect.append(collectdict)
-
-        with open(os.path.join('collect', experimentname), 'w') as f:
-            yaml.dump(collect, f)
-        print("{}: Collected {} results, {} missing".format(
-            datetime.datetime.now(), len(folders) - n_nones, n_nones))
+        # only successful simulations have an analysis worth opening, and
+        # only those changed since the last collect need to be read again
+        tablefile = os.path.join('collect', experimentname + '.npz')
+        previous = results.load_table(tablefile)
+        mark = None
+        # tables of older versions hold a timestamp instead of a sequence
+        # number, collect those completely
+        if (previous is not None and
+                previous['_statusmark'].dtype.kind in 'iu'):
+            mark = int(previous['_statusmark'])
+        changed, mark = status.changed_since(statusfile, mark)
+        table, nread = results.collect(folders, simparameters,
+                                nprocesses=collect_jobs or None,
+                                done=status.succeeded(statusfile),
+                                previous=previous, changed=changed)
+        table['_statusmark'] = np.array(mark)
+        utils.ensure_exist('collect')
+        results.save_table(tablefile, table)
+        n_nones = len(folders) - int(table['valid'].sum())
+        print("{}: Collected {} results ({} read), {} missing".format(
+            datetime.datetime.now(), len(folders) - n_nones, nread, n_nones))
+        cachestats = cache.statistics(experimentname)
+        print("{}: Network cache: {} hits, {} misses".format(
+            datetime.datetime.now(), cachestats['hits'],
+            cachestats['misses']))
 
         time.sleep(1.)
 
 
-def expand(folder):
-    simdict = yaml.load(open(os.path.join(folder, 'sim.yaml'), 'r'))
+def expand(path, row=None, chunk_seconds=None):
+    """Write run.yaml for the simulation in folder path or row of manifest
+            path, with chunk_seconds the binary stops at a checkpoint after
+            that many seconds and continues from it when run again."""
+    simdict = _load_simdict(path, row)
+    folder = path if row is None else simdict['path']
+    utils.ensure_exist(folder)
     rundict = {}
     rundict['Config'] = simdict['Config']
 
-    create_function = utils.get_function_from_name(
-                                        simdict['network']['problemName'])
-    W, b, i = create_function(**simdict['network']['parameters'])
-    rundict['weight']       = W
-    rundict['bias']         = b
-    rundict['initialstate'] = i
+    W, b, i = cache.get_network(simdict['network']['problemName'],
+                                simdict['network']['parameters'],
+                                simdict.get('experimentName', ''))
+    if simdict['network'].get('handoff', 'binary') == 'binary':
+        # the binary memory maps these instead of parsing them from yaml
+        rundict.update(binaryio.write_network(folder, W, b, i))
+    else:
+        # cached networks are arrays, yaml needs plain lists
+        rundict['weight']       = binaryio.weight_lists(W)
+        rundict['bias']         = np.asarray(b, dtype=float).tolist()
+        rundict['initialstate'] = np.asarray(i, dtype=int).tolist()
     rundict['temperature']  = simdict['temperature']
     rundict['externalCurrent'] = simdict['externalCurrent']
     rundict['outfile'] = os.path.join(folder, 'output')
+    if chunk_seconds:
+        rundict['checkpoint'] = {'file': os.path.join(folder, 'checkpoint'),
+                                 'walltime': float(chunk_seconds)}
 
     yaml.dump(rundict, open(os.path.join(folder, 'run.yaml'), 'w'))
 
 
-def analysis(folder):
-    simdict = yaml.load(open(os.path.join(folder, 'sim.yaml'), 'r'))
+def analysis(path, row=None):
+    """Run the analysis for the simulation in folder path or row of manifest
+            path."""
+    simdict = _load_simdict(path, row)
+    folder = path if row is None else simdict['path']
     analysis_function = utils.get_function_from_name(
                                     simdict['analysis']['analysisFunction'])
     if analysis_function == "nothing":
         return
     else:
         analysis_function(outfile=os.path.join(folder, 'output'),
-            **simdict['analysis']['parameters'])
+            simdict=simdict, **simdict['analysis']['parameters'])
+
+
+def _default_sigpipe():
+    # python ignores SIGPIPE, the binary should die once nobody reads
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+def _release_output(simulation, outfile, done):
+    """Open the named pipe outfile for writing once the binary is gone, such
+            that an analysis still waiting for a writer sees the end of it.
+            The binary is only polled, it is reaped by stream."""
+    while not done.is_set():
+        if simulation.poll() is not None:
+            try:
+                os.close(os.open(outfile, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+        done.wait(.1)
+
+
+def stream(path, row=None, binary=None, log=None):
+    """Run the binary and the analysis of the simulation in folder path or
+            row of manifest path concurrently.
+
+    The output file is replaced by a named pipe, the analysis reads the
+    output while the binary writes it and only the analysis is stored.
+    Once the analysis returns the rest of the output is not needed, a
+    binary still running is killed. A binary failing on its own raises a
+    RuntimeError. Run expand first.
+    """
+    simdict = _load_simdict(path, row)
+    folder = path if row is None else simdict['path']
+    outfile = os.path.join(folder, 'output')
+    if os.path.lexists(outfile):
+        os.remove(outfile)
+    os.mkfifo(outfile)
+    # a reader of our own keeps the binary from dying of SIGPIPE when the
+    # analysis stops reading early, it blocks and is killed below instead
+    reader = os.open(outfile, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        simulation = subprocess.Popen(
+                            [binary, os.path.join(folder, 'run.yaml')],
+                            stdout=log, stderr=subprocess.STDOUT if log
+                                                            else None,
+                            preexec_fn=_default_sigpipe)
+        done = threading.Event()
+        watcher = threading.Thread(target=_release_output,
+                                   args=(simulation, outfile, done))
+        watcher.daemon = True
+        watcher.start()
+        try:
+            analysis(path, row)
+        finally:
+            done.set()
+            watcher.join()
+            killed = simulation.poll() is None
+            if killed:
+                simulation.kill()
+            simulation.wait()
+    finally:
+        os.close(reader)
+        os.remove(outfile)
+    accepted = (0, -signal.SIGKILL, -signal.SIGPIPE) if killed else (0, )
+    if simulation.returncode not in accepted:
+        raise RuntimeError("{} returned {}".format(binary,
+                                                   simulation.returncode))
+
+
+def estimate(experimentfile):
+    """Print the predicted CPU hours of all simulations of the experiment,
+            nothing is written or submitted."""
+    dictionary = yaml.load(open(experimentfile, 'r'))
+    replacements = dictionary.pop('replacements', {})
+    rules = dictionary.pop('rules', {})
+    experiment_config = dictionary.pop('experimentConfig')
+    eta = experiment_config.get('eta', 'None')
+    sim_folder_template = utils.generate_folder_template(replacements,
+            dictionary, 'simulations', dictionary.get('experimentName', ''))
+    dictionary['folderTemplate'] = sim_folder_template
+    grid = utils.ParameterGrid(dictionary, replacements, rules)
+
+    model = _load_runtime_model() if eta == 'None' else None
+    static, predicted = 0., 0.
+    for simdict in grid:
+        if eta != 'None':
+            static += float(eta)
+            continue
+        simeta = runtime.static_eta(simdict)
+        static += simeta
+        if model is not None:
+            predicted += runtime.predict(model,
+                                         runtime.features(simdict, simeta))
+    print("{} simulations".format(len(grid)))
+    print("{:>10.3f} CPU hours by the eta {}".format(static / 3600.,
+                        "functions" if eta == 'None' else "of the experiment"))
+    if model is not None:
+        print("{:>10.3f} CPU hours by the runtime model".format(
+                                                        predicted / 3600.))
+
+
+def report_status(experimentfile):
+    """Print the number of simulations of the experiment in each state."""
+    dictionary = yaml.load(open(experimentfile, 'r'))
+    replacements = dictionary.pop('replacements', {})
+    dictionary.pop('rules', {})
+    dictionary.pop('experimentConfig')
+    sim_folder_template = utils.generate_folder_template(replacements,
+            dictionary, 'simulations', dictionary.get('experimentName', ''))
+    statusfile = status.get_statusfile(sim_folder_template)
+    if not os.path.exists(statusfile):
+        print("No status index at {}".format(statusfile))
+        return
+    counts = status.counts(statusfile)
+    for state in status.STATES:
+        print("{:>10}: {}".format(state, counts.get(state, 0)))
+    print("{:>10}: {}".format('total', sum(counts.values())))
 
 
 if __name__ == "__main__":
@@ -286,8 +629,21 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='CnC for neuralsampler.')
     parser.add_argument('path', type=str)
     parser.add_argument('--mode', '-m',
-        choices=['execute', 'expand', 'analysis'], default='execute',
+        choices=['execute', 'expand', 'analysis', 'stream', 'status',
+                 'estimate'],
+        default='execute',
         help='specify the mode in which to run, choose from %(choices)s')
+    parser.add_argument('--row', '-r', type=int, default=None,
+        help='row of the manifest given as path in expand/analysis mode')
+    parser.add_argument('--binary', '-b', type=str, default=None,
+        help='neuralsampler binary to run in stream mode')
+    parser.add_argument('--chunk-seconds', dest='chunk_seconds', type=float,
+        default=None,
+        help='seconds after which the binary stops at a checkpoint, in '
+             'expand mode')
+    parser.add_argument('--import-report', dest='import_report',
+                    action='store_true',
+                    help='print the import times of the network modules')
     parser.add_argument('--write-configs', '-w', dest='write_configs',
                     action='store_const', const=True, default=False,)
     parser.add_argument('--generate-jobs', '-g', dest='generate_jobs',
@@ -299,7 +655,9 @@ if __name__ == "__main__":
     parser.add_argument('--execute-jobs', '-e', dest='execute_jobs',
                     action='store_const', const=True, default=False,)
     parser.add_argument('--collect-jobs', '-c', dest='collect_jobs',
-                    action='store_const', const=True, default=False,)
+                    type=int, nargs='?', const=0, default=False,
+                    help='collect the results with the given number of '
+                         'processes (default: number of cpus)')
 
     args = parser.parse_args()
     print(args)
@@ -310,9 +668,17 @@ if __name__ == "__main__":
             submit_failed_jobs=args.submit_failed_jobs,
             execute_jobs=args.execute_jobs, collect_jobs=args.collect_jobs)
     elif args.mode == 'expand':
-        expand(folder=args.path)
+        expand(path=args.path, row=args.row, chunk_seconds=args.chunk_seconds)
     elif args.mode == 'analysis':
-        analysis(folder=args.path)
+        analysis(path=args.path, row=args.row)
+    elif args.mode == 'stream':
+        stream(path=args.path, row=args.row, binary=args.binary)
+    elif args.mode == 'status':
+        report_status(experimentfile=args.path)
+    elif args.mode == 'estimate':
+        estimate(experimentfile=args.path)
     else:
         print("Don't know what to do.")
         print(parser.print_help())
+    if args.import_report:
+        print("\n".join(plugins.report()))
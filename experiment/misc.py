@@ -8,6 +8,7 @@ from __future__ import division, print_function
 import collections
 import os
 import itertools as it
+import multiprocessing as mp
 import numpy as np
 
 
@@ -61,8 +62,8 @@ def get_statelist(state, n_neurons):
     ...
     ValueError: Wrong list length 2 requires 3
     """
-    if isinstance(state, int):
-        return statelist_from_int(state, n_neurons)
+    if isinstance(state, (int, long, np.integer)):
+        return statelist_from_int(int(state), n_neurons)
     elif isinstance(state, str):
         return statelist_from_string(state, n_neurons)
     elif isinstance(state, list) or isinstance(state, tuple):
@@ -157,6 +158,137 @@ def statelist_from_int(stateint, n_neurons):
     return [int(s) for s in "{0:0{width}b}".format(stateint, width=n_neurons)]
 
 
+# State codes: the binary state of up to 64 neurons as one uint64, the first
+# neuron is the most significant bit like in statestring_from_int
+def pack_states(bits):
+    """Return the uint64 codes of the states given as rows of {0,1}.
+
+    >>> pack_states([[0, 1, 1], [1, 0, 0]])
+    array([3, 4], dtype=uint64)
+    """
+    bits = np.asarray(bits, dtype=np.uint8)
+    nstates, n_neurons = bits.shape
+    if n_neurons > 64:
+        raise ValueError("States of {} neurons do not fit into 64 "
+                         "bits".format(n_neurons))
+    packed = np.packbits(bits, axis=1)
+    padded = np.zeros((nstates, 8), dtype=np.uint8)
+    padded[:, 8 - packed.shape[1]:] = packed
+    return (padded.view('>u8').ravel().astype(np.uint64) >>
+            np.uint64(8 * packed.shape[1] - n_neurons))
+
+
+def unpack_states(codes, n_neurons):
+    """Return the states of the uint64 codes as rows of {0,1}.
+
+    >>> unpack_states([3, 4], 3)
+    array([[0, 1, 1],
+           [1, 0, 0]], dtype=uint8)
+    """
+    codes = np.asarray(codes, dtype=np.uint64).reshape(-1)
+    if n_neurons == 0:
+        return np.zeros((len(codes), 0), dtype=np.uint8)
+    codes = codes << np.uint64(64 - n_neurons)
+    bits = np.unpackbits(codes.astype('>u8').view(np.uint8).reshape(-1, 8),
+                         axis=1)
+    return bits[:, :n_neurons]
+
+
+def _state_chars(data, n_neurons):
+    """Return the characters of the lines of data that are states of
+            n_neurons as rows of uint8, and whether each line is one."""
+    data = np.frombuffer(data, dtype=np.uint8)
+    width = n_neurons + 1
+    if (len(data) % width == 0 and
+            (data[n_neurons::width] == ord('\n')).all()):
+        # only lines of the state length, the common case
+        chars = data.reshape(-1, width)[:, :n_neurons]
+        # characters below '0' wrap around to large values
+        isstate = (chars - ord('0') <= 1).all(axis=1)
+        if isstate.all():
+            return chars, isstate
+    ends = np.flatnonzero(data == ord('\n'))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    isstate = ends - starts == n_neurons
+    chars = data[starts[isstate, None] + np.arange(n_neurons)]
+    binary = (chars - ord('0') <= 1).all(axis=1)
+    isstate[isstate] = binary
+    return chars[binary], isstate
+
+
+def states_from_bytes(data, n_neurons):
+    """Return the codes of the lines of data, complete lines of the
+            BinaryState output, and whether each line is a state of
+            n_neurons (other lines, e.g. summaries, have code 0).
+
+    >>> states_from_bytes(b'011\\nSummary:\\n100\\n', 3)
+    (array([3, 0, 4], dtype=uint64), array([ True, False,  True]))
+    """
+    chars, isstate = _state_chars(data, n_neurons)
+    codes = np.zeros(len(isstate), dtype=np.uint64)
+    if len(chars):
+        codes[isstate] = pack_states(chars - ord('0'))
+    return codes, isstate
+
+
+def state_lines_from_bytes(data, n_neurons):
+    """Return the lines of data like states_from_bytes, but as byte strings
+            instead of codes, for states of more than 64 neurons.
+
+    >>> state_lines_from_bytes(b'011\\nSummary:\\n100\\n', 3)
+    (array(['011', '', '100'], dtype='|S3'), array([ True, False,  True]))
+    """
+    chars, isstate = _state_chars(data, n_neurons)
+    lines = np.zeros(len(isstate), dtype='S{}'.format(n_neurons))
+    if len(chars):
+        lines[isstate] = np.ascontiguousarray(chars).view(lines.dtype)[:, 0]
+    return lines, isstate
+
+
+def count_states(codes, n_neurons, previous=None, dense_neurons=20):
+    """Return the distinct codes in ascending order and how often they occur,
+            added to previous, a result of this function.
+
+    Up to dense_neurons neurons all states are counted with a bincount,
+    larger states by merging the sorted distinct codes, which may also be
+    byte strings (see state_lines_from_bytes).
+
+    >>> previous = count_states(np.array([3, 1, 3], dtype=np.uint64), 2)
+    >>> previous
+    (array([1, 3], dtype=uint64), array([1, 2]))
+    >>> count_states(np.array([3, 0], dtype=np.uint64), 2, previous, 0)
+    (array([0, 1, 3], dtype=uint64), array([1, 1, 3]))
+    """
+    if n_neurons <= dense_neurons and codes.dtype.kind == 'u':
+        counts = np.bincount(codes.astype(np.intp), minlength=2**n_neurons)
+        if previous is not None:
+            counts[previous[0].astype(np.intp)] += previous[1]
+        states = np.flatnonzero(counts)
+        return states.astype(np.uint64), counts[states]
+    counted = np.unique(codes, return_counts=True)
+    if previous is not None:
+        counted = merge_counts(previous, counted)
+    return counted
+
+
+def merge_counts(counted, other):
+    """Return the sum of two results of count_states.
+
+    >>> merge_counts((np.array([1, 3]), np.array([1, 2])),
+    ...              (np.array([0, 3]), np.array([4, 1])))
+    (array([0, 1, 3]), array([4, 1, 3]))
+    """
+    states = np.concatenate((counted[0], other[0]))
+    counts = np.concatenate((counted[1], other[1]))
+    order = np.argsort(states, kind='mergesort')
+    states, counts = states[order], counts[order]
+    if len(states) == 0:
+        return states, counts
+    first = np.flatnonzero(np.concatenate(([True],
+                                           states[1:] != states[:-1])))
+    return states[first], np.add.reduceat(counts, first)
+
+
 # distribution comparisons
 def calculate_dkl(ptheo, fsampl, norm_theo=False):
     """Calculate the relative entropy when encoding fsampl
@@ -174,11 +306,27 @@ def calculate_dkl(ptheo, fsampl, norm_theo=False):
     >>> calculate_dkl([0.5,0.25,0.25], [5,2,3])
     0.010067756775344432
     """
+    ptheo = np.asarray(ptheo, dtype=float)
+    fsampl = np.asarray(fsampl)
     if norm_theo:
-        ptheo /= sum(ptheo)
-    totn = np.sum(fsampl)
-    return np.sum(f / totn * np.log(f / totn / p)
-                            for p, f in zip(ptheo, fsampl) if f != 0)
+        ptheo = ptheo / np.sum(ptheo)
+    sampled = fsampl != 0
+    f = fsampl[sampled] / np.sum(fsampl)
+    return np.sum(f * np.log(f / ptheo[sampled]))
+
+
+def dkl_from_counts(log_ptheo, counted):
+    """Calculate the relative entropy of the sampled states counted (see
+            count_states) with respect to the logarithmic probabilities
+            log_ptheo of all states (see log_probabilities_for_network).
+
+    >>> dkl_from_counts(np.log([0.5, 0.25, 0.25]), ([0, 2], [5, 5]))
+    0.34657359027997264
+    """
+    states, counts = counted
+    f = np.asarray(counts) / np.sum(counts)
+    return np.sum(f * (np.log(f) -
+                       log_ptheo[np.asarray(states).astype(np.intp)]))
 
 
 def energies_for_network(w, b, states=None):
@@ -199,9 +347,172 @@ def energies_for_network(w, b, states=None):
     >>> energies_for_network(np.array([[0.,1.],[1.,0.]]), np.array([-.5, .5]), [[0,0],[1,1]])  # noqa
     [-0.0, -1.0]
     """
+    w = np.asarray(w, dtype=float)
     if states is None:
-        states = [z for z in it.product([0, 1], repeat=len(w))]
-    return [-.5 * np.dot(z, np.dot(w, z)) - np.dot(b, z) for z in states]
+        states = unpack_states(np.arange(2**len(w)), len(w))
+    states = np.asarray(states, dtype=float).reshape(-1, len(w))
+    return _energies(states, w, np.asarray(b, dtype=float)).tolist()
+
+
+def _energies(states, w, b):
+    return -.5 * np.sum(states.dot(w) * states, axis=1) - states.dot(b)
+
+
+def _log_weights_block(args):
+    """Return the log-sum of the Boltzmann weights exp(-E) of the chunks
+            first to last (in Gray code order) and, with output 'array',
+            the log weights of their states, or write those to the .npy
+            file output. Without output they are not kept."""
+    s, b, n_low, first, last, output = args
+    n_high = len(b) - n_low
+    low = unpack_states(np.arange(2**n_low), n_low).astype(float)
+    s_ll, s_lh = s[n_high:, n_high:], s[n_high:, :n_high]
+    s_hh = s[:n_high, :n_high]
+    energies_low = _energies(low, s_ll, b[n_high:])
+    out = None
+    if output == 'array':
+        out = np.empty((last - first, 2**n_low))
+    elif output is not None:
+        out = np.lib.format.open_memmap(output, mode='r+')
+        out = out.reshape(-1, 2**n_low)
+    logsum = -np.inf
+    for i in range(first, last):
+        chunk = i ^ (i >> 1)
+        if i == first:
+            high = unpack_states([chunk], n_high)[0].astype(float)
+            energy_high = _energies(high[None], s_hh, b[:n_high])[0]
+            field_high = s_hh.dot(high)
+            field_low = s_lh.dot(high)
+        else:
+            # the next chunk differs in a single neuron of the high part
+            j = n_high - 1 - (len(bin(i & -i)) - 3)
+            sign = 1. - 2. * high[j]
+            energy_high -= sign * (field_high[j] + b[j]) + .5 * s_hh[j, j]
+            high[j] += sign
+            field_high += sign * s_hh[:, j]
+            field_low += sign * s_lh[:, j]
+        log_weights = -(energy_high + energies_low - low.dot(field_low))
+        largest = log_weights.max()
+        logsum = np.logaddexp(logsum, largest + np.log(
+                                    np.sum(np.exp(log_weights - largest))))
+        if out is not None:
+            out[i - first if output == 'array' else chunk] = log_weights
+    if output not in (None, 'array'):
+        out.flush()
+        out = None
+    return first, last, logsum, out
+
+
+def _log_weight_blocks(w, b, output, nprocesses, chunk_neurons):
+    """Yield the results of _log_weights_block for all states of the network
+            (w, b), in nprocesses processes. Daemonic processes, e.g. the
+            persistent workers of worker.py, can not start a pool and
+            compute all blocks themselves."""
+    w = np.asarray(w, dtype=float)
+    b = np.asarray(b, dtype=float)
+    n = len(b)
+    n_low = min(n, chunk_neurons)
+    nchunks = 2**(n - n_low)
+    nblocks = min(nchunks, 4 * nprocesses)
+    bounds = [nchunks * k // nblocks for k in range(nblocks + 1)]
+    tasks = [((w + w.T) / 2., b, n_low, first, last, output)
+             for first, last in zip(bounds[:-1], bounds[1:])]
+    if nprocesses > 1 and nblocks > 1 and not mp.current_process().daemon:
+        pool = mp.Pool(nprocesses)
+        try:
+            for block in pool.imap_unordered(_log_weights_block, tasks):
+                yield block
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for block in it.imap(_log_weights_block, tasks):
+            yield block
+
+
+def log_partition_function(w, b, nprocesses=1, chunk_neurons=16):
+    """Return the logarithm of the partition function of the network with
+            weights w and biases b, enumerating its states like
+            log_probabilities_for_network without keeping them.
+
+    >>> w, b = np.array([[0., 1.], [1., 0.]]), np.array([-.5, .5])
+    >>> print(round(log_partition_function(w, b), 10))
+    1.7873386717
+    """
+    return np.logaddexp.reduce([logsum for _, _, logsum, _ in
+                                _log_weight_blocks(w, b, None, nprocesses,
+                                                   chunk_neurons)])
+
+
+def log_probabilities_of_states(w, b, codes, log_z, chunksize=2**20):
+    """Return the logarithmic Boltzmann probabilities of the states codes
+            (see pack_states) of the network with weights w and biases b
+            and the logarithmic partition function log_z.
+
+    >>> w, b = np.random.randn(6, 6), np.random.randn(6)
+    >>> codes = np.array([0, 5, 63], dtype=np.uint64)
+    >>> np.allclose(log_probabilities_of_states(w, b, codes,
+    ...                                         log_partition_function(w, b)),
+    ...             log_probabilities_for_network(w, b)[codes.astype(int)])
+    True
+    """
+    w = np.asarray(w, dtype=float)
+    b = np.asarray(b, dtype=float)
+    codes = np.asarray(codes, dtype=np.uint64)
+    logp = np.empty(len(codes))
+    for start in range(0, len(codes), chunksize):
+        states = unpack_states(codes[start:start + chunksize], len(b))
+        logp[start:start + chunksize] = -_energies(states.astype(float),
+                                                   (w + w.T) / 2., b) - log_z
+    return logp
+
+
+def log_probabilities_for_network(w, b, filename=None, nprocesses=1,
+                                  chunk_neurons=16):
+    """Return the logarithmic Boltzmann probabilities of all 2**n states of
+            the network with weights w and biases b, indexed by the state
+            codes (see pack_states) like energies_for_network.
+
+    The states are enumerated in chunks of 2**chunk_neurons, in blocks of
+    chunks spread over nprocesses processes. With filename the result is
+    written to this .npy file and returned memory mapped. If only some
+    states are needed, log_partition_function and
+    log_probabilities_of_states do without the array of all of them.
+
+    >>> w, b = np.array([[0., 1.], [1., 0.]]), np.array([-.5, .5])
+    >>> np.exp(log_probabilities_for_network(w, b))
+    array([0.1674051 , 0.27600434, 0.10153632, 0.45505423])
+    >>> w, b = np.random.randn(6, 6), np.random.randn(6)
+    >>> w = w + w.T
+    >>> np.allclose(log_probabilities_for_network(w, b, chunk_neurons=2),
+    ...             np.log(probabilities_from_energies(
+    ...                                         energies_for_network(w, b))))
+    True
+    """
+    n = len(b)
+    n_low = min(n, chunk_neurons)
+    if filename is not None:
+        logp = np.lib.format.open_memmap(filename, mode='w+', dtype=float,
+                                         shape=(2**n, ))
+        del logp
+    else:
+        logp = np.empty((2**(n - n_low), 2**n_low))
+    logz = -np.inf
+    for first, last, logsum, log_weights in _log_weight_blocks(
+                    w, b, filename or 'array', nprocesses, chunk_neurons):
+        logz = np.logaddexp(logz, logsum)
+        if log_weights is not None:
+            indices = np.arange(first, last)
+            logp[indices ^ (indices >> 1)] = log_weights
+    if filename is not None:
+        logp = np.lib.format.open_memmap(filename, mode='r+')
+        for start in range(0, 2**n, 2**n_low):
+            logp[start:start + 2**n_low] -= logz
+        logp.flush()
+        del logp
+        return np.load(filename, mmap_mode='r')
+    logp -= logz
+    return logp.reshape(-1)
 
 
 def get_minimal_energy_states(weights, b):
@@ -217,8 +528,8 @@ def get_minimal_energy_states(weights, b):
     >>> get_minimal_energy_states([[0., 1.], [1., 0.]], [-.5, .5])
     array([3])
     """
-    e = energies_for_network(weights, b)
-    return np.nonzero(e == min(e))[0]
+    e = np.array(energies_for_network(weights, b))
+    return np.nonzero(e == e.min())[0]
 
 
 def probabilities_from_energies(energies):
@@ -239,9 +550,10 @@ def probabilities_from_energies(energies):
     >>> probabilities_from_energies([-1.,0.])
     [0.7310585786300049, 0.2689414213699951]
     """
-    Z = np.sum(np.exp(-e) for e in energies)
-    probabilities = [np.exp(-e) / Z for e in energies]
-    return probabilities
+    energies = np.asarray(energies, dtype=float)
+    # relative to the minimum, such that large energies do not overflow
+    weights = np.exp(energies.min() - energies)
+    return (weights / np.sum(weights)).tolist()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+"""This module provides the registry of network and analysis functions.
+
+Functions are named by identifiers like ising.create_nn_singleinitial, the
+module part names a file in the plugin folder (networks by default). A
+module is imported once, when the first of its functions is resolved, and
+under its own name, such that ising.eta and ising.analysis_mean share it.
+The registry is keyed by folder and identifier, modules of the same name in
+different folders do not shadow each other. Functions can also be
+registered directly, e.g. for tests or notebooks.
+
+Import times are recorded per module, together with the third-party
+packages the import pulled in, to keep the startup of expand and analysis
+jobs in check (see also control.py --import-report):
+    python plugins.py [--budget <seconds>] <identifier> ...
+prints the report and fails if the imports took longer than the budget.
+"""
+from __future__ import division, print_function
+
+import os
+import sys
+import imp
+import time
+
+registry = {}
+import_times = {}
+_modules = {}
+
+
+def _plugin_folder(folder):
+    directory = os.path.split(os.path.realpath(__file__))[0]
+    return os.path.join(directory, os.pardir, folder)
+
+
+def _is_installed(package):
+    """Return whether package is a third-party package (e.g. numpy)."""
+    filename = getattr(sys.modules.get(package), '__file__', None) or ''
+    return 'site-packages' in filename or 'dist-packages' in filename
+
+
+def source_file(function_identifier, folder='networks'):
+    """Return the file of the module defining function_identifier.
+
+    >>> os.path.basename(source_file('ising.create_nn_singleinitial'))
+    'ising.py'
+    """
+    modulename = function_identifier.split('.')[0]
+    return os.path.join(_plugin_folder(folder), modulename + '.py')
+
+
+def _load_module(modulename, folder='networks'):
+    """Import the module of the plugin folder once, return it."""
+    key = (folder, modulename)
+    if key not in _modules:
+        before = set(name.split('.')[0] for name in sys.modules)
+        t0 = time.time()
+        _modules[key] = imp.load_source(
+                    'plugin_{}_{}'.format(folder, modulename),
+                    source_file(modulename, folder))
+        packages = set(name.split('.')[0] for name in sys.modules) - before
+        import_times[key] = (time.time() - t0,
+                             sorted(p for p in packages if _is_installed(p)))
+    return _modules[key]
+
+
+def register(function_identifier, func, folder='networks'):
+    """Make func available as function_identifier of folder.
+
+    >>> register('test.double', lambda x: 2 * x)
+    >>> register('test.double', lambda x: 3 * x, 'experiment')
+    >>> resolve('test.double')(2), resolve('test.double', 'experiment')(2)
+    (4, 6)
+    """
+    registry[(folder, function_identifier)] = func
+
+
+def resolve(function_identifier, folder='networks'):
+    """Return the callable function_identifier=module.function of folder."""
+    key = (folder, function_identifier)
+    if key not in registry:
+        modulename, functionname = function_identifier.split('.')
+        registry[key] = getattr(_load_module(modulename, folder),
+                                functionname)
+    return registry[key]
+
+
+def report():
+    """Return the import report as list of lines, slowest module first."""
+    lines = []
+    for (folder, modulename), (seconds, packages) in sorted(
+                    import_times.items(), key=lambda item: -item[1][0]):
+        lines.append("{:>8.3f}s  {}/{}.py  {}".format(
+                        seconds, folder, modulename, " ".join(packages)))
+    lines.append("{:>8.3f}s  total".format(
+                        sum(seconds for seconds, _ in import_times.values())))
+    return lines
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 1:
+        import doctest
+        print(doctest.testmod())
+    else:
+        import argparse
+        parser = argparse.ArgumentParser(
+                            description='Import time report of plugins.')
+        parser.add_argument('identifiers', type=str, nargs='+')
+        parser.add_argument('--budget', type=float, default=None,
+                            help='fail if the imports take longer (seconds)')
+        parser.add_argument('--folder', type=str, default='networks')
+        args = parser.parse_args()
+        for identifier in args.identifiers:
+            resolve(identifier, args.folder)
+        print("\n".join(report()))
+        total = sum(seconds for seconds, _ in import_times.values())
+        if args.budget is not None and total > args.budget:
+            print("Import time {:.3f}s exceeds the budget of {}s".format(
+                                                    total, args.budget))
+            sys.exit(1)
@@ -0,0 +1,259 @@
+"""This module collects the analysis results of an experiment into a table.
+
+The table has one column per swept parameter and per analysis output. It is
+stored as npz file, such that plotting and analysis scripts only load the
+columns they need (see networks/utils.py:load_collected). Scalar outputs are
+stored as typed arrays, everything else (lists, dicts) as object arrays.
+The boolean column 'valid' marks the simulations that have an analysis, the
+analysis columns of the others are filled with nan, 0, False or ''.
+
+The simdict that some analyses store alongside their results is dropped,
+the swept parameters are already part of the table.
+
+Collecting is incremental: the columns _folder, _mtime and _size record
+which analysis file each row was read from. A new collect rereads only the
+analysis files of simulations whose status changed since the last one
+(_statusmark) and whose mtime or size differ, all other rows are copied
+from the previous table. Delete the table to force a full collect.
+"""
+from __future__ import division, print_function
+
+import os
+import numbers
+import tempfile
+import multiprocessing as mp
+
+import numpy as np
+import yaml
+
+Loader = getattr(yaml, 'CLoader', yaml.Loader)
+skipped_outputs = ('simdict', )
+
+
+def _stat(folder):
+    """Return mtime and size of the analysis file in folder."""
+    try:
+        stat = os.stat(os.path.join(folder, 'analysis'))
+    except OSError:
+        return np.nan, -1
+    return stat.st_mtime, stat.st_size
+
+
+def load_analysis(folder):
+    """Return the analysis dictionary of the simulation in folder (or None),
+            its mtime and size."""
+    try:
+        with open(os.path.join(folder, 'analysis'), 'r') as f:
+            stat = os.fstat(f.fileno())
+            return yaml.load(f, Loader=Loader), stat.st_mtime, stat.st_size
+    except Exception:
+        return None, np.nan, -1
+
+
+def _column(values, fill=None):
+    """Return values as typed array, fill marks the missing entries.
+
+    >>> _column([1, 2]).dtype == np.int64
+    True
+    >>> _column([1, 2.5]).tolist()
+    [1.0, 2.5]
+    >>> _column([1., 2.], fill=[False, True]).tolist()
+    [1.0, nan]
+    >>> _column(['exp', 'rect']).tolist()
+    [u'exp', u'rect']
+    >>> _column([[1, 2], 3]).dtype
+    dtype('O')
+    """
+    present = [v for i, v in enumerate(values) if fill is None or not fill[i]]
+    if all(isinstance(v, (bool, np.bool_)) for v in present):
+        dtype, default = bool, False
+    elif all(isinstance(v, numbers.Integral) for v in present):
+        dtype, default = np.int64, 0
+    elif all(isinstance(v, numbers.Real) for v in present):
+        dtype, default = np.float64, np.nan
+    elif all(isinstance(v, basestring) for v in present):
+        dtype, default = np.unicode_, u''
+    else:
+        dtype, default = object, None
+    if fill is not None:
+        values = [default if f else v for v, f in zip(values, fill)]
+    if dtype is object:
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+    if dtype is np.int64 and fill is not None and any(fill):
+        # missing entries are only representable as nan
+        return np.array(values, dtype=np.float64)
+    return np.array(values, dtype=dtype)
+
+
+def build_table(simparameters, analyses):
+    """Return the columns of the results table as dictionary.
+
+    Input:
+        simparameters   list    dictionaries of swept parameters per sim
+        analyses        list    analysis dictionary (or None) per sim
+
+    >>> table = build_table([{'w': 1.}, {'w': 2.}], [{'actmean': .5}, None])
+    >>> sorted(table)
+    ['actmean', 'valid', 'w']
+    >>> table['actmean'].tolist(), table['valid'].tolist()
+    ([0.5, nan], [True, False])
+    """
+    valid = [a is not None for a in analyses]
+    table = {'valid': np.array(valid, dtype=bool)}
+    for key in sorted(set(k for sp in simparameters for k in sp)):
+        table[key] = _column([sp.get(key) for sp in simparameters])
+    outputs = set(k for a in analyses if a is not None for k in a)
+    for key in sorted(outputs - set(skipped_outputs) - set(table)):
+        values = [a.get(key) if a is not None else None for a in analyses]
+        table[key] = _column(values, fill=[a is None or key not in a
+                                           for a in analyses])
+    return table
+
+
+def save_table(filename, table):
+    """Write the table to filename atomically."""
+    folder = os.path.dirname(os.path.abspath(filename))
+    fd, tmpname = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        np.savez(f, **table)
+    os.rename(tmpname, filename)
+
+
+def load_table(filename):
+    """Return the table stored in filename as dictionary of columns, None if
+            there is none (or it predates incremental collecting)."""
+    try:
+        with np.load(filename, allow_pickle=True) as table:
+            if '_folder' not in table.files:
+                return None
+            return {key: table[key] for key in table.files}
+    except (IOError, ValueError):
+        return None
+
+
+def _combine(n, parts):
+    """Return a column of length n assembled from (rows, values) parts, rows
+            not in any part are filled as missing.
+
+    >>> _combine(3, [([0], np.array([1])), ([2], np.array([2]))]).tolist()
+    [1.0, nan, 2.0]
+    >>> _combine(2, [([0, 1], np.array([1])), ([1], np.array([.5]))]).tolist()  # noqa
+    [1.0, 0.5]
+    >>> _combine(2, [([1], np.array([u'a']))]).tolist()
+    [u'', u'a']
+    """
+    covered = np.zeros(n, dtype=bool)
+    for rows, values in parts:
+        covered[rows] = True
+    kinds = set(values.dtype.kind for rows, values in parts)
+    if kinds <= set('iuf'):
+        if kinds <= set('iu') and covered.all():
+            dtype, default = np.int64, 0
+        else:
+            dtype, default = np.float64, np.nan
+    elif kinds == set('b'):
+        dtype, default = bool, False
+    elif kinds == set('U'):
+        dtype = np.result_type(*[values.dtype for rows, values in parts])
+        default = u''
+    else:
+        dtype, default = object, None
+    column = np.empty(n, dtype=dtype)
+    column[:] = default
+    for rows, values in parts:
+        column[rows] = values
+    return column
+
+
+def collect(folders, simparameters, nprocesses=None, done=None,
+        previous=None, changed=None):
+    """Return the results table of the simulations in folders and the number
+            of analysis files read.
+
+    Input:
+        folders         list    simulation folders
+        simparameters   list    dictionaries of swept parameters per sim
+        nprocesses      int     number of processes reading analysis files
+        done            set     only these folders are read, the others
+                                    count as missing (None reads all)
+        previous        dict    table of the last collect (see load_table)
+        changed         set     folders possibly changed since previous,
+                                    None checks all of them
+    """
+    n = len(folders)
+    keys = [os.path.abspath(folder) for folder in folders]
+    previous_rows = {}
+    if previous is not None:
+        previous_rows = {f: i for i, f in enumerate(previous['_folder'])
+                                        if previous['valid'][i]}
+
+    nprocesses = nprocesses or mp.cpu_count()
+    pool = mp.Pool(nprocesses)
+    tocheck = [i for i, key in enumerate(keys) if key in previous_rows and
+               (done is None or key in done) and
+               (changed is None or key in changed)]
+    stats = pool.map(_stat, [folders[i] for i in tocheck],
+                     max(1, len(tocheck) // (8 * nprocesses)))
+    unchanged = set(i for i, (mtime, size) in zip(tocheck, stats)
+                    if previous['_mtime'][previous_rows[keys[i]]] == mtime and
+                       previous['_size'][previous_rows[keys[i]]] == size)
+
+    reused, toread = [], []
+    for i, key in enumerate(keys):
+        if done is not None and key not in done:
+            continue
+        if key in previous_rows and (i in unchanged or (changed is not None
+                                                    and key not in changed)):
+            reused.append(i)
+        else:
+            toread.append(i)
+
+    analyses = [None] * len(toread)
+    mtimes = np.full(n, np.nan)
+    sizes = np.full(n, -1, dtype=np.int64)
+    for k, (analysis, mtime, size) in enumerate(pool.imap(load_analysis,
+            [folders[i] for i in toread],
+            max(1, len(toread) // (8 * nprocesses)))):
+        analyses[k] = analysis
+        mtimes[toread[k]], sizes[toread[k]] = mtime, size
+    pool.close()
+    pool.join()
+
+    # newly read rows
+    new = build_table([simparameters[i] for i in toread], analyses)
+    newrows = np.array(toread, dtype=np.int64)[new['valid']]
+    # rows copied from the previous table
+    oldrows = np.array(reused, dtype=np.int64)
+    source = np.array([previous_rows[keys[i]] for i in reused],
+                      dtype=np.int64)
+    if len(reused):
+        mtimes[oldrows] = previous['_mtime'][source]
+        sizes[oldrows] = previous['_size'][source]
+
+    table = build_table(simparameters, [None] * n)
+    valid = np.zeros(n, dtype=bool)
+    valid[newrows] = True
+    valid[oldrows] = True
+    outputs = set(k for k in new if k not in table)
+    if len(reused):
+        outputs |= set(k for k in previous if k not in table and
+                       not k.startswith('_'))
+    for key in outputs:
+        parts = []
+        if key in new:
+            parts.append((newrows, new[key][new['valid']]))
+        if len(reused) and key in previous:
+            parts.append((oldrows, previous[key][source]))
+        table[key] = _combine(n, parts)
+    table['valid'] = valid
+    table['_folder'] = np.array(keys, dtype=np.unicode_)
+    table['_mtime'] = mtimes
+    table['_size'] = sizes
+    return table, len(toread)
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
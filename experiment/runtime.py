@@ -0,0 +1,203 @@
+"""This module provides the runtime model used for the eta of jobs.
+
+The eta functions of the networks (e.g. ising.eta) scale the number of
+neurons times the number of updates with a fixed constant. jobcontrol
+records the actual duration and resource usage of every finished job in
+runtimes.jsonl of its job folder (see jobcontrol/utils.py:record_runtime),
+jobs staged from a manifest also record the manifest and row of their
+simulation and its parameters.
+
+From these the runtime of a simulation is modelled as
+
+    log(runtime) = w . features(simdict)
+
+with the features: the log of the static eta, the log of tauref and
+indicators for synapseType, networkUpdateScheme and outputScheme. The
+weights are a least squares fit on the jobs of one cluster (the cluster
+entry of the jobcontrol config, default its slurmmode), the static eta
+functions remain the fallback while there are too few of them.
+"""
+from __future__ import division, print_function
+
+import os
+import json
+
+import numpy as np
+import yaml
+
+import utils
+
+minsamples = 20
+maxrecords = 10000
+
+
+def get_jobfolder():
+    """Return the job folder of jobcontrol (see jobcontrol/utils.py)."""
+    return os.getenv('JOB_FOLDER', os.path.expanduser('~/.jobfolder'))
+
+
+def _load_config(jobfolder):
+    try:
+        with open(os.path.join(jobfolder, 'config.yaml'), 'r') as f:
+            return yaml.load(f) or {}
+    except IOError:
+        return {}
+
+
+def get_cluster(jobfolder):
+    """Return the name under which jobcontrol records runtimes."""
+    config = _load_config(jobfolder)
+    return config.get('cluster', config.get('slurmmode', 'local'))
+
+
+def get_job_walltime(jobfolder):
+    """Return the seconds a job may run in a task of jobcontrol, its
+            maxcpuhours less the graceperiod, None if it has no limit."""
+    config = _load_config(jobfolder)
+    if config.get('maxcpuhours') is None:
+        return None
+    return (float(config['maxcpuhours']) * 3600. -
+            float(config.get('graceperiod', 120)))
+
+
+def load_records(runtimefile, cluster=None):
+    """Return the latest recorded jobs (of cluster) that ran a simulation of
+            a manifest as a whole, not in chunks."""
+    records = []
+    try:
+        with open(runtimefile, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # partially written line
+                arguments = record.get('arguments') or {}
+                if (arguments.get('row') is not None and
+                        not arguments.get('chunked') and
+                        record.get('success', True) and
+                        record['duration'] > 0. and
+                        (cluster is None or record['cluster'] == cluster)):
+                    records.append(record)
+    except IOError:
+        pass
+    return records[-maxrecords:]
+
+
+def static_eta(simdict):
+    """Return the eta of the simulation given by the eta function of its
+            network."""
+    eta_function = utils.get_function_from_name(
+                                    simdict['network']['etaFunction'])
+    return float(eta_function(simdict))
+
+
+def parameters(simdict):
+    """Return the parameters of the simulation that determine its resource
+            usage, nneurons is None if the network does not tell.
+
+    >>> simdict = {'Config': {'tauref': 100, 'nupdates': 10},
+    ...            'network': {'parameters': {'linearsize': 4,
+    ...                                       'dimension': 2}}}
+    >>> sorted(parameters(simdict).items())  # noqa
+    [('nneurons', 16), ('nupdates', 10), ('outputScheme', 'MeanActivity'), ('tauref', 100)]
+    """
+    config = simdict['Config']
+    network = simdict.get('network', {}).get('parameters') or {}
+    nneurons = network.get('nneurons')
+    if nneurons is None and 'linearsize' in network:
+        nneurons = network['linearsize'] ** network.get('dimension', 1)
+    result = {'nneurons': nneurons, 'nupdates': config.get('nupdates'),
+              'tauref': config.get('tauref'),
+              'outputScheme': config.get('output', {}).get('outputScheme',
+                                                           'MeanActivity')}
+    # values of a manifest are numpy scalars, which json can not store
+    return {key: value.item() if isinstance(value, np.generic) else value
+            for key, value in result.items()}
+
+
+def features(simdict, eta=None):
+    """Return the features of the simulation as dictionary.
+
+    >>> simdict = {'Config': {'tauref': 100, 'synapseType': 'exp',
+    ...                       'networkUpdateScheme': 'InOrder'}}
+    >>> sorted(features(simdict, eta=1.).items())  # noqa
+    [('const', 1.0), ('log_eta', 0.0), ('log_tauref', 4.605170185988092), ('networkUpdateScheme=InOrder', 1.0), ('outputScheme=MeanActivity', 1.0), ('synapseType=exp', 1.0)]
+    """
+    if eta is None:
+        eta = static_eta(simdict)
+    config = simdict['Config']
+    output = config.get('output', {})
+    result = {'const': 1.,
+              'log_eta': float(np.log(eta)),
+              'log_tauref': float(np.log(config.get('tauref', 1.)))}
+    for key, value in (
+            ('synapseType', config.get('synapseType')),
+            ('networkUpdateScheme', config.get('networkUpdateScheme')),
+            ('outputScheme', output.get('outputScheme', 'MeanActivity'))):
+        result['{}={}'.format(key, value)] = 1.
+    return result
+
+
+def fit(featurelist, durations):
+    """Return the runtime model fitted to the features and durations of
+            jobs, None if there are too few of them.
+
+    >>> sims = [{'log_eta': np.log(e), 'const': 1.} for e in range(1, 30)]
+    >>> model = fit(sims, [2. * e for e in range(1, 30)])
+    >>> round(predict(model, {'log_eta': np.log(100.), 'const': 1.}), 6)
+    200.0
+    """
+    if len(durations) < minsamples:
+        return None
+    names = sorted(set(name for f in featurelist for name in f))
+    X = np.array([[f.get(name, 0.) for name in names] for f in featurelist])
+    y = np.log(durations)
+    weights = np.linalg.lstsq(X, y, rcond=None)[0]
+    residuals = y - X.dot(weights)
+    return {'names': names, 'weights': weights.tolist(),
+            'logvar': float(np.var(residuals)),
+            'nsamples': len(durations)}
+
+
+def predict(model, simfeatures):
+    """Return the expected runtime in seconds, unknown feature values (e.g.
+            a new synapseType) do not contribute."""
+    weights = dict(zip(model['names'], model['weights']))
+    logruntime = sum(weights.get(name, 0.) * value
+                     for name, value in simfeatures.items())
+    # mean of the log-normal distribution of the runtime
+    return float(np.exp(logruntime + model['logvar'] / 2.))
+
+
+def load_model(load_simdict, jobfolder=None, cluster=None):
+    """Return the runtime model fitted on the recorded jobs of the cluster,
+            None if there are too few.
+
+    Input:
+        load_simdict    function    (manifest, row) -> simdict
+        jobfolder       string      job folder of jobcontrol (default:
+                                        $JOB_FOLDER)
+        cluster         string      default: the one of the jobcontrol
+                                        config
+    """
+    jobfolder = jobfolder or get_jobfolder()
+    cluster = cluster or get_cluster(jobfolder)
+    featurelist, durations = [], []
+    for record in load_records(os.path.join(jobfolder, 'runtimes.jsonl'),
+                               cluster):
+        arguments = record['arguments']
+        try:
+            simdict = load_simdict(str(arguments['path']), arguments['row'])
+        except (IOError, OSError, KeyError, IndexError):
+            continue  # experiment removed in the meantime
+        featurelist.append(features(simdict))
+        durations.append(record['duration'])
+    model = fit(featurelist, durations)
+    if model is not None:
+        model['cluster'] = cluster
+    return model
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
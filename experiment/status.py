@@ -0,0 +1,192 @@
+"""This module provides the status index of the simulations of an experiment.
+
+Instead of probing a success file in every simulation folder, the job
+scripts record their state (started, success, failed) in a single SQLite
+database next to the manifest. Which simulations are missing, and how many
+are in which state, are then queries on this database.
+
+Every update is a single transaction that also assigns the next sequence
+number of the database to the folder; concurrent jobs wait for the lock
+for up to timeout seconds. Keep the database on a filesystem with working
+POSIX locks, the journal mode is left at SQLite's default for this reason.
+
+Usage from a job script:
+    python status.py <statusfile> <folder> <state>
+"""
+from __future__ import division, print_function
+
+import os
+import sqlite3
+import sys
+import time
+
+STATES = ('generated', 'started', 'success', 'failed')
+timeout = 600.
+
+
+def get_statusfile(sim_folder_template):
+    """Return the status database of the experiment with the given folder
+            template."""
+    return os.path.join(os.path.dirname(sim_folder_template), 'status.sqlite')
+
+
+def _connect(statusfile):
+    connection = sqlite3.connect(statusfile, timeout=timeout)
+    with connection:
+        connection.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                           "folder TEXT PRIMARY KEY, "
+                           "row INTEGER, "
+                           "state TEXT NOT NULL, "
+                           "updated REAL NOT NULL, "
+                           "seq INTEGER)")
+        # databases of older versions
+        columns = [row[1] for row in
+                   connection.execute("PRAGMA table_info(jobs)")]
+        if 'seq' not in columns:
+            connection.execute("ALTER TABLE jobs ADD COLUMN seq INTEGER")
+            connection.execute("UPDATE jobs SET seq = rowid")
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_state "
+                           "ON jobs (state)")
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_seq "
+                           "ON jobs (seq)")
+    return connection
+
+
+def _key(folder):
+    return os.path.normpath(os.path.abspath(folder))
+
+
+# the next sequence number, evaluated for each written row within the write
+# lock of its transaction
+_nextseq = "(SELECT COALESCE(MAX(seq), 0) + 1 FROM jobs)"
+
+
+def register(statusfile, folders, rows=None):
+    """Add folders (and their manifest rows) as generated, already known
+            folders keep their state.
+
+    >>> register('teststatus.tmp', ['a', 'b'])
+    >>> sorted(counts('teststatus.tmp').items())
+    [('generated', 2)]
+    >>> os.remove('teststatus.tmp')
+    """
+    if rows is None:
+        rows = [None] * len(folders)
+    now = time.time()
+    connection = _connect(statusfile)
+    with connection:
+        connection.executemany(
+            "INSERT OR IGNORE INTO jobs (folder, row, state, updated, seq) "
+            "VALUES (?, ?, 'generated', ?, " + _nextseq + ")",
+            ((_key(f), r, now) for f, r in zip(folders, rows)))
+    connection.close()
+
+
+def update(statusfile, folder, state):
+    """Set the state of the simulation in folder.
+
+    >>> update('teststatus.tmp', 'a', 'started')
+    >>> update('teststatus.tmp', 'a', 'success')
+    >>> update('teststatus.tmp', 'b', 'failed')
+    >>> sorted(counts('teststatus.tmp').items())
+    [('failed', 1), ('success', 1)]
+    >>> os.remove('teststatus.tmp')
+    """
+    if state not in STATES:
+        raise ValueError("Unknown state {}, choose from {}".format(
+                                                            state, STATES))
+    connection = _connect(statusfile)
+    with connection:
+        cursor = connection.execute(
+            "UPDATE jobs SET state = ?, updated = ?, seq = " + _nextseq +
+            " WHERE folder = ?", (state, time.time(), _key(folder)))
+        if cursor.rowcount == 0:
+            connection.execute(
+                "INSERT INTO jobs (folder, state, updated, seq) "
+                "VALUES (?, ?, ?, " + _nextseq + ")",
+                (_key(folder), state, time.time()))
+    connection.close()
+
+
+def import_success_files(statusfile, folders):
+    """Record the state of folders from their success files, for experiments
+            run before the status index existed."""
+    now = time.time()
+    connection = _connect(statusfile)
+    with connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO jobs (folder, state, updated, seq) "
+            "VALUES (?, ?, ?, " + _nextseq + ")",
+            ((_key(f), 'success' if os.path.exists(
+                            os.path.join(f, 'success')) else 'generated', now)
+             for f in folders))
+    connection.close()
+
+
+def succeeded(statusfile):
+    """Return the set of folders that finished successfully."""
+    connection = _connect(statusfile)
+    folders = set(f for f, in connection.execute(
+                        "SELECT folder FROM jobs WHERE state = 'success'"))
+    connection.close()
+    return folders
+
+
+def missing(statusfile, folders):
+    """Return the indices of folders that did not finish successfully.
+
+    >>> update('teststatus.tmp', 'b', 'success')
+    >>> missing('teststatus.tmp', ['a', 'b', 'c'])
+    [0, 2]
+    >>> os.remove('teststatus.tmp')
+    """
+    done = succeeded(statusfile)
+    return [i for i, f in enumerate(folders) if _key(f) not in done]
+
+
+def changed_since(statusfile, mark=None):
+    """Return the set of folders updated since mark and the new mark.
+
+    Marks are sequence numbers the database assigns to every write, not
+    the clocks of the nodes writing it, which may run behind the one of
+    the collecting machine.
+
+    >>> update('teststatus.tmp', 'a', 'success')
+    >>> folders, mark = changed_since('teststatus.tmp')
+    >>> update('teststatus.tmp', 'b', 'success')
+    >>> sorted(str(os.path.basename(f)) for f in changed_since('teststatus.tmp', mark)[0])  # noqa
+    ['b']
+    >>> update('teststatus.tmp', 'a', 'failed')
+    >>> sorted(str(os.path.basename(f)) for f in changed_since('teststatus.tmp', mark)[0])  # noqa
+    ['a', 'b']
+    >>> os.remove('teststatus.tmp')
+    """
+    connection = _connect(statusfile)
+    # take the new mark first, updates in between are returned again later
+    newmark, = connection.execute(
+                    "SELECT COALESCE(MAX(seq), 0) FROM jobs").fetchone()
+    if mark is None:
+        changed = connection.execute("SELECT folder FROM jobs")
+    else:
+        changed = connection.execute(
+                    "SELECT folder FROM jobs WHERE seq > ?", (mark, ))
+    folders = set(f for f, in changed)
+    connection.close()
+    return folders, newmark
+
+
+def counts(statusfile):
+    """Return dictionary with the number of simulations in each state."""
+    connection = _connect(statusfile)
+    result = dict(connection.execute(
+                        "SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+    connection.close()
+    return {str(k): v for k, v in result.items()}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4:
+        update(*sys.argv[1:])
+    else:
+        import doctest
+        print(doctest.testmod())
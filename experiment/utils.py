@@ -1,7 +1,12 @@
 import os
 import copy
 import collections
-import imp
+import operator
+
+import numpy as np
+import yaml
+
+import plugins
 
 
 class memorize(dict):
@@ -128,59 +133,400 @@ def _getFactorKey(rule):
     return factor, key2, value2
 
 
-def apply_rules(expanded_dict, rules={}):
-    for key, rule in rules.iteritems():
+_comparisons = {'<': operator.lt, '<=': operator.le, '==': operator.eq,
+                '>=': operator.ge, '>': operator.gt}
+
+
+class Rule(object):
+    """Experiment rule, parsed once and applicable to single dictionaries as
+            well as to the columns of a ParameterGrid.
+
+    Assignment rules look like
+        Target1Key_Target2Key: [factor, Source1Key_Source2Key_Source3Key]
+    elimination rules like
+        Target1Key_Target2Key: [<, [factor,] Source1Key_Source2Key_Source3Key]
+    or
+        Target1Key_Target2Key: [<, value]
+    with any of <, <=, ==, >=, > as comparison.
+
+    >>> r = Rule('a_b', ['<', 2., 'c_d'])
+    >>> r.paths
+    [['a', 'b'], ['c', 'd']]
+    >>> r.evaluate({('a', 'b'): np.array([1, 3, 5]), ('c', 'd'): 2}.get)
+    array([ True,  True, False])
+    >>> Rule('a_b', ['==', 'rect']).paths
+    [['a', 'b']]
+    """
+    def __init__(self, key, rule):
+        self.key = key
+        self.target = key.split('_')
+        self.source = None
+        self.value = None
+        self.comparison = None
         try:
-            # factor of different value, rule looks like
-            # Target1Key_Target2Key: [factor, Source1Key_Source2Key_Source3Key]
-            factor = float(rule[0])
-            source_key = rule[1]
-            source_keys = source_key.split('_')
-            oldvalue = getFromDict(expanded_dict, *source_keys)
-            update_dict(expanded_dict, factor * oldvalue, *key.split('_'))
+            self.factor = float(rule[0])
+            self.assignment = True
+            self.source = rule[1].split('_')
         except ValueError:
-            if rule[0] == '<':
-                # elimination rule, rule looks like
-                # Target1Key_Target2Key: [<, [factor,] Source1Key_Source2Key_Source3Key]
-                # or
-                # Target1Key_Target2Key: [<, value]
-                factor, key2, value2 = _getFactorKey(rule)
-                value1 = getFromDict(expanded_dict, *key.split('_'))
-                if value2 is None:
-                    value2 = getFromDict(expanded_dict, *key2.split('_'))
-                if not value1 < factor * value2:
-                    return False
-            elif rule[0] == '<=':
-                factor, key2, value2 = _getFactorKey(rule)
-                value1 = getFromDict(expanded_dict, *key.split('_'))
-                if value2 is None:
-                    value2 = getFromDict(expanded_dict, *key2.split('_'))
-                if not value1 <= factor * value2:
-                    return False
-            elif rule[0] == '==':
-                factor, key2, value2 = _getFactorKey(rule)
-                value1 = getFromDict(expanded_dict, *key.split('_'))
-                if value2 is None:
-                    value2 = getFromDict(expanded_dict, *key2.split('_'))
-                if not value1 == factor * value2:
-                    return False
-            elif rule[0] == '>=':
-                factor, key2, value2 = _getFactorKey(rule)
-                value1 = getFromDict(expanded_dict, *key.split('_'))
-                if value2 is None:
-                    value2 = getFromDict(expanded_dict, *key2.split('_'))
-                if not value1 >= factor * value2:
-                    return False
-            elif rule[0] == '>':
-                factor, key2, value2 = _getFactorKey(rule)
-                value1 = getFromDict(expanded_dict, *key.split('_'))
-                if value2 is None:
-                    value2 = getFromDict(expanded_dict, *key2.split('_'))
-                if not value1 > factor * value2:
-                    return False
+            self.assignment = False
+            # unknown comparisons never eliminate anything
+            self.comparison = _comparisons.get(rule[0])
+            self.factor, key2, self.value = _getFactorKey(rule)
+            if self.value is None:
+                self.source = key2.split('_')
+
+    def __repr__(self):
+        return 'Rule({!r})'.format(self.key)
+
+    @property
+    def paths(self):
+        """List of the nested key paths the rule reads or writes."""
+        if self.source is None:
+            return [self.target]
+        return [self.target, self.source]
+
+    def evaluate(self, get):
+        """Return the assigned value or the elimination mask.
+
+        get(path) has to return the value at the tuple path, either a scalar
+        or a column of values for many simulations at once.
+        """
+        if self.source is None:
+            other = self.value
+        else:
+            other = get(tuple(self.source))
+        if self.assignment or self.factor != 1:
+            other = self.factor * other
+        if self.assignment:
+            return other
+        if self.comparison is None:
+            return True
+        return self.comparison(get(tuple(self.target)), other)
+
+    def apply(self, expanded_dict):
+        """Apply rule to expanded_dict, return False if it is eliminated.
+
+        >>> d = {'a': {'b': 1}, 'c': {'d': 2}}
+        >>> Rule('a_b', [3., 'c_d']).apply(d)
+        True
+        >>> d
+        {'a': {'b': 6.0}, 'c': {'d': 2}}
+        >>> Rule('a_b', ['<', 'c_d']).apply(d)
+        False
+        >>> Rule('a_b', ['>=', 3., 'c_d']).apply(d)
+        True
+        """
+        result = self.evaluate(lambda path: getFromDict(expanded_dict, *path))
+        if self.assignment:
+            update_dict(expanded_dict, result, *self.target)
+            return True
+        return bool(result)
+
+
+def compile_rules(rules):
+    """Return the list of Rules for the rules dictionary of an experiment."""
+    if isinstance(rules, list):
+        return rules
+    compiled = [Rule(key, rule) for key, rule in rules.iteritems()]
+    # assignment rules first, eliminations may read their targets
+    return sorted(compiled, key=lambda r: not r.assignment)
+
+
+def apply_rules(expanded_dict, rules={}):
+    for rule in compile_rules(rules):
+        if not rule.apply(expanded_dict):
+            return False
     return True
 
 
+def _paths_overlap(path1, path2):
+    """Return True if one of the key paths is a prefix of the other."""
+    n = min(len(path1), len(path2))
+    return list(path1[:n]) == list(path2[:n])
+
+
+def _schedule_rules(identifiers, keypositions, rules):
+    """Return the rules grouped by the expansion level they become decidable.
+
+    A rule depends on every identifier that is placed at one of the paths it
+    reads or writes, and on the dependencies of assignment rules writing to
+    those paths. Entry 0 of the output holds rules without dependencies,
+    entry i + 1 the rules whose last dependency is identifiers[i].
+
+    >>> kps = [[['a']], [['b']]]
+    >>> _schedule_rules(['x', 'y'], kps, {'a': ['<', 'b'], 'c': ['==', 'z']})
+    [[Rule('c')], [Rule('a')], []]
+    >>> _schedule_rules(['x', 'y'], kps, {'c': [2., 'a']})
+    [[], [Rule('c')], []]
+    """
+    rules = compile_rules(rules)
+    dependencies = {}
+    for rule in rules:
+        dependencies[rule] = set(
+            i for i, kps in enumerate(keypositions)
+            for kp in kps for path in rule.paths if _paths_overlap(kp, path))
+    # a rule reading the target of an assignment rule has to wait for it
+    changed = True
+    while changed:
+        changed = False
+        for rule in rules:
+            for arule in rules:
+                if arule is rule or not arule.assignment:
+                    continue
+                if not any(_paths_overlap(arule.target, p)
+                                                for p in rule.paths):
+                    continue
+                if not dependencies[arule] <= dependencies[rule]:
+                    dependencies[rule] |= dependencies[arule]
+                    changed = True
+
+    levels = [[] for _ in range(len(identifiers) + 1)]
+    for rule in rules:
+        levels[max(dependencies[rule] | set([-1])) + 1].append(rule)
+    return levels
+
+
+_missing = object()
+
+
+def iterexpanddict(dict_to_expand, expansions, rules={}):
+    """Yield copies of dict_to_expand for the kartesian product of all
+            expansions, skipping those eliminated by rules.
+
+    Same ordering as expanddict, but only one dictionary is materialised at
+    a time. Every rule is evaluated as soon as all identifiers it depends on
+    are bound, so that eliminated subtrees of the product are never built.
+
+    Input:
+        dict_to_expand: dictionary with values to replace
+        expansions: dictionary of {"identifier": [values]} tuples
+        rules: dictionary of rules, see Rule
+
+    >>> d = {'a': 'x', 'b': {'c': 'y'}}
+    >>> e = {'x': [1, 2, 3], 'y': [1, 2]}
+    >>> list(iterexpanddict(d, e, {'a': ['<', 'b_c']}))
+    [{'a': 1, 'b': {'c': 2}}]
+    >>> list(iterexpanddict(d, e, {'a': ['<=', .5, 'b_c']}))
+    [{'a': 1, 'b': {'c': 2}}]
+    >>> list(iterexpanddict(d, {'x': [1, 2]}, {'b_c': [3., 'a']}))
+    [{'a': 1, 'b': {'c': 3.0}}, {'a': 2, 'b': {'c': 6.0}}]
+    """
+    working = copy.deepcopy(dict_to_expand)
+    identifiers = list(expansions.keys())
+    keypositions = [find_key_from_identifier(working, ident)
+                                                    for ident in identifiers]
+    levels = _schedule_rules(identifiers, keypositions, rules)
+
+    def _expand(level):
+        # remember values overwritten by assignment rules, since those are not
+        # necessarily reset by the identifiers bound on deeper levels
+        overwritten = []
+        for rule in levels[level]:
+            if rule.assignment:
+                try:
+                    oldvalue = getFromDict(working, *rule.target)
+                except KeyError:
+                    oldvalue = _missing
+                overwritten.append((rule.target, oldvalue))
+        try:
+            if not all(rule.apply(working) for rule in levels[level]):
+                return
+            if level == len(identifiers):
+                yield copy.deepcopy(working)
+                return
+            for v in expansions[identifiers[level]]:
+                for kp in keypositions[level]:
+                    update_dict(working, v, *kp)
+                for d in _expand(level + 1):
+                    yield d
+        finally:
+            for keys, oldvalue in reversed(overwritten):
+                if oldvalue is _missing:
+                    parent = getFromDict(working, *keys[:-1]) \
+                                            if len(keys) > 1 else working
+                    del parent[keys[-1]]
+                else:
+                    update_dict(working, oldvalue, *keys)
+
+    return _expand(0)
+
+
+def _as_column(values):
+    """Return values as 1d ndarray, falling back to dtype object."""
+    column = np.asarray(values)
+    if column.ndim != 1:
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+    return column
+
+
+class ParameterGrid(object):
+    """Columnar representation of the kartesian product of all expansions,
+            without those eliminated by rules.
+
+    Instead of one dictionary per simulation the grid holds one column of
+    value indices per replacement identifier, plus one column per target of
+    an assignment rule. Rules are applied as array operations on the grid,
+    dictionaries are only built when iterating over it. Like in
+    iterexpanddict the product is built one identifier at a time and every
+    rule is applied as soon as the identifiers it depends on are bound, such
+    that eliminated rows are never expanded further.
+
+    >>> d = {'a': 'x', 'b': {'c': 'y'}, 'd': 1}
+    >>> grid = ParameterGrid(d, {'x': [1, 2, 3], 'y': [1, 2]})
+    >>> len(grid)
+    6
+    >>> grid.filter({'a': ['<', 'b_c'], 'd': [2., 'a']})
+    >>> len(grid)
+    1
+    >>> list(grid)
+    [{'a': 1, 'b': {'c': 2}, 'd': 2.0}]
+    >>> rules = {'a': ['<', 'b_c'], 'd': [2., 'a']}
+    >>> list(ParameterGrid(d, {'x': [1, 2, 3], 'y': [1, 2]}, rules)) == list(iterexpanddict(d, {'x': [1, 2, 3], 'y': [1, 2]}, rules))  # noqa
+    True
+    """
+    def __init__(self, dict_to_expand, expansions, rules={}):
+        self.base = copy.deepcopy(dict_to_expand)
+        self.identifiers = list(expansions.keys())
+        self.values = [list(expansions[ident]) for ident in self.identifiers]
+        self.keypositions = [find_key_from_identifier(self.base, ident)
+                                            for ident in self.identifiers]
+        # identifiers not bound yet keep index 0, no rule applied before
+        # their level depends on them
+        self.indices = np.zeros((len(self.identifiers), 1), dtype=int)
+        self.assigned = collections.OrderedDict()
+        levels = _schedule_rules(self.identifiers, self.keypositions, rules)
+        self.filter(levels[0])
+        for i, values in enumerate(self.values):
+            self._expand(i, len(values))
+            self.filter(levels[i + 1])
+
+    def _expand(self, i, n):
+        """Bind identifier i to each of its n values in every row."""
+        nrows = len(self)
+        self.indices = np.repeat(self.indices, n, axis=1)
+        self.indices[i] = np.tile(np.arange(n), nrows)
+        for path in self.assigned:
+            self.assigned[path] = np.repeat(self.assigned[path], n)
+
+    def __len__(self):
+        return self.indices.shape[1]
+
+    def column(self, path):
+        """Return the values at the nested key path for all simulations."""
+        path = tuple(path)
+        if path in self.assigned:
+            return self.assigned[path]
+        overlapping = []
+        for i, kps in enumerate(self.keypositions):
+            for kp in kps:
+                if list(kp) == list(path):
+                    return _as_column(self.values[i])[self.indices[i]]
+                if _paths_overlap(kp, path):
+                    overlapping.append(i)
+        if not overlapping:
+            return getFromDict(self.base, *path)
+        # path points to a container (or into a value) holding identifiers,
+        # assemble its content row by row
+        working = copy.deepcopy(self.base)
+        column = []
+        for row in self.indices.T:
+            for i in overlapping:
+                for kp in self.keypositions[i]:
+                    update_dict(working, self.values[i][row[i]], *kp)
+            column.append(copy.deepcopy(getFromDict(working, *path)))
+        return _as_column(column)
+
+    def _select(self, keep):
+        keep = np.ones(len(self), dtype=bool) & keep
+        self.indices = self.indices[:, keep]
+        for path in self.assigned:
+            self.assigned[path] = self.assigned[path][keep]
+
+    def filter(self, rules):
+        """Apply the (further) rules to all simulations of the grid at
+                once."""
+        for rule in compile_rules(rules):
+            result = rule.evaluate(self.column)
+            if rule.assignment:
+                column = np.empty(len(self), dtype=np.asarray(result).dtype)
+                column[:] = result
+                self.assigned[tuple(rule.target)] = column
+            else:
+                self._select(result)
+
+    def __iter__(self):
+        """Yield one expanded dictionary per remaining simulation."""
+        working = copy.deepcopy(self.base)
+        assigned = [(path, column.tolist())
+                                for path, column in self.assigned.items()]
+        for n, row in enumerate(self.indices.T.tolist()):
+            for i, kps in enumerate(self.keypositions):
+                for kp in kps:
+                    update_dict(working, self.values[i][row[i]], *kp)
+            for path, column in assigned:
+                update_dict(working, column[n], *path)
+            yield copy.deepcopy(working)
+
+    def simdict(self, row):
+        """Return the expanded dictionary of simulation number row.
+
+        >>> grid = ParameterGrid({'a': 'x', 'b': 'y'}, {'x': [1, 2], 'y': [3]})
+        >>> grid.simdict(1)
+        {'a': 2, 'b': 3}
+        """
+        simdict = copy.deepcopy(self.base)
+        for i, kps in enumerate(self.keypositions):
+            for kp in kps:
+                update_dict(simdict, self.values[i][self.indices[i, row]], *kp)
+        for path, column in self.assigned.items():
+            update_dict(simdict, column[row:row + 1].tolist()[0], *path)
+        return simdict
+
+    def save(self, filename):
+        """Write the grid as a single manifest file.
+
+        The manifest holds the shared base dictionary and the values of the
+        replacement identifiers once, as yaml header, plus one row of value
+        indices (and assigned values) per simulation.
+        """
+        header = {'base': self.base,
+                  'identifiers': self.identifiers,
+                  'values': self.values,
+                  'assigned': [list(path) for path in self.assigned]}
+        nmax = max([len(v) for v in self.values] + [1])
+        indextype = np.min_scalar_type(nmax)
+        arrays = {'assigned{}'.format(i): column
+                        for i, column in enumerate(self.assigned.values())}
+        with open(filename, 'wb') as f:
+            np.savez(f, header=np.array(yaml.dump(header)),
+                        indices=self.indices.astype(indextype), **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """Return the grid saved in the manifest filename.
+
+        >>> grid = ParameterGrid({'a': 'x', 'b': 'y'}, {'x': [1, 2], 'y': [3]})
+        >>> grid.filter({'b': [2., 'a']})
+        >>> grid.save('testfile.tmp')
+        >>> list(ParameterGrid.load('testfile.tmp')) == list(grid)
+        True
+        """
+        grid = cls.__new__(cls)
+        manifest = np.load(filename, allow_pickle=True)
+        header = yaml.load(str(manifest['header']))
+        grid.base = header['base']
+        grid.identifiers = header['identifiers']
+        grid.values = header['values']
+        grid.keypositions = [find_key_from_identifier(grid.base, ident)
+                                            for ident in grid.identifiers]
+        grid.indices = manifest['indices'].astype(int)
+        grid.assigned = collections.OrderedDict(
+            (tuple(path), manifest['assigned{}'.format(i)])
+                                for i, path in enumerate(header['assigned']))
+        return grid
+
+
 def expanddict(dict_to_expand, expansions):
     """Return a list of copies of dict_to_expand with a kartesian product of
              all expansions.
@@ -198,17 +544,7 @@ def expanddict(dict_to_expand, expansions):
     >>> expanddict(d, e)
     [{1: 'a', 2: {3: 'a', 4: 11}}, {1: 'b', 2: {3: 'b', 4: 11}}, {1: 'a', 2: {3: 'a', 4: 12}}, {1: 'b', 2: {3: 'b', 4: 12}}]
     """
-    expanded_dicts = [dict_to_expand]
-    for ident, values in expansions.iteritems():
-        keypositions = find_key_from_identifier(dict_to_expand, ident)
-        tmp = []
-        for d in expanded_dicts:
-            for v in values:
-                for kp in keypositions:
-                    update_dict(d, v, *kp)
-                tmp.append(copy.deepcopy(d))
-        expanded_dicts = tmp
-    return expanded_dicts
+    return list(iterexpanddict(dict_to_expand, expansions))
 
 
 def generate_folder_template(replacement_dictionary, expanding_dictonary,
@@ -234,16 +570,10 @@ def ensure_exist(folder):
             raise
 
 
-@memorize
 def get_function_from_name(function_identifier, folder='networks'):
-    """Return the callable function_identifier=network.function ."""
-    modulename, functionname = function_identifier.split('.')
-    directory = os.path.split(os.path.realpath(__file__))[0]
-    parentdirectory = os.path.join(directory, os.pardir)
-    module = imp.load_source('network',
-                os.path.join(parentdirectory, folder, modulename + '.py'))
-    func = getattr(module, functionname)
-    return func
+    """Return the callable function_identifier=network.function, see
+            plugins.py."""
+    return plugins.resolve(function_identifier, folder)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,154 @@
+"""This module provides a persistent worker that executes many simulations.
+
+A job script starts python twice per simulation, once to expand and once to
+analyse it. The worker instead runs expand, the sampler and the analysis of
+many simulations in one long-lived process per core, such that numpy, yaml,
+scipy and the network modules are imported only once.
+
+Usage:
+    python worker.py --binary <neuralsampler> --statusfile <status.sqlite>
+                     [--stream] [--remove <file> ...] <jobsfile>
+jobsfile has one line per job: the staged job file of jobcontrol and the
+arguments of the job as json (see control._job_arguments), separated by a
+tab. The start/finish/success markers of the staged job files are written
+like by jobcontrol/execute_taskfile.py, the cpu time and peak memory of
+each job go to <jobfile>.usage (see jobcontrol/utils.py:wait).
+"""
+from __future__ import division, print_function
+
+import os
+import sys
+import json
+import resource
+import subprocess
+import traceback
+import multiprocessing as mp
+
+import utils
+import status
+import control
+
+
+def _touch(filename):
+    with open(filename, 'a'):
+        os.utime(filename, None)
+
+
+def _preload(jobs):
+    """Import the network modules used by the jobs before forking."""
+    for path in set(arguments['path'] for jobfile, arguments in jobs):
+        row = next(arguments['row'] for jobfile, arguments in jobs
+                                            if arguments['path'] == path)
+        simdict = control._load_simdict(path, row)
+        utils.get_function_from_name(simdict['network']['problemName'])
+        utils.get_function_from_name(simdict['analysis']['analysisFunction'])
+
+
+def _usage():
+    """Return the resource usage of this process and its children."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # the peak memory is the one of the largest process up to now
+    return {'utime': own.ru_utime + children.ru_utime,
+            'stime': own.ru_stime + children.ru_stime,
+            'maxrss': max(own.ru_maxrss, children.ru_maxrss) / 1024.}
+
+
+def run_job(job, binary, statusfile, files_to_remove=(), stream=False):
+    """Expand, simulate and analyse the simulation of job, return True on
+            success. With stream the output is piped into the analysis."""
+    jobfile, arguments = job
+    folder = arguments['folder']
+    _touch(jobfile + '.start')
+    before = _usage()
+    success = False
+    with open(jobfile + 'out', 'w') as log:
+        try:
+            utils.ensure_exist(folder)
+            os.chdir(folder)
+            status.update(statusfile, folder, 'started')
+            control.expand(arguments['path'], arguments['row'])
+            if stream:
+                control.stream(arguments['path'], arguments['row'], binary,
+                               log=log)
+            else:
+                returncode = subprocess.call(
+                                [binary, os.path.join(folder, 'run.yaml')],
+                                stdout=log, stderr=subprocess.STDOUT)
+                if returncode != 0:
+                    raise RuntimeError("{} returned {}".format(binary,
+                                                               returncode))
+                control.analysis(arguments['path'], arguments['row'])
+            _touch(os.path.join(folder, 'success'))
+            status.update(statusfile, folder, 'success')
+            success = True
+        except Exception:
+            traceback.print_exc(file=log)
+            status.update(statusfile, folder, 'failed')
+        finally:
+            for fname in files_to_remove:
+                try:
+                    os.remove(os.path.join(folder, fname))
+                except OSError:
+                    pass
+    usage = _usage()
+    usage.update(utime=usage['utime'] - before['utime'],
+                 stime=usage['stime'] - before['stime'])
+    with open(jobfile + '.usage', 'w') as f:
+        json.dump(usage, f)
+    _touch(jobfile + '.finish')
+    if success:
+        _touch(jobfile + '.success')
+    return success
+
+
+def _run_job(argdict):
+    return run_job(**argdict)
+
+
+def run_jobs(jobs, binary, statusfile, files_to_remove=(), nprocesses=None,
+        stream=False):
+    """Run jobs in nprocesses persistent workers, return the number of
+            successful ones."""
+    _preload(jobs)
+    pool = mp.Pool(nprocesses or int(os.getenv('SLURM_CPUS_ON_NODE', '1')))
+    results = pool.imap_unordered(_run_job, [
+                    {'job': job, 'binary': binary, 'statusfile': statusfile,
+                     'files_to_remove': files_to_remove, 'stream': stream}
+                    for job in jobs])
+    nsuccess = sum(results)
+    pool.close()
+    pool.join()
+    return nsuccess
+
+
+def read_jobs(jobsfile):
+    jobs = []
+    with open(jobsfile, 'r') as f:
+        for line in f:
+            if line.strip():
+                jobfile, arguments = line.rstrip('\n').split('\t', 1)
+                # json returns unicode, keep the yaml files free of it
+                arguments = {str(k): str(v) if isinstance(v, unicode) else v
+                             for k, v in json.loads(arguments).items()}
+                jobs.append((jobfile, arguments))
+    return jobs
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Persistent worker.')
+    parser.add_argument('jobsfile', type=str)
+    parser.add_argument('--binary', type=str, required=True)
+    parser.add_argument('--statusfile', type=str, required=True)
+    parser.add_argument('--remove', type=str, nargs='*', default=[])
+    parser.add_argument('--nprocesses', '-n', type=int, default=None)
+    parser.add_argument('--stream', action='store_true',
+                        help='pipe the output into the analysis')
+    args = parser.parse_args()
+
+    jobs = read_jobs(args.jobsfile)
+    nsuccess = run_jobs(jobs, args.binary, args.statusfile, args.remove,
+                        args.nprocesses, args.stream)
+    print("Finished {} of {} jobs successfully".format(nsuccess, len(jobs)))
+    sys.exit(0 if nsuccess == len(jobs) else 1)
@@ -2,56 +2,56 @@
 
 import sys
 import os
-import subprocess
 
+import yaml
 
-def restage_jobfile(jobfile):
-    with open(jobfile, 'r') as f:
-        content = f.readlines()
-    # restore only original content
-    eta = content[0].strip()
-    cwd = content[1].strip()
-    content = content[2:]
-    # recreate original file
-    with open(jobfile + 'run', 'w') as f:
-        f.write("".join(content))
-    # add original file to staged jobs
-    subprocess.call(['jobcontrol.py', 'a', jobfile, eta, cwd])
+import utils
+import jobqueue
 
 
 taskfile = sys.argv[1]
-
-with open(taskfile, 'r') as f:
-    jobfiles = [line.strip() for line in f]
-
-readded = 0
-for jobfile in jobfiles:
-    if not os.path.exists(jobfile):
-        print("Something bad happened, can't find {} anymore.".format(jobfile))
-    elif not os.path.exists(jobfile + '.start'):
+taskname = os.path.split(taskfile)[1]
+jobfolder = utils.get_jobfolder()
+queuefile = os.path.join(jobfolder, 'queue.sqlite')
+jobsubmitted = os.path.join(jobfolder, 'submitted')
+try:
+    with open(os.path.join(jobfolder, 'config.yaml'), 'r') as f:
+        config = yaml.load(f) or {}
+except IOError:
+    config = {}
+maxattempts = int(config.get('maxattempts', 3))
+retrybackoff = float(config.get('retrybackoff', 60))
+
+jobs = jobqueue.select(queuefile, task=taskname)
+
+restage = []
+retry = []
+for job in jobs:
+    jobfile = os.path.join(jobsubmitted, str(job['id']))
+    if job['state'] == 'submitted':
         print("Never started {} for some reason. Restaging".format(jobfile))
-        restage_jobfile(jobfile)
-        readded += 1
-    elif (os.path.exists(jobfile + '.start') and
-            not os.path.exists(jobfile + '.finish')):
-        print("{}, did not finish for some reason. "
-                                    "Restaging".format(jobfile))
-        restage_jobfile(jobfile)
-        readded += 1
-    elif (os.path.exists(jobfile + '.start') and
-            os.path.exists(jobfile + '.finish') and
-            not os.path.exists(jobfile + '.success')):
-        print("{}, did not succeed for some reason. "
-                                    "Do not restage.".format(jobfile))
+        restage.append(job['id'])
+    elif job['state'] == 'started':
+        # the task was killed while the job ran, counts as failed attempt
+        print("{}, did not finish for some reason (attempt {} of {}). "
+              "Restaging".format(jobfile, job['attempts'] + 1, maxattempts))
+        retry.append(job['id'])
+    elif job['state'] == 'failed':
+        print("{}, did not succeed ({}). "
+              "Do not restage.".format(jobfile, job['reason']))
     else:
         print("Finished {} successfully (return code zero)".format(jobfile))
-        os.remove(jobfile + '.start')
-        os.remove(jobfile + '.finish')
-        os.remove(jobfile + '.success')
-        os.remove(jobfile + 'run')
-        os.remove(jobfile)
+        if os.path.exists(jobfile + 'run'):
+            os.remove(jobfile + 'run')
+jobqueue.restage(queuefile, restage)
+quarantined = jobqueue.retry(queuefile, retry, 'killed with the task',
+                             maxattempts, retrybackoff)
+for jobid in quarantined:
+    print("Job {} failed {} times, quarantined "
+          "(see jobcontrol.py quarantine)".format(jobid, maxattempts))
 
 os.remove(taskfile)
 os.remove(taskfile + 'started')
 os.remove(taskfile + 'finished')
-print("Readded {} out of {} jobs.".format(readded, len(jobfiles)))
+print("Readded {} out of {} jobs.".format(
+                    len(restage) + len(retry) - len(quarantined), len(jobs)))
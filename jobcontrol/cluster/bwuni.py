@@ -74,3 +74,51 @@ def submit_task(config, tasklistfile):
         raise
 
     utils.touch(moabfile + jobid.strip())
+
+
+arraystub = """#!/bin/bash
+
+#MSUB -q verylong
+#MSUB -l nodes=1:ppn={ncpus}
+#MSUB -l walltime={eta}
+#MSUB -t {name}[0-{last}]
+
+taskfile=$(sed -n "$((MOAB_JOBARRAYINDEX + 1))p" {indexfile})
+python {jobcontrolfolder}/execute_taskfile.py "$taskfile" &&
+
+/usr/bin/mv "$taskfile"* {donetasksfolder}
+"""
+
+
+def submit_array(config, tasklistfiles):
+    """Submit the tasks as one array job, whose task i executes the i-th of
+            the tasklistfiles, and return its job id.
+
+    Input:
+        config:         dict with the configuration of jobcontrol, the
+                            command submitcommand replaces msub
+        tasklistfiles:  list of taskfiles to be executed
+    """
+    eta = int(float(config['maxcpuhours']) * 3600.)
+    jobcontrolfolder = utils.get_parentdirectory(__file__)
+    # not starting with the name of a task, whose files are moved when done
+    indexfile = os.path.join(os.path.dirname(tasklistfiles[0]),
+                             'array_' + os.path.basename(tasklistfiles[0]))
+    with open(indexfile, 'w') as f:
+        f.write(''.join(t + '\n' for t in tasklistfiles))
+    moabfile = indexfile + '.moab'
+    with open(moabfile, 'w') as f:
+        f.write(arraystub.format(ncpus=config['ncpus'], eta=eta,
+                                 name=os.path.basename(tasklistfiles[0]),
+                                 last=len(tasklistfiles) - 1,
+                                 indexfile=indexfile,
+                                 jobcontrolfolder=jobcontrolfolder,
+                                 donetasksfolder=jobcontrol.donetasksfolder))
+
+    # ensure that the filesystem is up to date
+    time.sleep(1.)
+
+    jobid = subprocess.check_output([config.get('submitcommand', 'msub'),
+                                     moabfile]).strip()
+    utils.touch(indexfile + '.' + jobid)
+    return jobid
@@ -0,0 +1,66 @@
+#! /usr/bin/env python
+
+"""Local stand-in for sbatch and msub to test the array submission.
+
+It runs the array tasks of the submitted job script one after another on
+this machine, with the task index in SLURM_ARRAY_TASK_ID and
+MOAB_JOBARRAYINDEX and the output of each in slurm-<jobid>_<index>.out,
+and answers like the scheduler the directives come from:
+
+    jobcontrol.py c submitcommand <path>/fakescheduler.py
+"""
+from __future__ import print_function
+
+import os
+import re
+import sys
+import subprocess
+
+
+def parse_directives(script):
+    """Return the dialect (sbatch or msub), the task indices and the number
+            of cpus of the job script.
+
+    >>> parse_directives('#SBATCH -c 4\\n#SBATCH --array=0-2\\n')
+    ('sbatch', [0, 1, 2], 4)
+    >>> parse_directives('#MSUB -l nodes=1:ppn=2\\n#MSUB -t x[0-1]\\n')
+    ('msub', [0, 1], 2)
+    >>> parse_directives('echo 1\\n')
+    ('sbatch', [None], 1)
+    """
+    dialect = 'msub' if '#MSUB' in script else 'sbatch'
+    indices = [None]
+    ncpus = 1
+    array = (re.search(r'^#SBATCH --array=(\d+)-(\d+)', script, re.M) or
+             re.search(r'^#MSUB -t \S*\[(\d+)-(\d+)\]', script, re.M))
+    if array:
+        indices = list(range(int(array.group(1)), int(array.group(2)) + 1))
+    cpus = (re.search(r'^#SBATCH -c (\d+)', script, re.M) or
+            re.search(r'^#MSUB -l nodes=\d+:ppn=(\d+)', script, re.M))
+    if cpus:
+        ncpus = int(cpus.group(1))
+    return dialect, indices, ncpus
+
+
+def submit(scriptfile):
+    """Run all tasks of the job script, return the job id."""
+    with open(scriptfile, 'r') as f:
+        dialect, indices, ncpus = parse_directives(f.read())
+    jobid = os.getpid()
+    for index in indices:
+        env = dict(os.environ, SLURM_CPUS_ON_NODE=str(ncpus))
+        if index is not None:
+            env.update(SLURM_ARRAY_TASK_ID=str(index),
+                       MOAB_JOBARRAYINDEX=str(index))
+        with open('slurm-{}_{}.out'.format(jobid, index), 'w') as out:
+            subprocess.call(['bash', scriptfile], env=env, stdout=out,
+                            stderr=subprocess.STDOUT)
+    return dialect, jobid
+
+
+if __name__ == "__main__":
+    dialect, jobid = submit(sys.argv[-1])
+    if dialect == 'sbatch':
+        print("Submitted batch job {}".format(jobid))
+    else:
+        print("\n{}".format(jobid))
@@ -30,3 +30,41 @@ def submit_task(config, tasklistfile):
                                     tasklistfile=tasklistfile)
     subprocess.check_output(['sbatch', '-c', ncpus, '-p', 'simulation',
                                 '--wrap', jobcommand])
+
+
+arraystub = """#!/bin/bash
+#SBATCH -c {ncpus}
+#SBATCH -p simulation
+#SBATCH --array=0-{last}
+
+taskfile=$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" {indexfile})
+python {jobcontrolfolder}/execute_taskfile.py "$taskfile"
+"""
+
+
+def submit_array(config, tasklistfiles):
+    """Submit the tasks as one array job, whose task i executes the i-th of
+            the tasklistfiles, and return its job id.
+
+        Input:
+            config:         dict with the configuration of jobcontrol, the
+                                command submitcommand replaces sbatch
+            tasklistfiles:  list of taskfiles to be executed
+    """
+    jobcontrolfolder = utils.get_parentdirectory(__file__)
+    # not starting with the name of a task, whose files are moved when done
+    indexfile = os.path.join(os.path.dirname(tasklistfiles[0]),
+                             'array_' + os.path.basename(tasklistfiles[0]))
+    with open(indexfile, 'w') as f:
+        f.write(''.join(t + '\n' for t in tasklistfiles))
+    with open(indexfile + '.sh', 'w') as f:
+        f.write(arraystub.format(ncpus=config['ncpus'],
+                                 last=len(tasklistfiles) - 1,
+                                 indexfile=indexfile,
+                                 jobcontrolfolder=jobcontrolfolder))
+    output = subprocess.check_output([config.get('submitcommand', 'sbatch'),
+                                      indexfile + '.sh'])
+    # Submitted batch job <id>
+    jobid = output.split()[-1]
+    utils.touch(indexfile + '.' + jobid)
+    return jobid
@@ -0,0 +1,303 @@
+#! /usr/bin/env python
+
+"""This module provides the daemon executing the staged jobs of the queue
+on a single machine.
+
+It keeps up to localcores jobs running (default: all cores), longest first,
+and starts a job only while localmemory MB (default: no limit) suffice for
+the running jobs and the new one, each taking the largest resident memory
+a job reached so far (or more if it uses more). With localmemory it runs a
+single job until the first one finished and its memory is known. Jobs
+staged while it runs are picked up as well. Its state is written to
+daemon.json in the job folder:
+
+    python daemon.py run [-n cores] [-m MB]
+    python daemon.py status
+    python daemon.py stop
+
+Stopping terminates the running jobs (killing them if they still run
+killtimeout seconds later) and restages them. Jobs that fail or are
+killed by a signal from elsewhere (e.g. the out of memory killer) are
+retried after retrybackoff seconds up to maxattempts times (see
+jobcontrol.py) and quarantined then.
+"""
+from __future__ import division, print_function
+
+import os
+import sys
+import json
+import time
+import signal
+import subprocess
+import multiprocessing as mp
+
+import yaml
+
+import utils
+import jobqueue
+
+jobfolder = utils.get_jobfolder()
+queuefile = os.path.join(jobfolder, 'queue.sqlite')
+jobsubmitted = os.path.join(jobfolder, 'submitted')
+statusfile = os.path.join(jobfolder, 'daemon.json')
+runtimefile = os.path.join(jobfolder, 'runtimes.jsonl')
+taskname = 'daemon'
+interval = .2
+# seconds between SIGTERM and SIGKILL of the running jobs when stopping
+killtimeout = 10.
+
+
+def _load_config():
+    try:
+        with open(os.path.join(jobfolder, 'config.yaml'), 'r') as f:
+            return yaml.load(f) or {}
+    except IOError:
+        return {}
+
+
+def group_memory(pgids):
+    """Return the resident memory in MB of the processes of each of the
+            process groups, empty if /proc is not available.
+
+    >>> group_memory([os.getpgrp()])[os.getpgrp()] > 0.
+    True
+    """
+    pagesize = os.sysconf('SC_PAGE_SIZE')
+    memory = dict((pgid, 0.) for pgid in pgids)
+    try:
+        pids = [pid for pid in os.listdir('/proc') if pid.isdigit()]
+    except OSError:
+        return {}
+    for pid in pids:
+        try:
+            with open('/proc/{}/stat'.format(pid), 'r') as f:
+                stat = f.read()
+        except IOError:
+            continue  # finished in the meantime
+        # the fields after the command name, which may contain spaces
+        fields = stat[stat.rindex(')') + 2:].split()
+        pgid = int(fields[2])
+        if pgid in memory:
+            memory[pgid] += int(fields[21]) * pagesize / 2.**20
+    return memory
+
+
+def read_status():
+    """Return the state of the running daemon, None if there is none."""
+    try:
+        with open(statusfile, 'r') as f:
+            status = json.load(f)
+        os.kill(status['pid'], 0)
+    except (IOError, ValueError, OSError):
+        return None
+    return status
+
+
+class Daemon(object):
+    def __init__(self, ncores, maxmemory=None):
+        self.ncores = ncores
+        self.maxmemory = maxmemory
+        config = _load_config()
+        self.cluster = config.get('cluster', 'local')
+        self.maxattempts = int(config.get('maxattempts', 3))
+        self.retrybackoff = float(config.get('retrybackoff', 60))
+        self.running = {}  # pid -> (job, process, worker)
+        self.peakmemory = {}  # pid -> MB
+        self.jobmemory = None  # MB, unknown until a job finished
+        self.memory = 0.
+        self.finished = []
+        self.counts = {}
+        self.stopped = False
+        self.started = time.time()
+
+    def start_job(self, job):
+        jobfile = os.path.join(jobsubmitted, str(job['id']))
+        worker = utils.worker_template(job)
+        env = None
+        if worker:
+            # a worker job runs alone on its core and writes <jobfile>out
+            with open(jobfile + 'list', 'w') as f:
+                f.write(jobfile + '\t' + worker[1].strip() + '\n')
+            with open(jobfile + 'run', 'w') as f:
+                f.write(worker[1])
+            args = ['bash', worker[0], jobfile + 'list']
+            stdout = open(jobfile + 'log', 'w')
+            env = dict(os.environ, SLURM_CPUS_ON_NODE='1')
+        else:
+            with open(jobfile + 'run', 'w') as f:
+                f.write(utils.render_job(job['script'].splitlines(True)))
+            args = ['bash', jobfile + 'run']
+            stdout = open(jobfile + 'out', 'w')
+        process = subprocess.Popen(args, cwd=job['cwd'], stdout=stdout,
+                                   env=env, preexec_fn=os.setsid)
+        stdout.close()
+        self.running[process.pid] = (job, process, worker)
+        self.peakmemory[process.pid] = 0.
+
+    def finish_job(self, pid, returncode, usage, terminated=False):
+        job, process, worker = self.running.pop(pid)
+        self.jobmemory = max(self.jobmemory or 0., self.peakmemory.pop(pid))
+        jobfile = os.path.join(jobsubmitted, str(job['id']))
+        job['finished'] = time.time()
+        success = returncode == 0
+        if worker:
+            if os.path.exists(jobfile + 'list'):
+                os.remove(jobfile + 'list')
+            success, started, finished, workerusage = (
+                                            utils.collect_markers(jobfile))
+            usage = workerusage or usage
+            if success is not None:
+                job['started'], job['finished'] = started, finished
+                terminated = False
+        if terminated or (not worker and returncode == os.EX_TEMPFAIL):
+            # stopped, or stopped itself at a checkpoint to continue later
+            jobqueue.restage(queuefile, [job['id']])
+            return
+        if not success:
+            if returncode < 0:
+                reason = 'killed by signal {}'.format(-returncode)
+            elif worker:
+                reason = 'failed in worker'
+            else:
+                reason = 'exit {}'.format(returncode)
+            jobqueue.retry(queuefile, [job['id']], reason, self.maxattempts,
+                           self.retrybackoff)
+            return
+        jobqueue.complete(queuefile, job['id'], True, job['started'],
+                          job['finished'])
+        utils.record_runtime(job, runtimefile, self.cluster, True, usage)
+        os.remove(jobfile + 'run')
+        self.finished.append(job['finished'])
+
+    def measure_memory(self):
+        memory = group_memory(list(self.running))
+        for pid, used in memory.items():
+            self.peakmemory[pid] = max(self.peakmemory[pid], used)
+            if self.jobmemory is not None:
+                self.jobmemory = max(self.jobmemory, self.peakmemory[pid])
+        self.memory = sum(memory.values())
+
+    def memory_allows_start(self):
+        if self.maxmemory is None:
+            return True
+        self.measure_memory()
+        # a single job runs in any case, and alone until one finished
+        if not self.running:
+            return True
+        if self.jobmemory is None:
+            return False
+        # jobs that just started did not allocate their memory yet
+        reserved = sum(max(used, self.jobmemory)
+                       for used in self.peakmemory.values())
+        return reserved + self.jobmemory <= self.maxmemory
+
+    def write_status(self):
+        now = time.time()
+        # throughput of the last hour, or since the start if shorter
+        window = min(3600., now - self.started)
+        recent = [t for t in self.finished if t > now - 3600.]
+        status = {'pid': os.getpid(), 'started': self.started,
+                  'updated': now, 'ncores': self.ncores,
+                  'maxmemory': self.maxmemory,
+                  'running': sorted(job['id'] for job, p, w
+                                    in self.running.values()),
+                  'memory': self.memory,
+                  'finished': len(self.finished),
+                  'throughput': len(recent) / window * 3600. if window else 0.,
+                  'queue': self.counts}
+        with open(statusfile + '.tmp', 'w') as f:
+            json.dump(status, f)
+        os.rename(statusfile + '.tmp', statusfile)
+
+    def stop(self, signum=None, frame=None):
+        self.stopped = True
+
+    def run(self):
+        # jobs of a daemon that did not stop cleanly
+        unfinished = [job['id'] for job in jobqueue.select(queuefile,
+                                                           task=taskname)
+                      if job['state'] in ('submitted', 'started')]
+        jobqueue.restage(queuefile, unfinished)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        lastupdate = 0.
+        while not self.stopped:
+            for pid in list(self.running):
+                returncode, usage = utils.wait(pid, os.WNOHANG)
+                if returncode is not None:
+                    self.finish_job(pid, returncode, usage)
+            while (len(self.running) < self.ncores and
+                   self.memory_allows_start()):
+                job = jobqueue.claim_next(queuefile, taskname)
+                if job is None:
+                    break
+                self.start_job(job)
+            if time.time() - lastupdate > 5. * interval:
+                self.measure_memory()
+                self.counts = jobqueue.counts(queuefile)
+                self.write_status()
+                lastupdate = time.time()
+            time.sleep(interval)
+
+        for pid in list(self.running):
+            try:
+                os.killpg(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        killtime = time.time() + killtimeout
+        while self.running:
+            for pid in list(self.running):
+                returncode, usage = utils.wait(pid, os.WNOHANG)
+                if returncode is not None:
+                    self.finish_job(pid, returncode, usage, terminated=True)
+                elif time.time() > killtime:
+                    # ignores SIGTERM
+                    try:
+                        os.killpg(pid, signal.SIGKILL)
+                    except OSError:
+                        pass
+            time.sleep(interval)
+        os.remove(statusfile)
+
+
+def print_status(status):
+    if status is None:
+        print("No daemon is running")
+        return
+    print("Daemon {pid} running on {ncores} cores since {since:.0f}s".format(
+                        since=time.time() - status['started'], **status))
+    print("  running jobs: {}, {:.0f} MB (limit {})".format(
+                        len(status['running']), status['memory'],
+                        status['maxmemory']))
+    print("  finished jobs: {finished}, {throughput:.1f} per hour".format(
+                        **status))
+    print("  queue: " + ", ".join("{} {}".format(state,
+                                                 status['queue'].get(state, 0))
+                                  for state in jobqueue.STATES))
+
+
+if __name__ == "__main__":
+    import argparse
+    config = _load_config()
+    parser = argparse.ArgumentParser(description='Local job daemon.')
+    parser.add_argument('action', choices=['run', 'status', 'stop'])
+    parser.add_argument('--ncores', '-n', type=int,
+                        default=int(config.get('localcores',
+                                               mp.cpu_count())))
+    parser.add_argument('--memory', '-m', type=float,
+                        default=config.get('localmemory'),
+                        help='MB the running jobs may use')
+    args = parser.parse_args()
+
+    status = read_status()
+    if args.action == 'status':
+        print_status(status)
+    elif args.action == 'stop':
+        if status is not None:
+            os.kill(status['pid'], signal.SIGTERM)
+            print("Stopping daemon {}".format(status['pid']))
+    elif status is not None:
+        print("Daemon {} is running already".format(status['pid']))
+        sys.exit(1)
+    else:
+        Daemon(args.ncores, args.memory and float(args.memory)).run()
@@ -6,48 +6,240 @@ import os
 import sys
 import datetime
 import time
+import signal
+import threading
+
+import yaml
 
 import utils
+import jobqueue
+
+jobfolder = utils.get_jobfolder()
+queuefile = os.path.join(jobfolder, 'queue.sqlite')
+jobsubmitted = os.path.join(jobfolder, 'submitted')
+runtimefile = os.path.join(jobfolder, 'runtimes.jsonl')
+try:
+    with open(os.path.join(jobfolder, 'config.yaml'), 'r') as f:
+        config = yaml.load(f)
+except IOError:
+    config = {}
+cluster = config.get('cluster', config.get('slurmmode', 'local'))
+# seconds between SIGTERM and SIGKILL of jobs running at the deadline
+killtimeout = 10.
+# jobs failing this often are quarantined instead of restaged
+maxattempts = int(config.get('maxattempts', 3))
+# seconds a failed job waits before its first retry, doubled for each further
+retrybackoff = float(config.get('retrybackoff', 60))
+
+
+def _terminate(pid, terminated, done):
+    terminated.append(pid)
+    try:
+        os.killpg(pid, signal.SIGTERM)
+        if not done.wait(killtimeout) and not done.is_set():
+            os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass  # finished in the meantime
+
+
+def call(args, **kwargs):
+    """Run args like subprocess.call, but terminate it with all of its
+            children at the deadline. Return the return code (None if it
+            was terminated) and the resource usage (see utils.wait)."""
+    process = subprocess.Popen(args, preexec_fn=os.setsid, **kwargs)
+    if deadline == float('inf'):
+        return utils.wait(process.pid)
+    terminated = []
+    done = threading.Event()
+    timer = threading.Timer(deadline - time.time(), _terminate,
+                            [process.pid, terminated, done])
+    timer.daemon = True
+    timer.start()
+    ret_value, usage = utils.wait(process.pid)
+    done.set()
+    timer.cancel()
+    return None if terminated else ret_value, usage
+
+
+def finish_job(job, success, usage, started=None, finished=None,
+               reason=None):
+    """Complete the job in the queue and record its runtime and usage."""
+    job['started'] = started or job['started']
+    job['finished'] = finished or time.time()
+    jobqueue.complete(queuefile, job['id'], success, job['started'],
+                      job['finished'], reason)
+    utils.record_runtime(job, runtimefile, cluster, success, usage)
+
+
+def retry_jobs(ids, reason):
+    """Restage the jobs ids for another attempt, or quarantine them if they
+            used up their attempts."""
+    for jobid in jobqueue.retry(queuefile, ids, reason, maxattempts,
+                                retrybackoff):
+        print("Job {} failed {} times ({}), quarantined".format(
+                                                jobid, maxattempts, reason))
+
+
+def execute_job(jobid):
+    """Claim the job and run it if it can finish before the deadline."""
+    job = jobqueue.claim(queuefile, jobid)
+    if job is None:
+        print("Job {} is not submitted (anymore), skip it".format(jobid))
+        return
+    if time.time() + job['eta'] > deadline:
+        print("Job {} can not finish before the deadline, "
+              "restaging".format(jobid))
+        jobqueue.restage(queuefile, [jobid])
+        return
+    run_job(job)
 
 
-def execute_jobfile(jobfile):
-    utils.touch(jobfile + '.start')
+def run_job(job):
+    """Run the claimed job, the script and output are kept in
+            submitted/<id>run and <id>out."""
+    jobid = job['id']
+    jobfile = os.path.join(jobsubmitted, str(jobid))
     try:
-        with open(jobfile, 'r') as f:
-            content = f.readlines()
-        # strip added content from file
-        # eta = content[0].strip()
-        cwd = content[1].strip()
-        content = content[2:]
-        # recreate original file
+        content = utils.render_job(job['script'].splitlines(True))
         with open(jobfile + 'run', 'w') as f:
-            f.write("".join(content))
+            f.write(content)
 
         time.sleep(.1)
 
-        print("".join(content))
+        print(content)
 
         stdoutfile = open(jobfile + 'out', 'w')
-        ret_value = subprocess.call(['bash', jobfile + 'run'], cwd=cwd,
-                                     stdout=stdoutfile)
-        utils.touch(jobfile + '.finish')
-        if ret_value == 0:
-            utils.touch(jobfile + '.success')
+        ret_value, usage = call(['bash', jobfile + 'run'], cwd=job['cwd'],
+                                stdout=stdoutfile)
+        if ret_value is None:
+            print("Terminated job {} at the deadline, "
+                  "restaging".format(jobid))
+            retry_jobs([jobid], 'timeout')
+        elif ret_value == os.EX_TEMPFAIL:
+            # stopped with a checkpoint, the next run continues from it
+            print("Job {} stopped at a checkpoint, restaging the next "
+                  "chunk".format(jobid))
+            jobqueue.restage(queuefile, [jobid])
+        elif ret_value < 0:
+            # killed from outside, e.g. by the out of memory killer
+            print("Job {} was killed by signal {}, "
+                  "restaging".format(jobid, -ret_value))
+            retry_jobs([jobid], 'killed by signal {}'.format(-ret_value))
+        elif ret_value:
+            print("Job {} exited with {}, restaging".format(jobid, ret_value))
+            retry_jobs([jobid], 'exit {}'.format(ret_value))
+        else:
+            finish_job(job, True, usage)
     except Exception as e:
         # FIXME: Improve error handling
         print("{} found exception {}".format(datetime.datetime.now(), e))
-        utils.touch(jobfile + '.finish')
+        jobqueue.complete(queuefile, jobid, False,
+                          reason='exception {}'.format(e))
 
 
-# read file with the task scripts
+def split_worker_jobs(jobids):
+    """Return the jobs to run as scripts and the jobs to run by persistent
+            workers, grouped by their template and working directory."""
+    scriptjobs = []
+    workerjobs = {}
+    scripts = dict((job['id'], job) for job in jobqueue.select(
+                                                    queuefile, 'submitted'))
+    for jobid in jobids:
+        job = scripts.get(jobid)
+        worker = job and utils.worker_template(job)
+        if worker:
+            key = (worker[0], job['cwd'])
+            workerjobs.setdefault(key, []).append((jobid, worker[1]))
+        else:
+            scriptjobs.append(jobid)
+    return scriptjobs, workerjobs
+
+
+def execute_workerjobs(templatefile, cwd, jobs, listfile, env=None):
+    """Run the claimed jobs, given as (job, arguments), with one call of the
+            worker template.
+
+    The worker reports on the jobs with the markers <jobfile>.start, .finish,
+    .success and .usage, which are moved into the queue afterwards. Jobs it
+    did not finish before the deadline are retried.
+    """
+    with open(listfile, 'w') as f:
+        for job, arguments in jobs:
+            jobfile = os.path.join(jobsubmitted, str(job['id']))
+            f.write(jobfile + '\t' + arguments.strip() + '\n')
+            with open(jobfile + 'run', 'w') as run:
+                run.write(arguments)
+    terminated = False
+    if jobs:
+        terminated = call(['bash', templatefile, listfile], cwd=cwd,
+                          env=env)[0] is None
+    os.remove(listfile)
+    for job, arguments in jobs:
+        success, started, finished, usage = utils.collect_markers(
+                            os.path.join(jobsubmitted, str(job['id'])))
+        if success:
+            finish_job(job, success, usage, started, finished)
+        elif success is not None:
+            retry_jobs([job['id']], 'failed in worker')
+        elif terminated:
+            retry_jobs([job['id']], 'timeout')
+
+
+def pull_jobs(lane):
+    """Run staged jobs until none of them fits into the remaining walltime
+            anymore, longest first."""
+    # a worker job runs alone on its lane
+    env = dict(os.environ, SLURM_CPUS_ON_NODE='1')
+    while True:
+        job = jobqueue.claim_next(queuefile, taskname,
+                                  deadline - time.time())
+        if job is None:
+            return
+        worker = utils.worker_template(job)
+        if worker:
+            execute_workerjobs(worker[0], job['cwd'], [(job, worker[1])],
+                               taskfile + 'worker{}'.format(lane), env)
+        else:
+            run_job(job)
+
+
+# read file with '#walltime <seconds>' and the ids of the jobs of the task,
+# or '#pull <seconds>' for tasks that take staged jobs from the queue until
+# their walltime is used
 taskfile = sys.argv[1]
+taskname = os.path.split(taskfile)[1]
 utils.touch(taskfile + 'started')
 with open(taskfile, 'r') as f:
-    jobfiles = [line.strip() for line in f]
-
+    lines = [line for line in f if line.strip()]
 nproc = int(os.getenv('SLURM_CPUS_ON_NODE', '1'))
-pool = mp.Pool(nproc)
-pool.map(execute_jobfile, jobfiles)
+
+# jobs still running at the deadline are terminated and restaged, such that
+# this task is done before the batch system kills it
+deadline = float('inf')
+if lines and lines[0].startswith('#'):
+    deadline = (os.path.getmtime(taskfile + 'started') +
+                float(lines[0].split()[1]) -
+                float(config.get('graceperiod', 120)))
+
+if lines and lines[0].startswith('#pull '):
+    pool = mp.Pool(nproc)
+    pool.map(pull_jobs, range(nproc), 1)
+else:
+    jobids, workerjobs = split_worker_jobs([int(line) for line in lines
+                                            if not line.startswith('#')])
+
+    for i, ((templatefile, cwd), jobs) in enumerate(workerjobs.items()):
+        jobs = [(jobqueue.claim(queuefile, jobid), arguments)
+                for jobid, arguments in jobs]
+        jobs = [(job, arguments) for job, arguments in jobs
+                if job is not None]
+        execute_workerjobs(templatefile, cwd, jobs,
+                           taskfile + 'worker{}'.format(i))
+
+    pool = mp.Pool(nproc)
+    # start the jobs in the order of the taskfile, each as soon as a process
+    # is free, as assumed by the packing of jobcontrol.py
+    pool.map(execute_job, jobids, 1)
 pool.close()
 pool.join()
 # for debug purposes use
@@ -11,12 +11,17 @@ import sys
 import datetime
 import errno
 import shutil
+import hashlib
+import json
+import heapq
 
 import utils
+import jobqueue
+import daemon
 import cluster.bwuni
 import cluster.heidelberg
 
-jobfolder = os.getenv('JOB_FOLDER', os.path.expanduser('~/.jobfolder'))
+jobfolder = utils.get_jobfolder()
 utils.ensure_exist(jobfolder)
 jobconfigfile = os.path.join(jobfolder, 'config.yaml')
 # TODO: fix empty config
@@ -32,6 +37,31 @@ except IOError as e:
 #   maxhours    number of hours a job must not exceed
 #   ncpus       number of cpus a job may allocate
 #   slurmmode   local, bwuni, heidelberg
+#   packing     longest_first (default) packs the jobs longest first onto
+#                   the ncpus lanes of each task, sequential fills tasks
+#                   in staging order until their cpu hours are exceeded,
+#                   pull submits as many tasks as longest_first needs but
+#                   their ncpus lanes take the longest staged job that
+#                   still fits into the remaining walltime from the queue
+#                   until none is left (see execute_taskfile.py)
+#   graceperiod seconds before the end of the walltime at which
+#                   execute_taskfile.py terminates and restages the running
+#                   jobs of a task (default 120)
+#   maxattempts number of times the job of a simulation may fail, be killed
+#                   or be terminated at the deadline before it is
+#                   quarantined instead of restaged (default 3), restaged
+#                   jobs run alone in a task
+#   retrybackoff    seconds a restaged job waits before it is due again,
+#                   doubled with each further attempt (default 60)
+#   localcores  number of jobs the local daemon runs at once (default: all
+#                   cores, see daemon.py)
+#   localmemory MB the jobs of the local daemon may use (default: no limit)
+#   arrayjobs   if true, bwuni and heidelberg submit the tasks of each
+#                   execute as one array job
+#   submitcommand   replaces sbatch or msub of the array jobs, e.g. with
+#                   cluster/fakescheduler.py to run them locally
+#   cluster     name under which the runtimes of the jobs are recorded in
+#                   runtimes.jsonl (default: slurmmode)
 jobstage  = os.path.join(jobfolder, 'stage')
 utils.ensure_exist(jobstage)
 jobsubmmited = os.path.join(jobfolder, 'submitted')
@@ -40,38 +70,33 @@ jobtasklists = os.path.join(jobfolder, 'tasklists')
 utils.ensure_exist(jobtasklists)
 donetasksfolder = os.path.join(jobfolder, 'donetasks')
 utils.ensure_exist(donetasksfolder)
+jobtemplates = os.path.join(jobfolder, 'templates')
+utils.ensure_exist(jobtemplates)
+queuefile = os.path.join(jobfolder, 'queue.sqlite')
+runtimefile = os.path.join(jobfolder, 'runtimes.jsonl')
 
 
 # job specification
-# a time estimate and a bash-script containing all the information
+# a time estimate, a working directory and a bash-script containing all the
+# information, stored in the job queue (see jobqueue.py). For jobs generated
+# from a parametric template (see add_jobs) the script is
+#   #template <template file>
+#   <arguments of this job as json>
+# Task files in tasklists list their walltime and the ids of their jobs
+# (see execute_taskfile.py), the rendered script and the output of a running
+# job are submitted/<id>run and <id>out. A job script exiting with
+# EX_TEMPFAIL (75) stopped at a checkpoint and is staged again to run its
+# next chunk.
 
 
 def action_reset(args):
-    i = 0
-    for filename in os.listdir(jobsubmmited):
-        if filename.endswith('.success'):
-            basename = os.path.join(jobsubmmited, filename.split('.')[0])
-            endings = ['run', '.start', '.finish', '.success']
-            i += 1
-            for end in endings:
-                filepath = basename + end
-                if not os.path.exists(filepath):
-                    print("Didn't find {}, something "
-                            "weird happened".format(filepath))
-                else:
-                    os.remove(filepath)
-            os.remove(basename)
-    print("Removed {} completed jobs".format(i))
-    if args[0] == 'hard':
-        for filename in os.listdir(jobsubmmited):
-            if not (filename.endswith('.start') or
-                    filename.endswith('.finish') or
-                    filename.endswith('.success') or
-                    filename.endswith('out') or
-                    filename.endswith('run')):
-                shutil.move(os.path.join(jobsubmmited, filename), jobstage)
-            elif not filename.endswith('out'):
-                os.remove(os.path.join(jobsubmmited, filename))
+    n = jobqueue.remove(queuefile, 'success')
+    print("Removed {} completed jobs".format(n))
+    if args and args[0] == 'hard':
+        unfinished = [job['id'] for state in ('submitted', 'started')
+                      for job in jobqueue.select(queuefile, state)]
+        jobqueue.restage(queuefile, unfinished)
+        print("Restaged {} submitted jobs".format(len(unfinished)))
         for dirpath, dirnames, filenames in os.walk(jobtasklists):
             for filename in filenames:
                 os.remove(os.path.join(dirpath, filename))
@@ -94,23 +119,75 @@ def action_config(args):
                                                 utils.get_value(config, *key)))
 
 
+def _makespan(etas, nlanes):
+    """Return the runtime of a task whose jobs are started in the given order
+            on nlanes parallel lanes, each as soon as a lane is free.
+
+    >>> _makespan([3., 2., 2., 1.], 2)
+    4.0
+    """
+    lanes = [0.] * nlanes
+    for eta in etas:
+        heapq.heapreplace(lanes, lanes[0] + eta)
+    return max(lanes)
+
+
+def _pack_longest_first(jobs, nlanes, walltime):
+    """Return tasks of (jobs, eta), each job is placed longest first on the
+            least loaded of nlanes lanes in all tasks where it still fits in
+            the walltime, a new task is opened if it fits nowhere.
+
+    Within a task the jobs are in the order execute_taskfile.py has to start
+    them for this schedule.
+
+    >>> _pack_longest_first([('a', 1.), ('b', 3.), ('c', 2.), ('d', 2.)],
+    ...                     2, 4.)
+    [(['b', 'c', 'd', 'a'], 8.0)]
+    >>> [t[0] for t in _pack_longest_first([('a', 3.), ('b', 3.)], 1, 4.)]
+    [['a'], ['b']]
+    """
+    lanes = []  # heap of (load, task, lane)
+    tasks = []
+    for name, eta in sorted(jobs, key=lambda job: -job[1]):
+        if lanes and lanes[0][0] + eta <= walltime:
+            load, task, lane = heapq.heappop(lanes)
+        else:
+            task, load, lane = len(tasks), 0., 0
+            tasks.append(([], 0.))
+            for other in range(1, nlanes):
+                heapq.heappush(lanes, (0., task, other))
+        tasks[task] = (tasks[task][0] + [name], tasks[task][1] + eta)
+        heapq.heappush(lanes, (load + eta, task, lane))
+    return tasks
+
+
 def _package_jobs_to_tasks():
     cpusecseta = int(config['ncpus']) * float(config['maxcpuhours']) * 3600.
     tasks = []
 
-    filenames = os.listdir(jobstage)
-    print("Found {} jobs to execute.".format(len(filenames)))
+    jobs = jobqueue.staged(queuefile)
+    etas = dict(jobs)
+    print("Found {} jobs to execute.".format(len(jobs)))
+    if config.get('packing') != 'pull':
+        # jobs killed in an earlier attempt get a task with all of its cpus
+        # and memory for themselves
+        retried = jobqueue.staged(queuefile, retried=True)
+        tasks = [([jobid], eta) for jobid, eta in retried]
+        jobs = jobqueue.staged(queuefile, retried=False)
+        if retried:
+            print("Packaged {} retried jobs alone.".format(len(retried)))
+
+    if config.get('packing', 'longest_first') in ('longest_first', 'pull'):
+        tasks += _pack_longest_first(jobs, int(config['ncpus']),
+                                     float(config['maxcpuhours']) * 3600.)
+        print("Packaged them to {} tasks.".format(len(tasks)))
+        _report_tasks(tasks, etas)
+        return tasks
 
     currenteta = 0.
     currenttask = []
-    for i, f in enumerate(filenames):
-        if i % 10000 == 0:
-            print("{} {}/{} done".format(datetime.datetime.now(),
-                                                i, len(filenames)))
-
-        eta = float(f.split('_')[1])
-
-        currenttask.append(f)
+    for jobid, eta in jobs:
+        currenttask.append(jobid)
         currenteta += eta
         if currenteta > cpusecseta:
             tasks.append((currenttask, currenteta))
@@ -120,39 +197,128 @@ def _package_jobs_to_tasks():
     if len(currenttask) > 0:
         tasks.append((currenttask, currenteta))
     print("Packaged them to {} tasks.".format(len(tasks)))
+    _report_tasks(tasks, etas)
 
     return tasks
 
 
+def _report_tasks(tasks, etas):
+    """Print expected makespan and utilization of the requested walltime of
+            each task, etas maps the job ids to their eta."""
+    nlanes = int(config['ncpus'])
+    walltime = float(config['maxcpuhours']) * 3600.
+    used = 0.
+    for i, (jobs, eta) in enumerate(tasks):
+        makespan = _makespan([etas[jobid] for jobid in jobs], nlanes)
+        used += eta
+        print("Task {}: {} jobs, makespan {:.2f}h of {:.2f}h walltime, "
+              "utilization {:.1%}{}".format(i, len(jobs), makespan / 3600.,
+                    walltime / 3600., eta / (nlanes * walltime),
+                    " (exceeds walltime)" if makespan > walltime else ""))
+    if tasks:
+        print("Expected utilization of all tasks: {:.1%}".format(
+                                    used / (len(tasks) * nlanes * walltime)))
+
+
 def _submit_task(task):
-    """
+    """Return the name of the task file listing those jobs of the task that
+            are still staged, None if another submitter took all of them.
 
     task: tuple with
-            - list of staged files
+            - list of staged job ids
             - eta
     """
     unique_name = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
     taskfilename = os.path.join(jobtasklists, unique_name)
+    jobids = jobqueue.submit(queuefile, task[0], unique_name)
+    if not jobids:
+        return None
     with open(taskfilename, 'w') as f:
-        for jobfile in task[0]:
-            shutil.move(os.path.join(jobstage, jobfile), jobsubmmited)
-            #  shutil.copy(os.path.join(jobstage, jobfile), jobsubmmited)
-            f.write(os.path.join(jobsubmmited,
-                                 os.path.split(jobfile)[1]) + '\n')
+        f.write('#walltime {}\n'.format(
+                                float(config['maxcpuhours']) * 3600.))
+        f.write(''.join('{}\n'.format(jobid) for jobid in jobids))
+    return taskfilename
+
+
+def _is_set(key):
+    """Return whether the flag key is set in the config, also if it was set
+            to the string true with 'jobcontrol.py c'."""
+    return str(config.get(key, False)).lower() in ('true', '1', 'yes')
+
+
+def _submit_pull_task():
+    """Return the name of a task file of a task pulling its jobs from the
+            queue for the walltime of maxcpuhours."""
+    unique_name = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+    taskfilename = os.path.join(jobtasklists, unique_name)
+    with open(taskfilename, 'w') as f:
+        f.write('#pull {}\n'.format(float(config['maxcpuhours']) * 3600.))
     return taskfilename
 
 
 def action_execute(args):
+    """Run or submit the staged jobs packed into tasks, see packing.
+
+    A failing job script is retried with the exit status as reason and
+    quarantined after maxattempts, in a local task as well as in the daemon:
+
+    >>> import tempfile, time
+    >>> env = dict(os.environ, JOB_FOLDER=tempfile.mkdtemp())
+    >>> with open(os.path.join(env['JOB_FOLDER'], 'config.yaml'), 'w') as f:
+    ...     yaml.dump({'maxcpuhours': .5, 'ncpus': 1, 'slurmmode': 'local',
+    ...                'maxattempts': 2, 'retrybackoff': 0}, f)
+    >>> def run(script, *args):
+    ...     return subprocess.Popen([sys.executable, os.path.join(
+    ...         os.path.dirname(os.path.abspath(__file__)), script)] +
+    ...         list(args), env=env, stdout=open(os.devnull, 'w'))
+    >>> queue = os.path.join(env['JOB_FOLDER'], 'queue.sqlite')
+    >>> jobqueue.add(queue, [(1., env['JOB_FOLDER'], 'exit 3')])
+    1
+    >>> run('jobcontrol.py', 'e').wait(), jobqueue.counts(queue)
+    (0, {'staged': 1})
+    >>> run('jobcontrol.py', 'e').wait(), jobqueue.counts(queue)
+    (0, {'quarantined': 1})
+    >>> jobqueue.add(queue, [(1., env['JOB_FOLDER'], 'exit 4')])
+    1
+    >>> process = run('daemon.py', 'run', '-n', '1')
+    >>> timeout = time.time() + 60.
+    >>> while (jobqueue.counts(queue).get('quarantined') != 2 and
+    ...        time.time() < timeout):
+    ...     time.sleep(.1)
+    >>> process.terminate(), process.wait()
+    (None, 0)
+    >>> [(job['state'], job['reason'], job['attempts'])
+    ...  for job in jobqueue.select(queue)]
+    [(u'quarantined', u'exit 3', 2), (u'quarantined', u'exit 4', 2)]
+    >>> shutil.rmtree(env['JOB_FOLDER'])
+    """
+    if config['slurmmode'] == 'local' and daemon.read_status() is not None:
+        print("The local daemon executes the {} staged jobs".format(
+                            jobqueue.counts(queuefile).get('staged', 0)))
+        return
+    if config['slurmmode'] == 'local':
+        # jobs of local tasks that were interrupted
+        # may restart already running tasks, use with care.
+        unfinished = [job['id'] for state in ('submitted', 'started')
+                      for job in jobqueue.select(queuefile, state)]
+        if unfinished:
+            jobqueue.restage(queuefile, unfinished)
+            print("Restaged {} jobs of failed tasks".format(len(unfinished)))
+
     tasks = _package_jobs_to_tasks()
-    taskfilenames = [_submit_task(task) for task in tasks]
+    if config.get('packing') == 'pull':
+        walltime = float(config['maxcpuhours']) * 3600.
+        toolong = [jobid for jobid, eta in jobqueue.staged(queuefile)
+                   if eta > walltime]
+        if toolong:
+            print("{} jobs exceed the walltime and are never pulled".format(
+                                                                len(toolong)))
+        taskfilenames = [_submit_pull_task() for task in tasks]
+    else:
+        taskfilenames = [_submit_task(task) for task in tasks]
+        taskfilenames = [t for t in taskfilenames if t is not None]
 
     if config['slurmmode'] == 'local':
-        for f in os.listdir(jobsubmmited):
-            if not f.endswith('started') and not f.endswith('finished'):
-                # may restart aready running tasks use with care.
-                if not os.path.exists(f + 'finished'):
-                    taskfilenames.prepend(os.path.join(jobsubmmited, f))
-                    print("Added {} as an failed task".format(f))
         os.environ['SLURM_NPROCS'] = '1'
         for taskfilename in taskfilenames:
             # print(taskfilename)
@@ -163,15 +329,71 @@ def action_execute(args):
         # resubmit tasks
         # taskfilenames = cluster.bwuni.clean_taskfolder(jobtasklists) +
         #                                     taskfilenames
+        if _is_set('arrayjobs') and taskfilenames:
+            jobid = cluster.bwuni.submit_array(config, taskfilenames)
+            print("Submitted {} tasks as array job {}".format(
+                                                len(taskfilenames), jobid))
+            return
         for taskfilename in taskfilenames:
             cluster.bwuni.submit_task(config, taskfilename)
     elif config['slurmmode'] == 'heidelberg':
+        if _is_set('arrayjobs') and taskfilenames:
+            jobid = cluster.heidelberg.submit_array(config, taskfilenames)
+            print("Submitted {} tasks as array job {}".format(
+                                                len(taskfilenames), jobid))
+            return
         for taskfilename in taskfilenames:
             cluster.heidelberg.submit_task(config, taskfilename)
 
 
+def _format_eta(eta):
+    try:
+        return str(int(float(eta) + 1.))
+    except ValueError:
+        raise ValueError("Eta must be specified in seconds.")
+
+
+def add_job(script, cwd, eta):
+    """Stage the bash script (content) to be executed in cwd, eta is the
+            estimated runtime in seconds."""
+    if not os.path.isdir(cwd):
+        raise OSError(errno.ENOTDIR, "The specified working directory "
+                      "{} does not exist.".format(cwd))
+    jobqueue.add(queuefile, [(_format_eta(eta), cwd, script)],
+                 maxattempts=int(config.get('maxattempts', 3)))
+
+
+def add_jobs(template, jobs):
+    """Stage many jobs generated from one parametric job template in a
+            single pass and return the number of staged jobs.
+
+    Input:
+        template    string  bash script with {placeholders} (literal braces
+                                need to be doubled)
+        jobs        list    (cwd, eta, arguments) per job, arguments is a
+                                dictionary filling the placeholders
+    """
+    templatefile = os.path.join(jobtemplates,
+                        hashlib.sha1(template.encode('utf-8')).hexdigest())
+    if not os.path.exists(templatefile):
+        with open(templatefile + '.tmp', 'w') as f:
+            f.write(template)
+        os.rename(templatefile + '.tmp', templatefile)
+
+    jobs = list(jobs)
+    for cwd in set(job[0] for job in jobs):
+        if not os.path.isdir(cwd):
+            raise OSError(errno.ENOTDIR, "The specified working directory "
+                          "{} does not exist.".format(cwd))
+    return jobqueue.add(queuefile, (
+                (_format_eta(eta), cwd, '#template {}\n{}\n'.format(
+                                        templatefile,
+                                        json.dumps(arguments, sort_keys=True)))
+                for cwd, eta, arguments in jobs),
+                maxattempts=int(config.get('maxattempts', 3)))
+
+
 def action_add(args):
-    unique_name = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
     try:
         with open(args['script'], 'r') as original:
             data = original.read()
@@ -181,18 +403,164 @@ def action_add(args):
                             "script.".format(args['script']))
             return
 
-    cwd = args['cwd']
-    if not os.path.isdir(cwd):
-        raise OSError(errno.ENOTDIR, "The specified working directory does "
-                            "not exist. Didn't add {}".format(args['script']))
-    eta = args['eta']
+    add_job(data, args['cwd'], args['eta'])
+
+
+def action_status(args):
+    counts = jobqueue.counts(queuefile)
+    for state in jobqueue.STATES:
+        print("{:>11}: {}".format(state, counts.get(state, 0)))
+    status = daemon.read_status()
+    if status is not None:
+        daemon.print_status(status)
+
+
+def action_migrate(args):
+    """Move the job files of a job folder of older versions into the queue,
+            run it once before submitting with this version while none of
+            the old tasks is executing.
+
+    Staged jobs and jobs of unfinished tasks are staged (again), finished
+    ones get the state of their markers. The files and the old task lists
+    are moved to the folder migrated.
+    """
+    migrated = os.path.join(jobfolder, 'migrated')
+    utils.ensure_exist(migrated)
+    endings = ('run', 'out', '.start', '.finish', '.success')
+    n = 0
+    for folder in (jobstage, jobsubmmited):
+        for filename in os.listdir(folder):
+            jobfile = os.path.join(folder, filename)
+            if filename.endswith(endings) or not os.path.isfile(jobfile):
+                continue
+            with open(jobfile, 'r') as f:
+                content = f.readlines()
+            state = 'staged'
+            if os.path.exists(jobfile + '.success'):
+                state = 'success'
+            elif os.path.exists(jobfile + '.finish'):
+                state = 'failed'
+            jobqueue.add(queuefile, [(content[0].strip(), content[1].strip(),
+                                      ''.join(content[2:]))], state)
+            for ending in ('', ) + endings:
+                if os.path.exists(jobfile + ending):
+                    shutil.move(jobfile + ending, migrated)
+            n += 1
+    for filename in os.listdir(jobtasklists):
+        shutil.move(os.path.join(jobtasklists, filename), migrated)
+    print("Migrated {} jobs, the old files are in {}".format(n, migrated))
+
+
+def _job_name(record):
+    arguments = record['arguments'] or {}
+    if arguments.get('row') is not None:
+        return 'row {}'.format(arguments['row'])
+    return arguments.get('folder', record['cwd'])
+
+
+def _summarize(records, ntop=3):
+    """Return the report on the resource usage of the recorded jobs of one
+            experiment as list of lines.
+
+    >>> records = [{'cwd': '/e', 'duration': 10. * i, 'eta': 10.,
+    ...             'utime': 10. * i, 'stime': 0., 'maxrss': 100.,
+    ...             'arguments': {'row': i, 'parameters': {'nneurons': 10,
+    ...                                                    'nupdates': 100}}}
+    ...            for i in range(1, 5)]
+    >>> print('\\n'.join(_summarize(records, 1)))  # noqa
+    4 jobs (0 failed), 0.03 cpu hours, 100% cpu of 0.03 wall hours
+      throughput 40.0 updates per cpu second (4 jobs)
+      peak memory median 100 MB, max 100 MB
+      slowest: row 4 40s (eta 10s)
+    """
+    failed = sum(1 for r in records if not r.get('success', True))
+    measured = [r for r in records if 'utime' in r]
+    cputime = sum(r['utime'] + r['stime'] for r in measured)
+    walltime = sum(r['duration'] for r in measured)
+    lines = ["{} jobs ({} failed), {:.2f} cpu hours, {:.0%} cpu of {:.2f} "
+             "wall hours".format(len(records), failed, cputime / 3600.,
+                                 cputime / walltime if walltime else 0.,
+                                 walltime / 3600.)]
+    updates, updatetime, n = 0., 0., 0
+    for r in measured:
+        parameters = (r['arguments'] or {}).get('parameters') or {}
+        if parameters.get('nneurons') and parameters.get('nupdates'):
+            updates += parameters['nneurons'] * parameters['nupdates']
+            updatetime += r['utime'] + r['stime']
+            n += 1
+    if updatetime:
+        lines.append("  throughput {:.1f} updates per cpu second ({} jobs)"
+                     .format(updates / updatetime, n))
+    if measured:
+        memory = sorted(r['maxrss'] for r in measured)
+        median = memory[len(memory) // 2]
+        lines.append("  peak memory median {:.0f} MB, max {:.0f} MB".format(
+                                                        median, memory[-1]))
+        outliers = sorted((r for r in measured if r['maxrss'] > 2 * median),
+                          key=lambda r: -r['maxrss'])
+        if outliers:
+            lines.append("  memory outliers ({} above twice the median): "
+                         "{}".format(len(outliers), ", ".join(
+                            "{} {:.0f} MB".format(_job_name(r), r['maxrss'])
+                            for r in outliers[:ntop])))
+    slowest = sorted(records, key=lambda r: -r['duration'])[:ntop]
+    lines.append("  slowest: " + ", ".join(
+                    "{} {:.0f}s (eta {:.0f}s)".format(_job_name(r),
+                                                      r['duration'], r['eta'])
+                    for r in slowest))
+    return lines
+
+
+def action_stats(args):
+    """Report the resource usage of the recorded jobs per experiment."""
+    ntop = int(args[0]) if args else 3
+    experiments = {}
     try:
-        eta = str(int(float(eta) + 1.))
-    except ValueError:
-        raise ValueError("Eta must be specified in seconds.")
+        with open(runtimefile, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # partially written line
+                key = (record['cluster'], record['cwd'])
+                experiments.setdefault(key, []).append(record)
+    except IOError:
+        pass
+    if not experiments:
+        print("No jobs recorded in {}".format(runtimefile))
+    for (cluster, cwd), records in sorted(experiments.items()):
+        print("{} on {}:".format(cwd, cluster))
+        for line in _summarize(records, ntop):
+            print("  " + line)
+
+
+def action_quarantine(args):
+    """List the quarantined jobs, 'release [ids]' stages them (all if no ids
+            are given) again with a fresh count of attempts."""
+    jobs = jobqueue.select(queuefile, 'quarantined')
+    if args and args[0] == 'release':
+        ids = [int(jobid) for jobid in args[1:]] or [job['id'] for job in jobs]
+        jobqueue.release(queuefile, ids)
+        print("Released {} jobs".format(
+                    len(set(ids) & set(job['id'] for job in jobs))))
+        return
+    for job in jobs:
+        firstline = (job['script'].splitlines() or [''])[0]
+        print("{id:>8} {attempts} attempts, last: {reason}\n"
+              "         {cwd}: {firstline}".format(firstline=firstline, **job))
+    print("{} jobs quarantined".format(len(jobs)))
+
 
-    with open(os.path.join(jobstage, unique_name + '_' + eta), 'w') as staged:
-        staged.write(str(eta) + '\n' + cwd + '\n' + data)
+def action_bulkadd(args):
+    """Stage the jobs listed in args['jobs'], one json line with cwd, eta
+            and arguments per job, from the template in args['template']."""
+    with open(args['template'], 'r') as f:
+        template = f.read()
+    with open(args['jobs'], 'r') as f:
+        jobs = [json.loads(line) for line in f if line.strip()]
+    n = add_jobs(template, ((job['cwd'], job['eta'], job['arguments'])
+                            for job in jobs))
+    print("Staged {} jobs".format(n))
 
 
 def parse_args_and_execute(argv=sys.argv):
@@ -205,10 +573,18 @@ def parse_args_and_execute(argv=sys.argv):
         print("Find help with 'jobcontrol.py h'")
         return
 
+    if head not in ('m', 'migrate') and os.listdir(jobstage):
+        print("Found job files of an older version in {}, move them to the "
+              "queue with 'jobcontrol.py migrate'".format(jobstage))
+
     if head in ('a', 'add'):
         fn = action_add
         args = {'script': tail[0], 'cwd': tail[1], 'eta': float(tail[2])}
 
+    elif head in ('b', 'bulkadd'):
+        fn = action_bulkadd
+        args = {'template': tail[0], 'jobs': tail[1]}
+
     elif head in ('e', 'execute'):
         fn = action_execute
         args = {}
@@ -221,6 +597,22 @@ def parse_args_and_execute(argv=sys.argv):
         fn = action_reset
         args = tail
 
+    elif head in ('s', 'status'):
+        fn = action_status
+        args = tail
+
+    elif head in ('stats', ):
+        fn = action_stats
+        args = tail
+
+    elif head in ('m', 'migrate'):
+        fn = action_migrate
+        args = tail
+
+    elif head in ('q', 'quarantine'):
+        fn = action_quarantine
+        args = tail
+
     else:
         print("""This should be a helpful message.""")
         return
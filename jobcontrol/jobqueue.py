@@ -0,0 +1,359 @@
+"""This module provides the transactional job queue of jobcontrol.
+
+Every job is a row of a single SQLite database in the job folder, holding
+its eta, working directory, script (or template reference and arguments,
+see jobcontrol.add_jobs) and state:
+
+    staged -> submitted (part of a task) -> started -> success / failed
+                                                    -> staged (retry)
+                                                    -> quarantined
+
+State changes are single transactions, such that a job is submitted with
+exactly one task and started by exactly one process, also with several
+submitters or executing tasks at once. Tasks that pull their jobs (see
+claim_next) take staged jobs directly to started. Restaging puts jobs back
+to staged. Retrying also counts the failed attempt and its reason, a job
+is quarantined instead once it reaches the maximal number of attempts.
+Attempts count per simulation, i.e. cwd and script: a job added again
+continues the count of the earlier ones. A retried job is only due again
+after a backoff that doubles with every attempt.
+Concurrent writers wait for the lock for up to timeout seconds; keep the
+job folder on a filesystem with working POSIX locks.
+"""
+from __future__ import division, print_function
+
+import os
+import sqlite3
+import time
+
+STATES = ('staged', 'submitted', 'started', 'success', 'failed',
+          'quarantined')
+timeout = 600.
+
+
+def _connect(queuefile):
+    connection = sqlite3.connect(queuefile, timeout=timeout)
+    connection.row_factory = sqlite3.Row
+    with connection:
+        connection.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                           "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                           "state TEXT NOT NULL, "
+                           "eta REAL NOT NULL, "
+                           "cwd TEXT NOT NULL, "
+                           "script TEXT NOT NULL, "
+                           "task TEXT, "
+                           "started REAL, "
+                           "finished REAL, "
+                           "updated REAL NOT NULL, "
+                           "attempts INTEGER NOT NULL DEFAULT 0, "
+                           "reason TEXT, "
+                           "notbefore REAL)")
+        # queues of older versions
+        columns = [row['name'] for row in
+                   connection.execute("PRAGMA table_info(jobs)")]
+        if 'attempts' not in columns:
+            connection.execute("ALTER TABLE jobs ADD COLUMN "
+                               "attempts INTEGER NOT NULL DEFAULT 0")
+            connection.execute("ALTER TABLE jobs ADD COLUMN reason TEXT")
+        if 'notbefore' not in columns:
+            connection.execute("ALTER TABLE jobs ADD COLUMN notbefore REAL")
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_state "
+                           "ON jobs (state)")
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_task "
+                           "ON jobs (task)")
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_state_eta "
+                           "ON jobs (state, eta)")
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_simulation "
+                           "ON jobs (cwd, script)")
+    return connection
+
+
+def add(queuefile, jobs, state='staged', maxattempts=None):
+    """Add jobs, given as (eta, cwd, script), in one transaction and return
+            their number.
+
+    The jobs continue the count of attempts of earlier jobs of the same
+    simulation, with maxattempts those that used them up are quarantined
+    right away.
+
+    >>> add('testqueue.tmp', [(10., '/tmp', 'echo 1'), (20., '/tmp', 'ls')])
+    2
+    >>> staged('testqueue.tmp')
+    [(1, 10.0), (2, 20.0)]
+    >>> retry('testqueue.tmp', [2], 'exit 1', 2)
+    []
+    >>> add('testqueue.tmp', [(20., '/tmp', 'ls')], 'failed')
+    1
+    >>> add('testqueue.tmp', [(20., '/tmp', 'ls')], maxattempts=1)
+    1
+    >>> [(job['id'], job['state'], job['attempts'])
+    ...  for job in select('testqueue.tmp') if job['script'] == 'ls']
+    [(2, u'staged', 1), (3, u'failed', 1), (4, u'quarantined', 1)]
+    >>> os.remove('testqueue.tmp')
+    """
+    if state not in STATES:
+        raise ValueError("Unknown state {}, choose from {}".format(
+                                                            state, STATES))
+    now = time.time()
+    connection = _connect(queuefile)
+    with connection:
+        cursor = connection.executemany(
+            "INSERT INTO jobs (state, eta, cwd, script, updated, attempts) "
+            "SELECT CASE WHEN COALESCE(MAX(attempts), 0) >= ? "
+            "THEN 'quarantined' ELSE ? END, ?, ?, ?, ?, "
+            "COALESCE(MAX(attempts), 0) FROM jobs "
+            "WHERE cwd = ? AND script = ?",
+            ((float('inf') if maxattempts is None else maxattempts, state,
+              float(eta), cwd, script, now, cwd, script)
+             for eta, cwd, script in jobs))
+        n = cursor.rowcount
+    connection.close()
+    return n
+
+
+def staged(queuefile, retried=None):
+    """Return (id, eta) of all staged jobs that are due in the order they
+            were added, with retried only those that failed before (True)
+            or not (False)."""
+    condition = {None: "", True: " AND attempts > 0",
+                 False: " AND attempts = 0"}[retried]
+    connection = _connect(queuefile)
+    jobs = [(row['id'], row['eta']) for row in connection.execute(
+                "SELECT id, eta FROM jobs WHERE state = 'staged' "
+                "AND COALESCE(notbefore, 0) <= ?" + condition +
+                " ORDER BY id", (time.time(), ))]
+    connection.close()
+    return jobs
+
+
+def submit(queuefile, ids, task):
+    """Assign those of the jobs ids that are still staged to task, return
+            their ids in the given order.
+
+    >>> add('testqueue.tmp', [(10., '/tmp', 'echo 1'), (20., '/tmp', 'ls')])
+    2
+    >>> submit('testqueue.tmp', [2, 1], 'task1')
+    [2, 1]
+    >>> submit('testqueue.tmp', [1], 'task2')
+    []
+    >>> os.remove('testqueue.tmp')
+    """
+    now = time.time()
+    connection = _connect(queuefile)
+    with connection:
+        connection.executemany(
+            "UPDATE jobs SET state = 'submitted', task = ?, updated = ? "
+            "WHERE id = ? AND state = 'staged'",
+            ((task, now, jobid) for jobid in ids))
+        submitted = set(row['id'] for row in connection.execute(
+                        "SELECT id FROM jobs WHERE task = ?", (task, )))
+    connection.close()
+    return [jobid for jobid in ids if jobid in submitted]
+
+
+def claim(queuefile, jobid):
+    """Mark the submitted job as started and return it as dictionary, None
+            if it was started already (or is not submitted).
+
+    >>> add('testqueue.tmp', [(10., '/tmp', 'echo 1')])
+    1
+    >>> submit('testqueue.tmp', [1], 'task1')
+    [1]
+    >>> claim('testqueue.tmp', 1)['script']
+    u'echo 1'
+    >>> claim('testqueue.tmp', 1) is None
+    True
+    >>> complete('testqueue.tmp', 1, True)
+    >>> counts('testqueue.tmp')
+    {'success': 1}
+    >>> os.remove('testqueue.tmp')
+    """
+    now = time.time()
+    connection = _connect(queuefile)
+    with connection:
+        cursor = connection.execute(
+            "UPDATE jobs SET state = 'started', started = ?, updated = ? "
+            "WHERE id = ? AND state = 'submitted'", (now, now, jobid))
+        job = None
+        if cursor.rowcount == 1:
+            job = dict(connection.execute("SELECT * FROM jobs WHERE id = ?",
+                                          (jobid, )).fetchone())
+    connection.close()
+    return job
+
+
+def claim_next(queuefile, task, maxeta=None):
+    """Start the longest staged job that is due and whose eta does not
+            exceed maxeta as part of task and return it as dictionary, None
+            if there is none.
+
+    >>> add('testqueue.tmp', [(10., '/tmp', 'a'), (30., '/tmp', 'b'),
+    ...                       (20., '/tmp', 'c')])
+    3
+    >>> claim_next('testqueue.tmp', 'task1', 25.)['script']
+    u'c'
+    >>> claim_next('testqueue.tmp', 'task1')['script']
+    u'b'
+    >>> claim_next('testqueue.tmp', 'task2', 5.) is None
+    True
+    >>> [job['task'] for job in select('testqueue.tmp', 'started')]
+    [u'task1', u'task1']
+    >>> os.remove('testqueue.tmp')
+    """
+    now = time.time()
+    connection = _connect(queuefile)
+    # take the write lock before reading, such that no other task can claim
+    # the same job in between
+    connection.isolation_level = None
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        row = connection.execute(
+            "SELECT * FROM jobs WHERE state = 'staged' AND eta <= ? "
+            "AND COALESCE(notbefore, 0) <= ? ORDER BY eta DESC, id LIMIT 1",
+            (float('inf') if maxeta is None else maxeta, now)).fetchone()
+        job = None
+        if row is not None:
+            connection.execute(
+                "UPDATE jobs SET state = 'started', task = ?, started = ?, "
+                "updated = ? WHERE id = ?", (task, now, now, row['id']))
+            job = dict(row)
+            job.update(state=u'started', task=task, started=now, updated=now)
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+    return job
+
+
+def complete(queuefile, jobid, success, started=None, finished=None,
+             reason=None):
+    """Mark the job as finished (successfully), started and finished default
+            to the time of the claim and now, reason tells why it failed."""
+    now = time.time()
+    connection = _connect(queuefile)
+    with connection:
+        connection.execute(
+            "UPDATE jobs SET state = ?, started = COALESCE(?, started), "
+            "finished = ?, updated = ?, reason = ? WHERE id = ?",
+            ('success' if success else 'failed', started,
+             finished or now, now, reason, jobid))
+    connection.close()
+
+
+def retry(queuefile, ids, reason, maxattempts, backoff=0.):
+    """Count a failed attempt of the jobs ids, restage those with less than
+            maxattempts attempts and quarantine the others. Return the ids
+            of the quarantined ones. A restaged job is due backoff seconds
+            later, twice as long after each further attempt.
+
+    >>> add('testqueue.tmp', [(10., '/tmp', 'a'), (20., '/tmp', 'b')])
+    2
+    >>> retry('testqueue.tmp', [1], 'timeout', 2, backoff=3600.)
+    []
+    >>> staged('testqueue.tmp')
+    [(2, 20.0)]
+    >>> retry('testqueue.tmp', [2], 'timeout', 2)
+    []
+    >>> staged('testqueue.tmp', retried=True)
+    [(2, 20.0)]
+    >>> retry('testqueue.tmp', [2], 'killed', 2)
+    [2]
+    >>> [(job['attempts'], job['reason']) for job in select('testqueue.tmp',
+    ...                                                     'quarantined')]
+    [(2, u'killed')]
+    >>> release('testqueue.tmp', [2])
+    >>> counts('testqueue.tmp')
+    {'staged': 2}
+    >>> staged('testqueue.tmp', retried=False)
+    [(2, 20.0)]
+    >>> os.remove('testqueue.tmp')
+    """
+    now = time.time()
+    connection = _connect(queuefile)
+    with connection:
+        connection.executemany(
+            "UPDATE jobs SET attempts = attempts + 1, reason = ?, "
+            "state = CASE WHEN attempts + 1 >= ? THEN 'quarantined' "
+            "ELSE 'staged' END, notbefore = ? + ? * (1 << attempts), "
+            "task = NULL, started = NULL, finished = NULL, updated = ? "
+            "WHERE id = ?",
+            ((reason, maxattempts, now, backoff, now, jobid)
+             for jobid in ids))
+        quarantined = set(row['id'] for row in connection.execute(
+                    "SELECT id FROM jobs WHERE state = 'quarantined'"))
+    connection.close()
+    return [jobid for jobid in ids if jobid in quarantined]
+
+
+def release(queuefile, ids):
+    """Stage the quarantined jobs ids again with a fresh count of
+            attempts of their simulations, due right away."""
+    connection = _connect(queuefile)
+    with connection:
+        connection.executemany(
+            "UPDATE jobs SET attempts = 0 WHERE EXISTS (SELECT 1 FROM jobs "
+            "AS released WHERE released.id = ? AND "
+            "released.state = 'quarantined' AND released.cwd = jobs.cwd "
+            "AND released.script = jobs.script)", ((jobid, ) for jobid in ids))
+        connection.executemany(
+            "UPDATE jobs SET state = 'staged', reason = NULL, "
+            "notbefore = NULL, updated = ? "
+            "WHERE id = ? AND state = 'quarantined'",
+            ((time.time(), jobid) for jobid in ids))
+    connection.close()
+
+
+def restage(queuefile, ids):
+    """Put the jobs ids back to staged."""
+    connection = _connect(queuefile)
+    with connection:
+        connection.executemany(
+            "UPDATE jobs SET state = 'staged', task = NULL, started = NULL, "
+            "finished = NULL, updated = ? WHERE id = ?",
+            ((time.time(), jobid) for jobid in ids))
+    connection.close()
+
+
+def select(queuefile, state=None, task=None):
+    """Return the jobs (of state and/or task) as list of dictionaries."""
+    conditions, parameters = [], []
+    if state is not None:
+        conditions.append("state = ?")
+        parameters.append(state)
+    if task is not None:
+        conditions.append("task = ?")
+        parameters.append(task)
+    query = "SELECT * FROM jobs"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    connection = _connect(queuefile)
+    jobs = [dict(row) for row in connection.execute(query + " ORDER BY id",
+                                                     parameters)]
+    connection.close()
+    return jobs
+
+
+def remove(queuefile, state):
+    """Delete all jobs in state, return their number."""
+    connection = _connect(queuefile)
+    with connection:
+        n = connection.execute("DELETE FROM jobs WHERE state = ?",
+                               (state, )).rowcount
+    connection.close()
+    return n
+
+
+def counts(queuefile):
+    """Return dictionary with the number of jobs in each state."""
+    connection = _connect(queuefile)
+    result = dict(tuple(row) for row in connection.execute(
+                        "SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+    connection.close()
+    return {str(k): v for k, v in result.items()}
+
+
+if __name__ == "__main__":
+    import doctest
+    print(doctest.testmod())
@@ -1,4 +1,5 @@
 import os
+import json
 
 
 def ensure_exist(folder):
@@ -43,3 +44,113 @@ def get_parentdirectory(filepath):
     directory = os.path.split(os.path.realpath(filepath))[0]
     parentdirectory = os.path.join(directory, os.pardir)
     return os.path.abspath(parentdirectory)
+
+
+def render_job(content):
+    """Return the bash script of a staged job given its lines without eta and
+            working directory, filling in the template if it has one.
+
+    >>> render_job(['echo 1\\n', 'echo 2\\n'])
+    'echo 1\\necho 2\\n'
+    """
+    if not content or not content[0].startswith('#template '):
+        return "".join(content)
+    with open(content[0][len('#template '):].strip(), 'r') as f:
+        template = f.read()
+    return template.format(**json.loads(content[1]))
+
+
+def worker_template(job):
+    """Return the template file and arguments of the job, a dictionary as
+            returned by jobqueue.select, if it is run by a persistent worker
+            (its template starts with #worker), otherwise None.
+
+    >>> worker_template({'script': 'echo 1\\n'}) is None
+    True
+    """
+    if not job['script'].startswith('#template '):
+        return None
+    templatefile, arguments = job['script'].splitlines()[:2]
+    templatefile = templatefile[len('#template '):].strip()
+    try:
+        with open(templatefile, 'r') as f:
+            if f.readline().startswith('#worker'):
+                return templatefile, arguments
+    except IOError:
+        pass
+    return None
+
+
+def get_jobfolder():
+    """Return the folder holding staged, submitted and finished jobs."""
+    return os.getenv('JOB_FOLDER', os.path.expanduser('~/.jobfolder'))
+
+
+def wait(pid, options=0):
+    """Wait for the child pid like os.waitpid, return its return code and
+            resource usage (None, None if it is still running with
+            os.WNOHANG).
+
+    The usage holds the user and system cpu seconds and the peak resident
+    memory in MB of the child and its waited for children.
+
+    >>> import subprocess
+    >>> process = subprocess.Popen(['true'])
+    >>> returncode, usage = wait(process.pid)
+    >>> returncode, sorted(usage)
+    (0, ['maxrss', 'stime', 'utime'])
+    """
+    pid, status, rusage = os.wait4(pid, options)
+    if pid == 0:
+        return None, None
+    if os.WIFSIGNALED(status):
+        returncode = -os.WTERMSIG(status)
+    else:
+        returncode = os.WEXITSTATUS(status)
+    # ru_maxrss is in kB on linux
+    return returncode, {'utime': rusage.ru_utime, 'stime': rusage.ru_stime,
+                        'maxrss': rusage.ru_maxrss / 1024.}
+
+
+def collect_markers(jobfile):
+    """Return the success, start and finish time and resource usage a
+            persistent worker reported for jobfile and remove its markers.
+
+    Success is None if the worker did not finish the job, the usage None if
+    it did not report it.
+    """
+    success = started = finished = usage = None
+    if os.path.exists(jobfile + '.finish'):
+        success = os.path.exists(jobfile + '.success')
+        started = os.path.getmtime(jobfile + '.start')
+        finished = os.path.getmtime(jobfile + '.finish')
+    try:
+        with open(jobfile + '.usage', 'r') as f:
+            usage = json.load(f)
+    except (IOError, ValueError):
+        pass
+    for ending in ('.start', '.finish', '.success', '.usage'):
+        if os.path.exists(jobfile + ending):
+            os.remove(jobfile + ending)
+    return success, started, finished, usage
+
+
+def record_runtime(job, runtimefile, cluster, success=True, usage=None):
+    """Append the duration and resource usage (see wait) of the finished
+            job, a dictionary as returned by jobqueue.select, as json line
+            to runtimefile.
+
+    Jobs staged from a template also record their arguments, such that the
+    runtime can be related to the simulation they ran.
+    """
+    content = job['script'].splitlines()
+    arguments = None
+    if len(content) > 1 and content[0].startswith('#template '):
+        arguments = json.loads(content[1])
+    record = {'cluster': cluster, 'cwd': job['cwd'], 'eta': job['eta'],
+              'duration': job['finished'] - job['started'],
+              'finished': job['finished'], 'arguments': arguments,
+              'success': success}
+    record.update(usage or {})
+    with open(runtimefile, 'a') as f:
+        f.write(json.dumps(record) + '\n')
@@ -104,9 +104,11 @@ def get_coercivity_from_lists(listAs, listIs, maxA):
     return (Icoerclow, Icoercup)
 
 
-def get_simdict(outfile):
-    with open(os.path.join(os.path.split(outfile)[0], 'sim.yaml'), 'r') as f:
-        simdict = yaml.load(f)
+def get_simdict(outfile, simdict=None):
+    if simdict is None:
+        with open(os.path.join(os.path.split(outfile)[0], 'sim.yaml'),
+                                                                'r') as f:
+            simdict = yaml.load(f)
     foldertemplate = simdict['folderTemplate']
     simparameterkeys = utils.get_simparameters_from_template(foldertemplate)
     flatsimdict = utils.flatten_dictionary(simdict)
@@ -117,7 +119,8 @@ def get_simdict(outfile):
     return outdict
 
 
-def hysteresis(outfile, nIpoints=100, subsampling=1, plot=False, **kwargs):
+def hysteresis(outfile, nIpoints=100, subsampling=1, plot=False,
+                simdict=None, **kwargs):
     if kwargs:
         print("Found unnecessary parameters, ignoring {}".format(kwargs))
     # get results
@@ -130,7 +133,7 @@ def hysteresis(outfile, nIpoints=100, subsampling=1, plot=False, **kwargs):
     analysisdict['remanenz'] = get_remanence_from_lists(listAs, listIs)
     analysisdict['coercivity'] = get_coercivity_from_lists(listAs, listIs,
                                                                         maxA)
-    analysisdict['simdict'] = get_simdict(outfile)
+    analysisdict['simdict'] = get_simdict(outfile, simdict)
 
     with open(os.path.join(os.path.split(outfile)[0], 'analysis'), 'w') as f:
         f.write(yaml.dump(analysisdict))
@@ -1,13 +1,13 @@
 from __future__ import division
 
-import pandas
-import yaml
 import numpy as np
 
 import matplotlib
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 
+import utils
+
 
 def borders(points):
     out = np.zeros(len(points) + 1)
@@ -41,27 +41,13 @@ def plot_ising(pdata, title):
 
 
 def analysis_ising_run(collected_data_file, plot_npoints=1000):
-    orig_data = yaml.load(open(collected_data_file, 'r'))
-
     interesting_keys = ['network_parameters_biasfactor',
                         'network_parameters_weight',
                         'network_parameters_rseed',
                         'Config_synapseType',]
     analysis_keys = ['actmean']
-    data = []
-
-    for dd in orig_data:
-        if dd['analysis'] is None:
-            continue
-        outdict = {}
-        analysisdict = dd['analysis']
-        for k in interesting_keys:
-            outdict[k] = dd[k]
-        for k in analysis_keys:
-            outdict[k] = analysisdict[k]
-        data.append(outdict)
-
-    pdata   = pandas.DataFrame(data)
+    pdata   = utils.load_collected(collected_data_file,
+                                   interesting_keys + analysis_keys)
     weights = np.array(sorted(set(pdata['network_parameters_weight'])))
 
     biaslimits = {}
@@ -6,7 +6,6 @@ import sys
 import yaml
 
 import numpy as np
-from scipy.optimize import curve_fit
 from collections import Counter
 
 
@@ -14,7 +13,7 @@ def sigma(u, u05=0., alpha=1.):
     return 1. / (1. + np.exp(-(u - u05) / alpha))
 
 
-def fit(outfile, minact=0.05, maxact=0.95, **kwargs):
+def fit(outfile, minact=0.05, maxact=0.95, simdict=None, **kwargs):
     folder = os.path.dirname(outfile)
     nspikes = Counter()
     with open(os.path.join(folder, 'output'), 'r') as f:
@@ -23,11 +22,16 @@ def fit(outfile, minact=0.05, maxact=0.95, **kwargs):
             neuronid, neuron_nspikes = line.strip().split(' ')
             nspikes[int(neuronid)] = int(neuron_nspikes)
 
-    simdict = yaml.load(open(os.path.join(folder, 'sim.yaml'), 'r'))
+    if simdict is None:
+        simdict = yaml.load(open(os.path.join(folder, 'sim.yaml'), 'r'))
     rundict = yaml.load(open(os.path.join(folder, 'run.yaml'), 'r'))
     tau = simdict['Config']['tauref']
     nsimupdates = simdict['Config']['nupdates']
-    biases = rundict['bias']
+    if 'bias' in rundict:
+        biases = rundict['bias']
+    else:
+        import binaryio
+        biases = binaryio.read_array(rundict['biasFile']).tolist()
 
     activities = [nspikes.get(i, 0) * tau / nsimupdates
                             for i in range(len(biases))]
@@ -40,6 +44,7 @@ def fit(outfile, minact=0.05, maxact=0.95, **kwargs):
                                         if ((a < maxact) and (a > minact))]
     activities = [a for a in activities if ((a < maxact) and (a > minact))]
 
+    from scipy.optimize import curve_fit
     popt, pcov = curve_fit(sigma, biases, activities)
 
     analysisdict['alpha'] = float(popt[1])
@@ -5,7 +5,6 @@ import os
 import yaml
 import itertools as it
 import numpy as np
-import scipy.stats
 
 TIMECONSTANT = 150E-9
 # helper functions
@@ -174,12 +173,14 @@ def get_energy_from_meanenergy(spikeline):
 
 
 def analysis_mean(outfile, burnin=0, subsampling=1, nupdates=None, plot=False,
-                    **kwargs):
+                    simdict=None, **kwargs):
+    import scipy.stats
     folder = os.path.join(os.path.split(outfile)[0])
 
     # get simulation parameters
-    with open(os.path.join(folder, 'sim.yaml'), 'r') as f:
-        simdict = yaml.load(f)
+    if simdict is None:
+        with open(os.path.join(folder, 'sim.yaml'), 'r') as f:
+            simdict = yaml.load(f)
     nneurons = simdict["network"]["parameters"]["linearsize"]**simdict["network"]["parameters"]["dimension"]    # noqa
 
     # get results
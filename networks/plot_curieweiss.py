@@ -1,13 +1,13 @@
 from __future__ import division
 
-import pandas
 import numpy as np
-import yaml
 
 import matplotlib
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 
+import utils
+
 
 def plot_activity(pdata, ax):
     for bo in set(pdata['network_parameters_biasoffset']):
@@ -31,12 +31,11 @@ def plot_susceptibility(pdata, ax, mean):
 
 
 def plot_cw_run(collected_data_file):
-    data = [d['analysis'] for d in yaml.load(open(collected_data_file, 'r'))
-                                            if d['analysis'] is not None]
-    for dd in data:
-        dd['temperature_values'] = dd['temperature_values'][0]
-
-    pdata = pandas.DataFrame(data)
+    pdata = utils.load_collected(collected_data_file, [
+        'Config_synapseType', 'Config_networkUpdateScheme',
+        'network_parameters_biasfactor', 'network_parameters_biasoffset',
+        'temperature_values', 'mean', 'std'])
+    pdata['temperature_values'] = [t[0] for t in pdata['temperature_values']]
 
     for synapseType in set(pdata['Config_synapseType']):
         for bf in set(pdata['network_parameters_biasfactor']):
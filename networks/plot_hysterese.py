@@ -1,12 +1,11 @@
 from __future__ import division
 
-import pandas
-import yaml
-
 import matplotlib
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 
+import utils
+
 
 def plot_activity(pdata, ax):
     xvalues = list(pdata['Is'])[0]
@@ -18,12 +17,9 @@ def plot_activity(pdata, ax):
 
 
 def plot_hysterese_run(collected_data_file):
-    data = [d['analysis'] for d in yaml.load(open(collected_data_file, 'r'))
-                                            if d['analysis'] is not None]
-    for dd in data:
-        dd.update(dd.pop('simdict'))
-
-    pdata = pandas.DataFrame(data)
+    pdata = utils.load_collected(collected_data_file, [
+        'Config_synapseType', 'network_parameters_biasfactor',
+        'network_parameters_weight', 'Is', 'As'])
 
     for synapseType in set(pdata['Config_synapseType']):
         for bf in set(pdata['network_parameters_biasfactor']):
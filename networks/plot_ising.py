@@ -1,13 +1,13 @@
 from __future__ import division
 
-import pandas
-import yaml
 import numpy as np
 
 import matplotlib
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt # noqa
 
+import utils
+
 
 def borders(points):
     out = np.zeros(len(points) + 1)
@@ -52,23 +52,8 @@ def plot_ising(pdatas, title):
 
 
 def get_pdatas(files, interesting_keys, analysis_keys):
-    pdatas = []
-    for fname in files:
-        origdata = yaml.load(open(fname, 'r'))
-        data = []
-        for dd in origdata:
-            if dd['analysis'] is None:
-                continue
-            outdict = {}
-            analysisdict = dd['analysis']
-            for k in interesting_keys:
-                outdict[k] = dd[k]
-            for k in analysis_keys:
-                outdict[k] = analysisdict[k]
-            data.append(outdict)
-        pdatas.append(pandas.DataFrame(data))
-
-    return pdatas
+    return [utils.load_collected(fname, interesting_keys + analysis_keys)
+                                                        for fname in files]
 
 
 def plot_ising_runs(filepattern):
@@ -89,27 +74,13 @@ def plot_ising_runs(filepattern):
 
 
 def plot_ising_run(collected_data_file):
-    orig_data = yaml.load(open(collected_data_file, 'r'))
-
     interesting_keys = ['network_parameters_biasfactor',
                         'network_parameters_weight',
                         'network_parameters_rseed',
                         'Config_synapseType', ]
     analysis_keys = ['actmean', 'actstd']
-    data = []
-
-    for dd in orig_data:
-        if dd['analysis'] is None:
-            continue
-        outdict = {}
-        analysisdict = dd['analysis']
-        for k in interesting_keys:
-            outdict[k] = dd[k]
-        for k in analysis_keys:
-            outdict[k] = analysisdict[k]
-        data.append(outdict)
-
-    pdata = pandas.DataFrame(data)
+    pdata = utils.load_collected(collected_data_file,
+                                 interesting_keys + analysis_keys)
     if len(set(pdata['Config_synapseType'])) != 1:
         raise ValueError('Can only deal with one synapse type')
     for rseed in set(pdata['network_parameters_rseed']):
@@ -1,13 +1,15 @@
 """This module implements the TSP problem for neural networks."""
 from __future__ import division, print_function
+import os
 import sys
 import numpy as np
 import itertools
 
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
-
 import utils
+# the state helpers of the experiment, also when not run from there
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, 'experiment'))
+import misc
 
 
 # misc functions
@@ -167,11 +169,17 @@ def get_pathlength_from_state(state, tsp_data):
     Output:
         route       list    empty if not a valid state
         distance    float   sum of all distances, inf if not valid
+
+    >>> tsp_data = [[0., 1., .5], [1., 0., .3], [.5, .3, 0.]]
+    >>> get_pathlength_from_state(np.uint64(0b001100010), tsp_data)
+    ([2, 0, 1], 1.8)
+    >>> get_pathlength_from_state(0, tsp_data)
+    ([], inf)
     """
     n_cities = len(tsp_data)
     if valid(state, n_cities) != (True, True, True):
-        return [], inf
-    if isinstance(state, int):
+        return [], np.inf
+    if isinstance(state, (int, long, np.integer)):
         state = misc.statestring_from_int(state, n_cities * n_cities)
     bstate = np.array([int(s) for s in state]).reshape((n_cities, n_cities))
     bstate = bstate.tolist()
@@ -309,7 +317,7 @@ def valid(state, n_cities):
 
 def check_validity_of_minima(W, b, verbose=False):
     n_cities = len(b)
-    minimal_states = analysis.get_minmal_energy_states(W, b)
+    minimal_states = misc.get_minimal_energy_states(W, b)
     valids = []
     column_fail = []
     row_fail = []
@@ -343,6 +351,9 @@ def check_validity_of_minima(W, b, verbose=False):
 
 
 def plot(plotname, state_freq_dict, tsp_data, nbins=30, min_frequency=40):
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+
     n_cities = len(tsp_data)
     states = [k for k, v in state_freq_dict.iteritems() if v > min_frequency]
     frequencies = [v for k, v in state_freq_dict.iteritems()
@@ -3,6 +3,8 @@ from __future__ import division, print_function
 import sys
 import collections
 
+import numpy as np
+
 
 def flatten_dictionary(d, parent_key='', sep='_'):
     """Return a flat dictionary with concatenated keys for a nested dictionary d.
@@ -30,6 +32,41 @@ def get_simparameters_from_template(foldertemplate):
     return entries
 
 
+def load_collected(filename, columns=None, valid_only=True):
+    """Return the collected results of an experiment as pandas DataFrame.
+
+    Input:
+        filename    string  results table written by control.py -c, or a
+                                collect file of the former yaml format
+        columns     list    columns to load, None loads all of them
+        valid_only  bool    drop simulations without analysis
+    """
+    import pandas
+
+    if not filename.endswith('.npz'):
+        import yaml
+        rows = []
+        for dd in yaml.load(open(filename, 'r')):
+            row = {k: v for k, v in dd.items() if k != 'analysis'}
+            row['valid'] = dd['analysis'] is not None
+            row.update(dd['analysis'] or {})
+            rows.append(row)
+        pdata = pandas.DataFrame(rows)
+        if valid_only:
+            pdata = pdata.loc[pdata['valid']]
+        return pdata if columns is None else pdata[list(columns)]
+
+    with np.load(filename, allow_pickle=True) as table:
+        if columns is None:
+            columns = [c for c in table.files
+                            if c != 'valid' and not c.startswith('_')]
+        valid = table['valid']
+        data = collections.OrderedDict(
+            (c, table[c][valid] if valid_only else table[c])
+            for c in columns)
+    return pandas.DataFrame(data)
+
+
 def double_index_to_single(x, i, n_cities):
     """Transform double index (city, position) in single index.
 
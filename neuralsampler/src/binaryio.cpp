@@ -0,0 +1,83 @@
+#include <cstring>
+#include <stdexcept>
+
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include "binaryio.h"
+
+static const char binary_magic[] = "NSBIN001";
+static const std::size_t header_size = 24;
+
+
+MappedFile::MappedFile(const std::string& filename, TBinaryArray expectedtype,
+                       std::size_t entrysize)
+{
+    fd = open(filename.c_str(), O_RDONLY);
+    if (fd < 0) {
+        throw std::runtime_error("Could not open " + filename);
+    }
+    struct stat st;
+    if (fstat(fd, &st) < 0 || (std::size_t)st.st_size < header_size) {
+        close(fd);
+        throw std::runtime_error(filename + " is not a binary array file");
+    }
+    mapsize = st.st_size;
+    mapping = mmap(NULL, mapsize, PROT_READ, MAP_PRIVATE, fd, 0);
+    if (mapping == MAP_FAILED) {
+        close(fd);
+        throw std::runtime_error("Could not map " + filename);
+    }
+    const char* header = static_cast<const char*>(mapping);
+    int64_t type;
+    std::memcpy(&type, header + 8, sizeof(int64_t));
+    std::memcpy(&nentries, header + 16, sizeof(int64_t));
+    arraytype = static_cast<TBinaryArray>(type);
+    data = header + header_size;
+    if (std::memcmp(header, binary_magic, 8) != 0 ||
+            arraytype != expectedtype || nentries < 0 ||
+            header_size + nentries * entrysize > mapsize) {
+        munmap(mapping, mapsize);
+        close(fd);
+        throw std::runtime_error(filename + " has an invalid header");
+    }
+}
+
+MappedFile::~MappedFile()
+{
+    munmap(mapping, mapsize);
+    close(fd);
+}
+
+
+std::vector<double> get_bias_from_file(const std::string& filename)
+{
+    MappedFile file(filename, Float64Array, sizeof(double));
+    const double* begin = reinterpret_cast<const double*>(file.data);
+    return std::vector<double>(begin, begin + file.nentries);
+}
+
+
+std::vector<int64_t> get_initialstate_from_file(const std::string& filename)
+{
+    MappedFile file(filename, Int64Array, sizeof(int64_t));
+    const int64_t* begin = reinterpret_cast<const int64_t*>(file.data);
+    return std::vector<int64_t>(begin, begin + file.nentries);
+}
+
+
+SparseMatrix get_weights_from_file(const std::string& filename,
+                                   std::size_t biassize)
+{
+    MappedFile file(filename, WeightTriples, sizeof(WeightTriple));
+    const WeightTriple* triples =
+                        reinterpret_cast<const WeightTriple*>(file.data);
+    try {
+        return SparseMatrix(biassize, std::vector<WeightTriple>(
+                                    triples, triples + file.nentries));
+    } catch (const std::out_of_range&) {
+        throw std::runtime_error("Weight index out of range in " + filename);
+    }
+}
@@ -0,0 +1,37 @@
+#ifndef BINARYIO_H
+#define BINARYIO_H
+
+#include <string>
+#include <vector>
+#include <cstdint>
+
+#include "sparse_matrix.h"
+
+// Binary array files as written by experiment/binaryio.py. Each file starts
+// with a 24 byte header: the magic "NSBIN001", the array type and the number
+// of entries (both int64), followed by the raw little endian entries.
+enum TBinaryArray { Float64Array, Int64Array, WeightTriples };
+
+class MappedFile
+{
+private:
+    int fd;
+    void* mapping;
+    std::size_t mapsize;
+
+public:
+    TBinaryArray arraytype;
+    int64_t nentries;
+    const char* data;
+
+    MappedFile(const std::string& filename, TBinaryArray expectedtype,
+               std::size_t entrysize);
+    ~MappedFile();
+};
+
+std::vector<double> get_bias_from_file(const std::string& filename);
+std::vector<int64_t> get_initialstate_from_file(const std::string& filename);
+SparseMatrix get_weights_from_file(
+                        const std::string& filename, std::size_t biassize);
+
+#endif // BINARYIO_H
@@ -0,0 +1,77 @@
+#define CATCH_CONFIG_MAIN
+#include "catch.hpp"
+
+#include <cstdio>
+#include <fstream>
+#include <stdexcept>
+
+#include "binaryio.h"
+
+void write_binary_file(const std::string& filename, int64_t type,
+                       int64_t nentries, const void* data, std::size_t size)
+{
+    std::ofstream f(filename, std::ios::binary);
+    f.write("NSBIN001", 8);
+    f.write(reinterpret_cast<const char*>(&type), sizeof(int64_t));
+    f.write(reinterpret_cast<const char*>(&nentries), sizeof(int64_t));
+    f.write(static_cast<const char*>(data), size);
+}
+
+SCENARIO("Binary array files") {
+
+    GIVEN("Bias file") {
+        double bias[3] = {0.5, -1., 2.};
+        write_binary_file("bias.tmp", Float64Array, 3, bias, sizeof(bias));
+
+        std::vector<double> b = get_bias_from_file("bias.tmp");
+        REQUIRE( b.size() == 3 );
+        REQUIRE( b[0] == 0.5 );
+        REQUIRE( b[1] == -1. );
+        REQUIRE( b[2] == 2. );
+
+        WHEN("Read as wrong type") {
+            REQUIRE_THROWS( get_initialstate_from_file("bias.tmp") );
+        }
+        std::remove("bias.tmp");
+    }
+
+    GIVEN("Initialstate file") {
+        int64_t state[2] = {0, 100};
+        write_binary_file("state.tmp", Int64Array, 2, state, sizeof(state));
+
+        std::vector<int64_t> s = get_initialstate_from_file("state.tmp");
+        REQUIRE( s.size() == 2 );
+        REQUIRE( s[0] == 0 );
+        REQUIRE( s[1] == 100 );
+        std::remove("state.tmp");
+    }
+
+    GIVEN("Weight file") {
+        WeightTriple triples[2] = {{0, 1, 0.5}, {1, 0, 0.25}};
+        write_binary_file("weight.tmp", WeightTriples, 2, triples,
+                          sizeof(triples));
+
+        SparseMatrix w = get_weights_from_file("weight.tmp", 2);
+        REQUIRE( w.nonzeros() == 2 );
+        REQUIRE( w.get(0, 0) == 0. );
+        REQUIRE( w.get(0, 1) == 0.5 );
+        REQUIRE( w.get(1, 0) == 0.25 );
+        REQUIRE( w.get(1, 1) == 0. );
+
+        WHEN("Indices exceed the network size") {
+            REQUIRE_THROWS( get_weights_from_file("weight.tmp", 1) );
+        }
+        std::remove("weight.tmp");
+    }
+
+    GIVEN("Truncated file") {
+        double bias[1] = {0.5};
+        write_binary_file("short.tmp", Float64Array, 3, bias, sizeof(bias));
+        REQUIRE_THROWS( get_bias_from_file("short.tmp") );
+        std::remove("short.tmp");
+    }
+
+    GIVEN("Missing file") {
+        REQUIRE_THROWS( get_bias_from_file("nonexisting.tmp") );
+    }
+}
@@ -0,0 +1,81 @@
+#include <cstdio>
+#include <cstring>
+#include <fstream>
+#include <sstream>
+#include <stdexcept>
+
+#include "checkpoint.h"
+#include "serialize.h"
+
+extern std::mt19937_64 mt_random;
+extern std::normal_distribution<double> random_normal;
+
+static const char checkpoint_magic[] = "NSCKP001";
+
+
+static void write_string(std::ostream& stream, const std::string& s)
+{
+    write_binary_vector(stream, std::vector<char>(s.begin(), s.end()));
+}
+
+static std::string read_string(std::istream& stream)
+{
+    std::vector<char> s = read_binary_vector<char>(stream);
+    return std::string(s.begin(), s.end());
+}
+
+
+void write_checkpoint(const std::string& filename, const Checkpoint& checkpoint,
+                      const Config& config, Network& net)
+{
+    // write to a temporary file first, such that a simulation killed while
+    // writing keeps its previous checkpoint
+    std::string tmpfilename = filename + ".tmp";
+    std::ofstream f(tmpfilename, std::ios::binary | std::ios::trunc);
+    f.write(checkpoint_magic, 8);
+    write_binary(f, config.nneurons);
+    write_binary(f, config.nupdates);
+    write_binary(f, config.randomSeed);
+    write_binary(f, checkpoint.nupdate);
+    write_binary(f, checkpoint.outputnumber);
+    write_binary(f, checkpoint.outputposition);
+    // the generators only guarantee their textual representation to
+    // restore them exactly, the normal distribution caches a second value
+    std::ostringstream rng;
+    rng << mt_random;
+    write_string(f, rng.str());
+    std::ostringstream normal;
+    normal << random_normal;
+    write_string(f, normal.str());
+    net.write_state(f);
+    f.close();
+    if (!f || std::rename(tmpfilename.c_str(), filename.c_str()) != 0) {
+        throw std::runtime_error("Could not write checkpoint " + filename);
+    }
+}
+
+
+Checkpoint read_checkpoint(const std::string& filename, const Config& config,
+                           Network& net)
+{
+    std::ifstream f(filename, std::ios::binary);
+    char magic[8];
+    if (!f.read(magic, 8) || std::memcmp(magic, checkpoint_magic, 8) != 0) {
+        throw std::runtime_error(filename + " is not a checkpoint");
+    }
+    if (read_binary<int64_t>(f) != config.nneurons ||
+            read_binary<int64_t>(f) != config.nupdates ||
+            read_binary<int64_t>(f) != config.randomSeed) {
+        throw std::runtime_error(filename + " belongs to another simulation");
+    }
+    Checkpoint checkpoint;
+    checkpoint.nupdate = read_binary<int64_t>(f);
+    checkpoint.outputnumber = read_binary<int64_t>(f);
+    checkpoint.outputposition = read_binary<int64_t>(f);
+    std::istringstream rng(read_string(f));
+    rng >> mt_random;
+    std::istringstream normal(read_string(f));
+    normal >> random_normal;
+    net.read_state(f);
+    return checkpoint;
+}
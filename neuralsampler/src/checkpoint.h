@@ -0,0 +1,30 @@
+#ifndef CHECKPOINT_H
+#define CHECKPOINT_H
+
+#include <string>
+#include <cstdint>
+
+#include "config.h"
+#include "network.h"
+
+// Exit code of a simulation that stopped at its walltime after writing a
+// checkpoint, EX_TEMPFAIL of sysexits.h: run it again to continue.
+const int checkpoint_exit_code = 75;
+
+// Position of a simulation between two update steps. The checkpoint file
+// stores it together with the state of the network and of the random number
+// generators, such that a resumed simulation continues bit for bit like an
+// uninterrupted one.
+struct Checkpoint
+{
+    int64_t nupdate;         // next update step
+    int64_t outputnumber;    // next entry of outputTimes
+    int64_t outputposition;  // bytes of the output file, -1 for stdout
+};
+
+void write_checkpoint(const std::string& filename, const Checkpoint& checkpoint,
+                      const Config& config, Network& net);
+Checkpoint read_checkpoint(const std::string& filename, const Config& config,
+                           Network& net);
+
+#endif // CHECKPOINT_H
@@ -0,0 +1,67 @@
+#define CATCH_CONFIG_MAIN
+#include "catch.hpp"
+
+#include <cstdio>
+#include <vector>
+
+#include "main.h"
+#include "myrandom.h"
+
+#include "checkpoint.h"
+#include "network.h"
+#include "config.h"
+
+std::vector<std::vector<int64_t> > run_updates(Network& n, int64_t nupdates)
+{
+    std::vector<std::vector<int64_t> > states;
+    for (int64_t i = 0; i < nupdates; ++i) {
+        n.update_state(1.);
+        n.get_internalstate();
+        states.push_back(n.states);
+    }
+    return states;
+}
+
+SCENARIO("Checkpoints") {
+
+    GIVEN("3 Neuron network with noisy membranes") {
+        std::vector<double> biases = {0., 1., -1.};
+        std::vector< std::vector<double> > weights = {
+            {0, 1, 0.5},
+            {1, 0, 0.3},
+            {2, 1, 0.}};
+        std::vector<int64_t> initialstate = {0, 4, 8};
+        Config config = Config(3);
+        YAML::Node node = YAML::Load(
+            "tauref: 5\ntausyn: 5\ndelay: 3\nsynapseType: exp\n"
+            "networkUpdateScheme: BatchRandom\n"
+            "neuronIntegrationType: OU\nneuronUpdate: {theta: 0.1}\n"
+            "output: {outputIndexes: [0, 1, 2]}");
+        config.updateConfig(node);
+        mt_random.seed(config.randomSeed);
+
+        Network n(biases, weights, initialstate, config);
+        run_updates(n, 50);
+        write_checkpoint("checkpoint.tmp", {50, 2, 123}, config, n);
+        std::vector<std::vector<int64_t> > expected = run_updates(n, 50);
+
+        WHEN("Resumed") {
+            mt_random.seed(1);
+            Network resumed(biases, weights, initialstate, config);
+            Checkpoint c = read_checkpoint("checkpoint.tmp", config, resumed);
+            REQUIRE( c.nupdate == 50 );
+            REQUIRE( c.outputnumber == 2 );
+            REQUIRE( c.outputposition == 123 );
+            REQUIRE( run_updates(resumed, 50) == expected );
+        }
+
+        WHEN("Read by another simulation") {
+            Config other = Config(3);
+            other.updateConfig(YAML::Load("randomSeed: 1"));
+            Network resumed(biases, weights, initialstate, other);
+            REQUIRE_THROWS( read_checkpoint("checkpoint.tmp", other,
+                                            resumed) );
+        }
+        std::remove("checkpoint.tmp");
+    }
+}
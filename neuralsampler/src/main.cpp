@@ -1,4 +1,6 @@
 #include <stdio.h>
+#include <unistd.h>
+#include <chrono>
 #include <iostream>
 #include <fstream>
 #include <vector>
@@ -9,6 +11,8 @@
 #include "neuron.h"
 #include "network.h"
 #include "temperature.h"
+#include "binaryio.h"
+#include "checkpoint.h"
 
 
 std::vector<double> get_bias_from_node(YAML::Node biasNode)
@@ -21,25 +25,18 @@ std::vector<double> get_bias_from_node(YAML::Node biasNode)
 }
 
 
-std::vector<std::vector<double>> get_weights_from_node(YAML::Node weightNode, std::size_t biassize)
+SparseMatrix get_weights_from_node(YAML::Node weightNode, std::size_t biassize)
 {
     // read sparse representation of weight matrix in
-    std::vector<std::vector<double>> weights(biassize);
-    for(std::size_t i = 0; i < biassize; ++i) {
-        std::vector<double> weight_line(biassize);
-        for(std::size_t j = 0; j < biassize; ++j) {weight_line[j] = 0.;}
-        weights[i] = weight_line;
-    }
-    // translate in dense matrix
-    int64_t i, j;
-    double w;
+    std::vector<WeightTriple> triples;
+    triples.reserve(weightNode.size());
     for(YAML::const_iterator it=weightNode.begin(); it!=weightNode.end(); it++) {
-        i = (*it)[0].as<int64_t>();
-        j = (*it)[1].as<int64_t>();
-        w = (*it)[2].as<double>();
-        weights[i][j] = w;
+        triples.push_back({(*it)[0].as<int64_t>(),
+                           (*it)[1].as<int64_t>(),
+                           (*it)[2].as<double>()});
     }
-    return weights;
+    // and compress it row wise
+    return SparseMatrix(biassize, triples);
 }
 
 
@@ -79,35 +76,17 @@ int main(int argc, char const *argv[])
     }
     YAML::Node baseNode = YAML::LoadFile(argv[1]);
     YAML::Node configNode = baseNode["Config"];
-    YAML::Node biasNode = baseNode["bias"];
-    if (!biasNode) {
-        YAML::Node biasFileNode = baseNode["biasFile"];
-        if (!biasFileNode) {
-            biasNode = YAML::LoadFile(biasFileNode.as<std::string>());
-        } else {
-            std::cout << "Didn't find either bias or biasFile. Aborting!";
-            throw;
-        }
+    if (!baseNode["bias"] && !baseNode["biasFile"]) {
+        std::cout << "Didn't find either bias or biasFile. Aborting!";
+        throw;
     }
-    YAML::Node weightNode = baseNode["weight"];
-    if (!weightNode) {
-        YAML::Node weightFileNode = baseNode["weightFile"];
-        if (!weightFileNode) {
-            weightNode = YAML::LoadFile(weightFileNode.as<std::string>());
-        } else {
-            std::cout << "Didn't find either weight or weightFile. Aborting!";
-            throw;
-        }
+    if (!baseNode["weight"] && !baseNode["weightFile"]) {
+        std::cout << "Didn't find either weight or weightFile. Aborting!";
+        throw;
     }
-    YAML::Node initialStateNode = baseNode["initialstate"];
-    if (!initialStateNode) {
-        YAML::Node initialStateFileNode = baseNode["initialstateFile"];
-        if (!initialStateNode) {
-            initialStateNode = YAML::LoadFile(initialStateFileNode.as<std::string>());
-        } else {
-            std::cout << "Didn't find either initialstate or initialstateFile. Aborting!";
-            throw;
-        }
+    if (!baseNode["initialstate"] && !baseNode["initialstateFile"]) {
+        std::cout << "Didn't find either initialstate or initialstateFile. Aborting!";
+        throw;
     }
     YAML::Node temperatureNode = baseNode["temperature"];
     if (!temperatureNode) {
@@ -121,14 +100,41 @@ int main(int argc, char const *argv[])
     }
 
     YAML::Node simulationFolderNode = baseNode["outfile"];
-    bool b_output_file = baseNode["outfile"];
+    bool b_output_file = baseNode["outfile"].IsDefined();
 
-    // get network configuration
-    std::vector<double> bias = get_bias_from_node(biasNode);
-    std::vector<std::vector<double>> weights =
-                        get_weights_from_node(weightNode, bias.size());
-    std::vector<int64_t> initialstate =
-                        get_initialstate_from_node(initialStateNode);
+    // optional checkpoints: every interval updates and once the walltime
+    // (seconds) of this run is exceeded, after which it stops, a run finding
+    // the checkpoint file resumes from it
+    YAML::Node checkpointNode = baseNode["checkpoint"];
+    std::string checkpointfile;
+    int64_t checkpointInterval = 0;
+    double checkpointWalltime = 0.;
+    if (checkpointNode) {
+        checkpointfile = checkpointNode["file"].as<std::string>();
+        checkpointInterval = checkpointNode["interval"].as<int64_t>(0);
+        checkpointWalltime = checkpointNode["walltime"].as<double>(0.);
+    }
+    bool resume = !checkpointfile.empty() &&
+                  std::ifstream(checkpointfile).good();
+
+    // get network configuration, binary array files are memory mapped
+    std::vector<double> bias;
+    if (baseNode["bias"]) {
+        bias = get_bias_from_node(baseNode["bias"]);
+    } else {
+        bias = get_bias_from_file(baseNode["biasFile"].as<std::string>());
+    }
+    SparseMatrix weights = baseNode["weight"] ?
+        get_weights_from_node(baseNode["weight"], bias.size()) :
+        get_weights_from_file(baseNode["weightFile"].as<std::string>(),
+                              bias.size());
+    std::vector<int64_t> initialstate;
+    if (baseNode["initialstate"]) {
+        initialstate = get_initialstate_from_node(baseNode["initialstate"]);
+    } else {
+        initialstate = get_initialstate_from_file(
+                    baseNode["initialstateFile"].as<std::string>());
+    }
 
     // get general configuration
     Config config = Config(bias.size());
@@ -150,40 +156,66 @@ int main(int argc, char const *argv[])
         return -1;
     }
 
+    Network net(bias, weights, initialstate, config);
+    Checkpoint checkpoint = {0, 0, -1};
+    if (resume) {
+        checkpoint = read_checkpoint(checkpointfile, config, net);
+    }
+
     std::streambuf *buf;
     std::ofstream of;
     if (b_output_file) {
-        of.open(simulationFolderNode.as<std::string>() ) ;
+        std::string outfile = simulationFolderNode.as<std::string>();
+        if (resume) {
+            // drop what was written after the checkpoint
+            if (checkpoint.outputposition >= 0 &&
+                    truncate(outfile.c_str(), checkpoint.outputposition) != 0) {
+                std::cout << "Could not truncate " << outfile << ". Aborting"
+                    << std::endl;
+                return -1;
+            }
+            of.open(outfile, std::ios::app);
+            of.seekp(0, std::ios::end);
+        } else {
+            of.open(outfile);
+        }
         buf = of.rdbuf();;
     } else {
         buf = std::cout.rdbuf();
     }
     std::ostream output(buf);
-    output << "Outputformat OutputEnv Updatescheme Activationtype Interactiontype: "
-        << config.output.outputScheme
-        << config.output.outputEnv
-        << config.updateScheme
-        << config.neuronActivationType
-        << config.neuronInteractionType
-        << std::endl;
-
-    Network net(bias, weights, initialstate, config);
-
-    // and output initial configuration
-    net.produce_header(output);
-    net.get_state();
     double T, Iext;
-    T = temperature.get_temperature(0);
-    Iext = current.get_temperature(0);
-    net.produce_output(output, T, Iext);
+    if (resume) {
+        // the temperatures advance their breakpoints one update at a time
+        for (int64_t i = 0; i < checkpoint.nupdate; ++i) {
+            temperature.get_temperature(i);
+            current.get_temperature(i);
+        }
+    } else {
+        output << "Outputformat OutputEnv Updatescheme Activationtype Interactiontype: "
+            << config.output.outputScheme
+            << config.output.outputEnv
+            << config.updateScheme
+            << config.neuronActivationType
+            << config.neuronInteractionType
+            << std::endl;
 
-    // seed random number generator and discard for higher entropy
-    mt_random.seed(config.randomSeed);
-    mt_random.discard(config.randomSkip);
+        // and output initial configuration
+        net.produce_header(output);
+        net.get_state();
+        T = temperature.get_temperature(0);
+        Iext = current.get_temperature(0);
+        net.produce_output(output, T, Iext);
+
+        // seed random number generator and discard for higher entropy
+        mt_random.seed(config.randomSeed);
+        mt_random.discard(config.randomSkip);
+    }
 
     // actual simulation
-    int outputNumber = 0;
-    for (int64_t i = 0; i < config.nupdates; ++i)
+    int outputNumber = checkpoint.outputnumber;
+    auto started = std::chrono::steady_clock::now();
+    for (int64_t i = checkpoint.nupdate; i < config.nupdates; ++i)
     {
         T = temperature.get_temperature(i);
         Iext = current.get_temperature(i);
@@ -200,11 +232,31 @@ int main(int argc, char const *argv[])
             output << "Timestep: " << i << "\n\n\n";
             net.produce_summary(output);
         }
+        if (checkpointfile.empty() || i + 1 == config.nupdates) {
+            continue;
+        }
+        bool stop = checkpointWalltime > 0. && (i + 1) % 100 == 0 &&
+            std::chrono::duration<double>(std::chrono::steady_clock::now() -
+                                          started).count() > checkpointWalltime;
+        if (stop || (checkpointInterval > 0 &&
+                     (i + 1) % checkpointInterval == 0)) {
+            output.flush();
+            checkpoint = {i + 1, outputNumber,
+                          b_output_file ? (int64_t)of.tellp() : -1};
+            write_checkpoint(checkpointfile, checkpoint, config, net);
+            if (stop) {
+                of.close();
+                return checkpoint_exit_code;
+            }
+        }
     }
     output << "____End of simulation____\n\n\n";
     net.produce_summary(output);
     output.flush();
     of.close();
+    if (!checkpointfile.empty()) {
+        std::remove(checkpointfile.c_str());
+    }
 
     return 0;
 }
@@ -7,10 +7,11 @@
 #include <algorithm>
 
 #include "network.h"
+#include "serialize.h"
 
 
 Network::Network(const std::vector<double> &_biases,
-                 const std::vector<std::vector<double> > &_weights,
+                 const SparseMatrix &_weights,
                  const std::vector<int64_t> &_initialstate,
                  const Config& config):
     output_scheme(config.output.outputScheme),
@@ -34,31 +35,9 @@ Network::Network(const std::vector<double> &_biases,
     }
     get_state();
 
-    boptimized = generate_connected_neuron_ids();  // TODO: make const
-}
-
-bool Network::generate_connected_neuron_ids()
-{
-    std::size_t n_connections = 0;
-    connected_neuron_ids.resize(biases.size());
-    for (std::size_t i = 0; i < biases.size(); ++i)
-    {
-        for (std::size_t j = 0; j < biases.size(); ++j)
-        {
-            if (fabs(weights[i][j])>1E-14)
-            {
-                connected_neuron_ids[i].push_back(j);
-                n_connections++;
-            }
-        }
-    }
-    // check if network is sparse enough
-    if (n_connections * 1.5 < biases.size() * biases.size())
-    {
-        return true;
-    } else {
-        return false;
-    }
+    // weights are always stored sparse, this only reports whether the
+    // network is sparse enough to benefit from it
+    boptimized = weights.nonzeros() * 1.5 < biases.size() * biases.size();
 }
 
 void Network::produce_header(std::ostream& stream)
@@ -208,18 +187,12 @@ std::vector<int64_t> Network::get_update_inds() {
 double Network::get_potential_for_neuronid(int64_t neuronid) {
     double pot = biases[neuronid];
 
-    if (boptimized)
+    const int64_t* conid = weights.column_ids.data();
+    const double* w = weights.values.data();
+    for (int64_t k = weights.row_offsets[neuronid];
+         k < weights.row_offsets[neuronid + 1]; ++k)
     {
-        for (auto conid = connected_neuron_ids[neuronid].begin();
-             conid != connected_neuron_ids[neuronid].end(); ++conid)
-        {
-            pot += neurons[*conid].get_interaction() * weights[neuronid][*conid];
-        }
-    } else {    // not boptimized
-        for (std::size_t j = 0; j < biases.size(); ++j)
-        {
-            pot += neurons[j].get_interaction() * weights[neuronid][j];
-        }
+        pot += neurons[conid[k]].get_interaction() * w[k];
     }
 
     return pot;
@@ -245,6 +218,36 @@ void Network::update_state(double T, double Iext)
     }
 }
 
+void Network::write_state(std::ostream& stream)
+{
+    write_binary<int64_t>(stream, neurons.size());
+    for (std::size_t i = 0; i < neurons.size(); ++i) {
+        neurons[i].write_state(stream);
+    }
+    write_binary<int64_t>(stream, summary_states.size());
+    for (auto it=summary_states.begin(); it!=summary_states.end(); ++it) {
+        write_binary_vector(stream, it->first);
+        write_binary(stream, it->second);
+    }
+}
+
+void Network::read_state(std::istream& stream)
+{
+    if (read_binary<int64_t>(stream) != (int64_t)neurons.size()) {
+        throw std::runtime_error("Network state has a different size");
+    }
+    for (std::size_t i = 0; i < neurons.size(); ++i) {
+        neurons[i].read_state(stream);
+    }
+    summary_states.clear();
+    int64_t nsummary = read_binary<int64_t>(stream);
+    for (int64_t i = 0; i < nsummary; ++i) {
+        std::vector<int64_t> key = read_binary_vector<int64_t>(stream);
+        summary_states[key] = read_binary<int64_t>(stream);
+    }
+    get_state();
+}
+
 bool Network::_check_consistency()
 {
     return 1;
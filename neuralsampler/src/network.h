@@ -1,6 +1,7 @@
 #ifndef NETWORK_H
 #define NETWORK_H
 
+#include <istream>
 #include <ostream>
 #include <vector>
 #include <random>
@@ -11,6 +12,7 @@ extern std::mt19937_64 mt_random;
 #include "type.h"
 #include "neuron.h"
 #include "config.h"
+#include "sparse_matrix.h"
 
 class Network
 {
@@ -20,19 +22,17 @@ private:
     const std::vector<int64_t> outputIndexes;
 
     const std::vector<double> biases;
-    const std::vector<std::vector<double> > weights;
-    std::vector<std::vector<int64_t> > connected_neuron_ids;
+    const SparseMatrix weights;
     std::vector<Neuron> neurons;
     bool outputEnv;
     bool boptimized;
 
-    bool generate_connected_neuron_ids();
     std::vector<int64_t> get_update_inds();
     double get_potential_for_neuronid(int64_t id);
 
 public:
     Network(const std::vector<double> &_biases,
-            const std::vector<std::vector<double> > &_weights,
+            const SparseMatrix &_weights,
             const std::vector<int64_t> &_initialstate,
             const Config& config);
     ~Network() {};
@@ -49,6 +49,8 @@ public:
     void get_internalstate();
     void update_state(double T);
     void update_state(double T, double Iext);
+    void write_state(std::ostream& stream);
+    void read_state(std::istream& stream);
     bool _check_consistency();
 };
 
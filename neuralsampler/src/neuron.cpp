@@ -3,6 +3,7 @@
 #include <math.h>
 
 #include "neuron.h"
+#include "serialize.h"
 
 
 
@@ -139,6 +140,28 @@ double Neuron::get_interaction()
     return interactions.return_entry();
 }
 
+void Neuron::write_state(std::ostream& stream)
+{
+    write_binary(stream, state);
+    write_binary(stream, nspikes);
+    write_binary(stream, membrane_potential);
+    write_binary<int64_t>(stream, interactions.position);
+    write_binary_vector(stream, interactions.content);
+}
+
+void Neuron::read_state(std::istream& stream)
+{
+    state = read_binary<int64_t>(stream);
+    nspikes = read_binary<int64_t>(stream);
+    membrane_potential = read_binary<double>(stream);
+    interactions.position = read_binary<int64_t>(stream);
+    std::vector<double> content = read_binary_vector<double>(stream);
+    if (content.size() != interactions.content.size()) {
+        throw std::runtime_error("Neuron state has a different delay");
+    }
+    interactions.content = content;
+}
+
 double Neuron::activation(const double pot)
 {
     if (Log==activation_type) {
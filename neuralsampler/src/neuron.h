@@ -2,6 +2,8 @@
 #define NEURON_H
 
 #include <random>
+#include <istream>
+#include <ostream>
 
 #include "type.h"
 #include "fixed_queue.h"
@@ -54,6 +56,9 @@ public:
 
     double get_interaction();
     double activation(const double pot);
+
+    void write_state(std::ostream& stream);
+    void read_state(std::istream& stream);
 };
 
 
@@ -0,0 +1,46 @@
+#ifndef SERIALIZE_H
+#define SERIALIZE_H
+
+#include <istream>
+#include <ostream>
+#include <stdexcept>
+#include <vector>
+
+// Raw binary (native byte order) reading and writing of plain values and
+// vectors of them, as used by the checkpoints of a simulation.
+template <typename T>
+void write_binary(std::ostream& stream, const T& value)
+{
+    stream.write(reinterpret_cast<const char*>(&value), sizeof(T));
+}
+
+template <typename T>
+T read_binary(std::istream& stream)
+{
+    T value;
+    if (!stream.read(reinterpret_cast<char*>(&value), sizeof(T))) {
+        throw std::runtime_error("Unexpected end of binary state");
+    }
+    return value;
+}
+
+template <typename T>
+void write_binary_vector(std::ostream& stream, const std::vector<T>& values)
+{
+    write_binary<int64_t>(stream, values.size());
+    stream.write(reinterpret_cast<const char*>(values.data()),
+                 values.size() * sizeof(T));
+}
+
+template <typename T>
+std::vector<T> read_binary_vector(std::istream& stream)
+{
+    std::vector<T> values(read_binary<int64_t>(stream));
+    if (!stream.read(reinterpret_cast<char*>(values.data()),
+                     values.size() * sizeof(T))) {
+        throw std::runtime_error("Unexpected end of binary state");
+    }
+    return values;
+}
+
+#endif // SERIALIZE_H
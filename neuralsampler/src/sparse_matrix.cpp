@@ -0,0 +1,74 @@
+#include <cmath>
+#include <algorithm>
+#include <stdexcept>
+
+#include "sparse_matrix.h"
+
+
+SparseMatrix::SparseMatrix(std::size_t _size,
+                           std::vector<WeightTriple> triples):
+    size(_size)
+{
+    for (auto it = triples.begin(); it != triples.end(); ++it) {
+        if (it->i < 0 || (std::size_t)it->i >= size ||
+                it->j < 0 || (std::size_t)it->j >= size) {
+            throw std::out_of_range("Weight index out of range");
+        }
+    }
+    // stable, such that later duplicates overwrite earlier ones like in the
+    // dense representation
+    std::stable_sort(triples.begin(), triples.end(),
+        [](const WeightTriple& a, const WeightTriple& b) {
+            return a.i < b.i || (a.i == b.i && a.j < b.j);
+        });
+
+    row_offsets.assign(size + 1, 0);
+    column_ids.reserve(triples.size());
+    values.reserve(triples.size());
+    for (std::size_t n = 0; n < triples.size(); ++n) {
+        if (n + 1 < triples.size() && triples[n + 1].i == triples[n].i &&
+                triples[n + 1].j == triples[n].j) {
+            continue;
+        }
+        if (fabs(triples[n].w) > 1E-14) {
+            column_ids.push_back(triples[n].j);
+            values.push_back(triples[n].w);
+            row_offsets[triples[n].i + 1]++;
+        }
+    }
+    for (std::size_t i = 0; i < size; ++i) {
+        row_offsets[i + 1] += row_offsets[i];
+    }
+}
+
+SparseMatrix::SparseMatrix(const std::vector<std::vector<double> > &dense):
+    size(dense.size())
+{
+    row_offsets.reserve(size + 1);
+    row_offsets.push_back(0);
+    for (std::size_t i = 0; i < size; ++i) {
+        for (std::size_t j = 0; j < dense[i].size(); ++j) {
+            if (fabs(dense[i][j]) > 1E-14) {
+                column_ids.push_back(j);
+                values.push_back(dense[i][j]);
+            }
+        }
+        row_offsets.push_back(column_ids.size());
+    }
+}
+
+std::size_t SparseMatrix::nonzeros() const
+{
+    return values.size();
+}
+
+double SparseMatrix::get(int64_t i, int64_t j) const
+{
+    auto begin = column_ids.begin() + row_offsets[i];
+    auto end = column_ids.begin() + row_offsets[i + 1];
+    auto it = std::lower_bound(begin, end, j);
+    if (it != end && *it == j) {
+        return values[it - column_ids.begin()];
+    }
+    return 0.;
+}
@@ -0,0 +1,33 @@
+#ifndef SPARSE_MATRIX_H
+#define SPARSE_MATRIX_H
+
+#include <vector>
+#include <cstdint>
+
+struct WeightTriple
+{
+    int64_t i;
+    int64_t j;
+    double w;
+};
+
+// Square matrix in compressed sparse row layout: the nonzero entries of row
+// i are values[row_offsets[i]:row_offsets[i+1]] in the columns
+// column_ids[row_offsets[i]:row_offsets[i+1]] (sorted ascending).
+class SparseMatrix
+{
+public:
+    std::size_t size;
+    std::vector<int64_t> row_offsets;
+    std::vector<int64_t> column_ids;
+    std::vector<double> values;
+
+    SparseMatrix(std::size_t _size, std::vector<WeightTriple> triples);
+    SparseMatrix(const std::vector<std::vector<double> > &dense);
+    ~SparseMatrix() {};
+
+    std::size_t nonzeros() const;
+    double get(int64_t i, int64_t j) const;
+};
+
+#endif // SPARSE_MATRIX_H
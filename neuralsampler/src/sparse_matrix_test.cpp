@@ -0,0 +1,47 @@
+#define CATCH_CONFIG_MAIN
+#include "catch.hpp"
+
+#include <stdexcept>
+
+#include "sparse_matrix.h"
+
+SCENARIO("Sparse matrix") {
+
+    GIVEN("Unsorted triples") {
+        std::vector<WeightTriple> triples = {
+            {2, 0, 1.5}, {0, 2, 0.5}, {0, 1, 0.25}, {1, 1, 0.}};
+        SparseMatrix m(3, triples);
+
+        REQUIRE( m.size == 3 );
+        REQUIRE( m.nonzeros() == 3 );
+        REQUIRE( m.row_offsets == std::vector<int64_t>({0, 2, 2, 3}) );
+        REQUIRE( m.column_ids == std::vector<int64_t>({1, 2, 0}) );
+        REQUIRE( m.get(0, 1) == 0.25 );
+        REQUIRE( m.get(0, 2) == 0.5 );
+        REQUIRE( m.get(2, 0) == 1.5 );
+        REQUIRE( m.get(1, 1) == 0. );
+        REQUIRE( m.get(2, 2) == 0. );
+    }
+
+    GIVEN("Duplicate triples") {
+        std::vector<WeightTriple> triples = {{0, 1, 0.25}, {0, 1, 0.75}};
+        SparseMatrix m(2, triples);
+        REQUIRE( m.nonzeros() == 1 );
+        REQUIRE( m.get(0, 1) == 0.75 );
+    }
+
+    GIVEN("Index out of range") {
+        std::vector<WeightTriple> triples = {{0, 2, 0.25}};
+        REQUIRE_THROWS( SparseMatrix(2, triples) );
+    }
+
+    GIVEN("Dense matrix") {
+        std::vector< std::vector<double> > dense = {
+            {0., 1.}, {-2., 0.}};
+        SparseMatrix m(dense);
+        REQUIRE( m.nonzeros() == 2 );
+        REQUIRE( m.row_offsets == std::vector<int64_t>({0, 1, 2}) );
+        REQUIRE( m.get(0, 1) == 1. );
+        REQUIRE( m.get(1, 0) == -2. );
+    }
+}